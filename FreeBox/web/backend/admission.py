@@ -0,0 +1,371 @@
+"""
+FreeBox Admission Module
+Upload admission control: global and per-client slots that adapt to the disk
+"""
+
+import os
+import math
+import time
+import threading
+from collections import deque
+
+from backend.metrics import metrics_sampler
+from backend.offload import run_blocking
+
+# Weight of each new disk throughput measurement in the running average
+RATE_SMOOTHING = 0.3
+
+# Bytes of upload data written to a file between the syncs of a sample
+SYNC_WINDOW_BYTES = 8 * 1024 * 1024
+
+
+class UploadRejected(Exception):
+    """
+    An upload was refused, with the HTTP status and seconds to wait
+    """
+
+    def __init__(self, message, status=429, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class SpaceReservation:
+    """
+    Disk space set aside for upload data that has not been written yet.
+    Writes consume it, and release() returns whatever is left.
+    """
+
+    def __init__(self, scheduler, size):
+        self.scheduler = scheduler
+        self.remaining = size
+
+    def consume(self, size):
+        """
+        Account for size bytes of the reserved data being written
+        """
+        self.scheduler._consume(self, size)
+
+    def release(self):
+        self.scheduler._consume(self, self.remaining)
+
+
+class UploadSlot:
+    """
+    Permission for one request to write upload data, released on exit
+    """
+
+    def __init__(self, scheduler, client, reservation=None):
+        self.scheduler = scheduler
+        self.client = client
+        self.reservation = reservation
+        self.started = None
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.scheduler.release(self)
+            if self.reservation is not None:
+                self.reservation.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class WriteMeter:
+    """
+    Measures how fast one upload file really reaches the disk.
+
+    write() only copies into the page cache, so the disk rate can only
+    be seen by syncing. Uploads are not synced as they go. When the
+    scheduler asks for a sample, the meter syncs the file at the next
+    window boundary to write out what is already cached, then syncs
+    again after SYNC_WINDOW_BYTES more and the scheduler times that
+    second sync.
+    """
+
+    def __init__(self, scheduler, reservation=None):
+        self.scheduler = scheduler
+        self.reservation = reservation
+        self.pending = 0
+        self.sampling = False
+
+    def wrote(self, file, size):
+        """
+        Account for size bytes just written to file
+        """
+        if self.reservation is not None:
+            self.reservation.consume(size)
+
+        self.pending += size
+        if self.pending < SYNC_WINDOW_BYTES:
+            return
+
+        size, self.pending = self.pending, 0
+        if self.sampling:
+            self.sampling = False
+            file.flush()
+            self.scheduler.sync(file.fileno(), size)
+        elif self.scheduler.claim_sample():
+            self.sampling = True
+            file.flush()
+            run_blocking(os.fdatasync, file.fileno())
+
+
+class UploadScheduler:
+    """
+    Caps the number of requests writing upload data at the same time.
+
+    Every request that carries file data needs a slot. There are at most
+    max_concurrent slots, and one client holds at most max_per_client of
+    them. Requests over the limit wait in arrival order for up to
+    queue_timeout seconds, then are rejected with 429 and a Retry-After
+    based on how long slots are usually held.
+
+    The global limit follows the disk: each admitted upload should be able
+    to write at least min_client_rate bytes per second at the measured
+    write throughput, and only one upload runs at a time once free space
+    is down to a few times reserved_bytes. Every upload reserves the space
+    it still has to write, so uploads and chunked sessions in flight are
+    counted before their data reaches the disk. Uploads that would leave
+    less than reserved_bytes free after all reservations are rejected
+    with 507. The rest of the disk bandwidth and space is left for
+    downloads and chat.
+
+    The write throughput is sampled from one upload at a time, at most
+    once every sample_interval seconds, so the syncs that measure it
+    barely slow the uploads down.
+    """
+
+    def __init__(self, max_concurrent=6, max_per_client=2, queue_timeout=10.0,
+                 min_client_rate=1024 * 1024, reserved_bytes=512 * 1024 * 1024, sample_interval=30.0):
+        self.max_concurrent = max_concurrent
+        self.max_per_client = max_per_client
+        self.queue_timeout = queue_timeout
+        self.min_client_rate = min_client_rate
+        self.reserved_bytes = reserved_bytes
+        self.sample_interval = sample_interval
+        self._lock = threading.Lock()
+        self._active = 0
+        self._clients = {}
+        self._waiting = deque()
+        self._committed = 0
+        self._sample_started = None
+        self._last_sample = None
+        self._disk_rate = None
+        self._hold_seconds = None
+        self._admitted = 0
+        self._queued = 0
+        self._rejected = 0
+
+    def init_app(self, app):
+        """
+        Read the limits from the app config
+        """
+        self.max_concurrent = app.config.setdefault('UPLOAD_MAX_CONCURRENT', 6)
+        self.max_per_client = app.config.setdefault('UPLOAD_MAX_PER_CLIENT', 2)
+        self.queue_timeout = app.config.setdefault('UPLOAD_QUEUE_TIMEOUT', 10.0)
+        self.min_client_rate = app.config.setdefault('UPLOAD_MIN_CLIENT_RATE', 1024 * 1024)
+        self.reserved_bytes = app.config.setdefault('UPLOAD_RESERVED_BYTES', 512 * 1024 * 1024)
+        self.sample_interval = app.config.setdefault('UPLOAD_DISK_SAMPLE_INTERVAL', 30.0)
+
+    def limit(self):
+        """
+        Get the current global number of upload slots
+        """
+        limit = self.max_concurrent
+        if self._disk_rate is not None:
+            limit = min(limit, int(self._disk_rate // self.min_client_rate))
+        if self._disk_free() - self._committed < self.reserved_bytes * 4:
+            limit = 1
+        return max(1, limit)
+
+    def admit(self, client, size=0):
+        """
+        Get an upload slot for a client, waiting in line if none is free
+        size is the number of bytes the request will add to the disk, which
+        the slot reserves until it is released.
+        Raises UploadRejected if there is no room for the data or no slot
+        became free in time.
+        """
+        reservation = self.reserve(size) if size else None
+
+        slot = UploadSlot(self, client, reservation)
+        ready = threading.Event()
+        waiter = (slot, ready)
+        with self._lock:
+            self._waiting.append(waiter)
+            self._wake_waiters()
+            if ready.is_set():
+                return slot
+            self._queued += 1
+
+        if ready.wait(self.queue_timeout):
+            return slot
+
+        with self._lock:
+            if ready.is_set():
+                # A slot was handed over just as the wait timed out
+                return slot
+            self._waiting.remove(waiter)
+            self._rejected += 1
+            retry_after = self._retry_after()
+
+        if reservation is not None:
+            reservation.release()
+        raise UploadRejected('Too many uploads in progress, try again later', retry_after=retry_after)
+
+    def reserve(self, size):
+        """
+        Set aside size bytes of disk space for upload data
+        Raises UploadRejected if that would leave too little space once the
+        data of every other upload in flight is written.
+        """
+        free = self._disk_free()
+        with self._lock:
+            if free - self._committed - size < self.reserved_bytes:
+                self._rejected += 1
+                raise UploadRejected('Not enough free space on the FreeBox', status=507)
+            self._committed += size
+        return SpaceReservation(self, size)
+
+    def release(self, slot):
+        """
+        Free a slot and hand it to the first waiting request that can use it
+        """
+        held = time.monotonic() - slot.started
+        with self._lock:
+            self._active -= 1
+            self._clients[slot.client] -= 1
+            if not self._clients[slot.client]:
+                del self._clients[slot.client]
+
+            if self._hold_seconds is None:
+                self._hold_seconds = held
+            else:
+                self._hold_seconds += RATE_SMOOTHING * (held - self._hold_seconds)
+
+            self._wake_waiters()
+
+    def meter(self, reservation=None):
+        """
+        Get a WriteMeter for an upload file, consuming reservation as it goes
+        """
+        return WriteMeter(self, reservation)
+
+    def claim_sample(self):
+        """
+        Whether the calling meter should take the next disk rate sample
+        A sample whose upload ended before it was taken is given up after
+        sample_interval seconds.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._sample_started is not None and now - self._sample_started < self.sample_interval:
+                return False
+            if self._last_sample is not None and now - self._last_sample < self.sample_interval:
+                return False
+            self._sample_started = now
+            return True
+
+    def sync(self, fd, size):
+        """
+        Write size bytes of upload data in fd to the disk and time it
+        """
+        start = time.monotonic()
+        try:
+            # fdatasync() blocks until the device is done, keep it off the hub
+            run_blocking(os.fdatasync, fd)
+        except Exception:
+            with self._lock:
+                self._sample_started = None
+            raise
+
+        now = time.monotonic()
+        rate = size / max(now - start, 1e-6)
+        with self._lock:
+            self._sample_started = None
+            self._last_sample = now
+            if self._disk_rate is None:
+                self._disk_rate = rate
+            else:
+                self._disk_rate += RATE_SMOOTHING * (rate - self._disk_rate)
+
+            # A faster disk may have opened up more slots
+            self._wake_waiters()
+
+    def stats(self):
+        """
+        Get the slot limit and usage, the measured disk rate and counters
+        """
+        limit = self.limit()
+        with self._lock:
+            return {
+                'limit': limit,
+                'per_client_limit': self.max_per_client,
+                'active': self._active,
+                'waiting': len(self._waiting),
+                'committed_bytes': self._committed,
+                'disk_write_rate': self._disk_rate,
+                'admitted': self._admitted,
+                'queued': self._queued,
+                'rejected': self._rejected
+            }
+
+    def _disk_free(self):
+        """
+        Get the free space from the latest metrics sample
+        """
+        return metrics_sampler.latest()['disk_free']
+
+    def _consume(self, reservation, size):
+        """
+        Return up to size bytes of a reservation
+        """
+        with self._lock:
+            size = min(size, reservation.remaining)
+            reservation.remaining -= size
+            self._committed -= size
+
+    def _start(self, slot):
+        """
+        Give a slot to a request
+        Must be called with the lock held.
+        """
+        slot.started = time.monotonic()
+        self._active += 1
+        self._clients[slot.client] = self._clients.get(slot.client, 0) + 1
+        self._admitted += 1
+
+    def _wake_waiters(self):
+        """
+        Start waiting requests in arrival order while slots are free
+        Clients at their own limit are skipped, so they cannot hold up others.
+        Must be called with the lock held.
+        """
+        limit = self.limit()
+        for waiter in list(self._waiting):
+            if self._active >= limit:
+                break
+            slot, ready = waiter
+            if self._clients.get(slot.client, 0) < self.max_per_client:
+                self._waiting.remove(waiter)
+                self._start(slot)
+                ready.set()
+
+    def _retry_after(self):
+        """
+        Estimate the seconds until a slot frees up
+        Must be called with the lock held.
+        """
+        hold_seconds = self._hold_seconds if self._hold_seconds is not None else self.queue_timeout
+        turns = len(self._waiting) // max(1, self.limit()) + 1
+        return max(1, min(300, math.ceil(hold_seconds * turns)))
+
+
+# Shared upload scheduler, bound to the app in create_app()
+upload_scheduler = UploadScheduler()
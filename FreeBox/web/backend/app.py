@@ -4,18 +4,30 @@ Core module that sets up the Flask application
 """
 
 import os
-from flask import Flask, send_from_directory, jsonify, request, make_response
+from flask import Flask, jsonify, request
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from werkzeug.utils import secure_filename
 import uuid
 import mimetypes
 import datetime
-import psutil  # Import psutil for system stats
-import shutil  # Import shutil for disk space information
 
 # Import database module
-from backend.database import init_db, get_all_files, add_chat_message, get_recent_chat_messages, record_visit, get_all_stats
+from backend.database import init_db, chat_writes, FILE_LIST_NAMESPACE, get_all_files, search_files, add_chat_message, get_chat_messages, record_visit, rebuild_aggregates, rebuild_search_index
+from backend.stats import stats_publisher
+from backend.chunked import upload_sessions
+from backend.blobs import blob_store
+from backend.preview import text_previewer
+from backend.thumbnails import thumbnail_cache
+from backend.chat import HISTORY_PAGE_SIZE
+from backend.engine import wal_checkpointer
+from backend.metrics import metrics_sampler
+from backend.admission import upload_scheduler
+from backend.bandwidth import bandwidth_scheduler
+from backend.filechanges import file_changes
+from backend.responsecache import response_cache
+from backend.assets import asset_pipeline
+from backend.compression import response_compressor
 
 # Initialize SocketIO
 socketio = SocketIO()
@@ -25,48 +37,31 @@ connected_users = {
     'main': {}  # room_id -> {sid: username}
 }
 
-def get_cpu_temperature():
+def create_app(data_dir=None, config=None):
     """
-    Get CPU temperature in Celsius
-    Returns None if temperature information is not available
+    Create and configure the Flask application
+    The database and the storage directory are kept in data_dir, which
+    defaults to the web folder. Settings in config are applied before
+    any component reads the app config.
     """
-    try:
-        # Try using psutil's sensors_temperatures()
-        temps = psutil.sensors_temperatures()
-        if not temps:
-            return None
-        
-        # Different systems report CPU temp under different keys
-        # Common keys: 'coretemp', 'k10temp', 'cpu_thermal'
-        for chip_name, sensors in temps.items():
-            if chip_name.lower() in ['coretemp', 'k10temp', 'cpu_thermal', 'cpu-thermal', 'cpu thermal']:
-                # Take the first core or the package temperature
-                if sensors:
-                    return sensors[0].current
-        
-        # If we reach here, we didn't find a recognizable temperature sensor
-        # Try the first available sensor as a fallback
-        for chip_name, sensors in temps.items():
-            if sensors:
-                return sensors[0].current
-                
-        return None
-    except Exception as e:
-        print(f"Error getting CPU temperature: {e}")
-        return None
-
-def create_app():
-    """Create and configure the Flask application"""
+    if data_dir is None:
+        data_dir = os.path.dirname(os.path.dirname(__file__))
+    
     # Create Flask app
     app = Flask(__name__, 
                 static_folder='../frontend', 
                 static_url_path='')
+    if config:
+        app.config.update(config)
     
     # Enable Cross-Origin Resource Sharing
     CORS(app)
     
     # Initialize and configure the database
-    init_db(app)
+    init_db(app, db_path=os.path.join(data_dir, 'freebox.db'))
+    
+    # Gzip text and JSON responses for clients that accept it
+    response_compressor.init_app(app)
     
     # Initialize SocketIO with the app
     socketio.init_app(app, 
@@ -75,12 +70,48 @@ def create_app():
                      logger=True, 
                      engineio_logger=True,
                      ping_timeout=60,
-                     ping_interval=25)
+                     ping_interval=25,
+                     http_compression=True,  # Long-polling payloads, like HTTP responses
+                     compression_threshold=response_compressor.min_size)
+    
+    # Serve and broadcast stats from a shared, throttled snapshot
+    stats_publisher.init_app(app, socketio)
+    
+    # Broadcast file list changes as versioned deltas
+    file_changes.init_app(app, socketio)
+    
+    # Keep encoded responses of hot read endpoints until their data changes
+    response_cache.init_app(app)
+    
+    # Serve the frontend fingerprinted and precompressed from memory
+    asset_pipeline.init_app(app)
     
     # Ensure the storage directory exists
-    storage_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'storage')
+    storage_dir = os.path.join(data_dir, 'storage')
     os.makedirs(storage_dir, exist_ok=True)
     
+    # Keep file data in shared, reference-counted blobs
+    blob_store.init_app(app, storage_dir)
+    
+    # Track resumable chunked uploads and expire abandoned ones
+    upload_sessions.init_app(app, storage_dir)
+    
+    # Page text previews instead of sending whole files
+    text_previewer.init_app(app)
+    
+    # Generate thumbnails for the file list in the background
+    thumbnail_cache.init_app(app, socketio, storage_dir, blob_store)
+    
+    # Sample system metrics in the background for the status endpoints
+    metrics_sampler.init_app(app, storage_dir)
+    
+    # Cap concurrent uploads so they cannot starve downloads and chat
+    upload_scheduler.init_app(app)
+    
+    # Share download bandwidth fairly between clients
+    bandwidth_scheduler.init_app(app)
+    metrics_sampler.add_source('download_bytes_sent', lambda: bandwidth_scheduler.bytes_sent)
+    
     # Add middleware to track visitors
     @app.before_request
     def track_visitor():
@@ -96,13 +127,14 @@ def create_app():
                 
                 # Record visitor for statistics
                 record_visit(request.remote_addr)
+                stats_publisher.mark_dirty()
     
     # Define routes
     @app.route('/')
     def index():
         """Serve the main page"""
         # Set or update visitor cookie
-        response = make_response(send_from_directory(app.static_folder, 'index.html'))
+        response = asset_pipeline.index()
         
         # Check if visitor already has a cookie
         visitor_id = request.cookies.get('freebox_visitor')
@@ -117,74 +149,116 @@ def create_app():
     @app.route('/api/status')
     def status():
         """Return the status of the FreeBox"""
-        # Get CPU and memory usage
-        cpu_percent = psutil.cpu_percent(interval=0.1)
-        memory = psutil.virtual_memory()
-        
-        # Get CPU temperature
-        cpu_temp = get_cpu_temperature()
-        
-        # Calculate used and total disk space where the storage directory is located
-        storage_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'storage')
-        disk_usage = shutil.disk_usage(storage_dir)
+        # Latest CPU, memory, temperature and disk sample
+        system = metrics_sampler.latest()
+        del system['timestamp']
         
         return jsonify({
             'status': 'online',
             'name': 'FreeBox',
             'mode': 'hotspot',
             'timestamp': datetime.datetime.now().timestamp(),
-            'system': {
-                'cpu_percent': cpu_percent,
-                'cpu_temperature': cpu_temp,
-                'memory_percent': memory.percent,
-                'memory_used': memory.used,
-                'memory_total': memory.total,
-                'disk_free': disk_usage.free,
-                'disk_total': disk_usage.total,
-                'disk_used': disk_usage.used
-            }
+            'system': system
+        })
+    
+    @app.route('/api/metrics/history')
+    def metrics_history():
+        """Return the recent system metrics samples, oldest first"""
+        since = request.args.get('since', type=float)
+        limit = request.args.get('limit', type=int)
+        
+        return jsonify({
+            'interval': metrics_sampler.interval,
+            'samples': metrics_sampler.history(since, limit)
         })
     
     @app.route('/api/stats')
     def stats():
         """Return statistics about the FreeBox"""
-        stats_data = get_all_stats()
-        
-        # Add system stats
-        cpu_percent = psutil.cpu_percent(interval=0.1)
-        memory = psutil.virtual_memory()
-        
-        # Get CPU temperature
-        cpu_temp = get_cpu_temperature()
-        
-        # Calculate used and total disk space where the storage directory is located
-        storage_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'storage')
-        disk_usage = shutil.disk_usage(storage_dir)
-        
-        stats_data['system'] = {
-            'cpu_percent': cpu_percent,
-            'cpu_temperature': cpu_temp,
-            'memory_percent': memory.percent,
-            'memory_used': memory.used,
-            'memory_total': memory.total,
-            'disk_free': disk_usage.free,
-            'disk_total': disk_usage.total,
-            'disk_used': disk_usage.used
-        }
-        
-        # Broadcast stats to all connected clients
-        socketio.emit('stats_updated', stats_data)
+        def build():
+            stats_data = stats_publisher.get_snapshot()
+            
+            # Chat messages waiting for the next group commit
+            stats_data['chat_write_queue'] = chat_writes.stats()
+            
+            # WAL size and the last background checkpoint
+            stats_data['database'] = wal_checkpointer.stats()
+            
+            # Download bandwidth limits and usage
+            stats_data['downloads'] = bandwidth_scheduler.stats()
+            
+            # Cached responses and their hit rate
+            stats_data['response_cache'] = response_cache.stats()
+            
+            # Add the latest system sample
+            stats_data['system'] = metrics_sampler.latest()
+            del stats_data['system']['timestamp']
+            
+            return stats_data
         
-        return jsonify(stats_data)
+        # Most of the stats change without a write, so they are only
+        # reused for as long as the stats broadcast is throttled
+        return response_cache.respond('stats', build, max_age=stats_publisher.interval)
     
     @app.route('/api/files')
     def list_files():
-        """List all files in the database"""
-        limit = request.args.get('limit', 100, type=int)
-        offset = request.args.get('offset', 0, type=int)
+        """List one page of files, optionally filtered by MIME type prefix"""
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+        sort = request.args.get('sort', 'created_at')
+        order = request.args.get('order', 'desc')
+        mime_prefix = request.args.get('mime') or None
+        cursor = request.args.get('cursor') or None
+        
+        def build():
+            # Changes after this version may or may not be in the page
+            version = file_changes.version()
+            
+            try:
+                files, next_cursor = get_all_files(limit, sort, order, mime_prefix, cursor)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            return {
+                'files': [file.to_dict() for file in files],
+                'next_cursor': next_cursor,
+                'version': version
+            }
+        
+        return response_cache.respond(FILE_LIST_NAMESPACE, build)
+    
+    @app.route('/api/files/changes')
+    def file_list_changes():
+        """List the file list changes after a version, oldest first"""
+        since = request.args.get('since', type=int)
+        if since is None:
+            return jsonify({'error': 'No version provided'}), 400
+        
+        changes = file_changes.since(since)
+        if changes is None:
+            # Too old to catch up from, the client reloads the list instead
+            return jsonify({'error': 'Version is no longer available'}), 410
+        
+        return jsonify({
+            'changes': changes,
+            'version': changes[-1]['version'] if changes else since
+        })
+    
+    @app.route('/api/files/search')
+    def search_files_route():
+        """Search file names and descriptions, best matches first"""
+        text = request.args.get('q', '')
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+        cursor = request.args.get('cursor') or None
+        
+        try:
+            files, next_cursor = search_files(text, limit, cursor)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        files = get_all_files(limit, offset)
-        return jsonify([file.to_dict() for file in files])
+        return jsonify({
+            'files': [file.to_dict() for file in files],
+            'next_cursor': next_cursor
+        })
     
     # Register additional routes from other modules
     from backend.routes import uploads_bp
@@ -194,6 +268,28 @@ def create_app():
     from backend.chat import chat_bp
     app.register_blueprint(chat_bp)
     
+    # Maintenance command: flask --app backend.app:create_app rebuild-aggregates
+    @app.cli.command('rebuild-aggregates')
+    def rebuild_aggregates_command():
+        """Recompute the materialized stats aggregates from the database"""
+        values = rebuild_aggregates()
+        for name, value in values.items():
+            print(f"{name}: {value}")
+    
+    # Maintenance command: flask --app backend.app:create_app rebuild-search
+    @app.cli.command('rebuild-search')
+    def rebuild_search_command():
+        """Re-index every file for full-text search"""
+        count = rebuild_search_index()
+        print(f"Indexed {count} files")
+    
+    # Maintenance command: flask --app backend.app:create_app gc-blobs
+    @app.cli.command('gc-blobs')
+    def gc_blobs_command():
+        """Recompute blob reference counts and remove unreferenced blobs"""
+        removed = blob_store.repair()
+        print(f"Removed {removed} unreferenced blobs")
+    
     # Setup SocketIO event handlers
     setup_socketio_events()
     
@@ -209,7 +305,7 @@ def setup_socketio_events():
         print(f"Client connected with SID: {sid}")
         
         # Emit current stats to the newly connected client
-        socketio.emit('stats_updated', get_all_stats(), room=sid)
+        socketio.emit('stats_updated', stats_publisher.get_snapshot(), room=sid)
     
     @socketio.on('disconnect')
     def handle_disconnect():
@@ -242,7 +338,7 @@ def setup_socketio_events():
             print(f"Disconnected client {sid} was not found in any room")
             
         # Update stats for all clients
-        socketio.emit('stats_updated', get_all_stats())
+        stats_publisher.schedule_broadcast()
     
     @socketio.on('join')
     def handle_join(data):
@@ -272,10 +368,10 @@ def setup_socketio_events():
             'message': f"{username} has joined the room."
         }, room=room, include_self=False)
         
-        # Send recent messages to the user
-        messages = get_recent_chat_messages(room)
+        # Send only the latest page, older history is loaded on demand
+        messages = get_chat_messages(room, HISTORY_PAGE_SIZE)
         print(f"Sending {len(messages)} recent messages to user {username}")
-        socketio.emit('chat_history', [message.to_dict() for message in messages], room=sid)
+        socketio.emit('chat_history', messages, room=sid)
         
         # Send current user count to all users in the room
         user_count = len(connected_users[room])
@@ -283,7 +379,7 @@ def setup_socketio_events():
         socketio.emit('user_count', {'count': user_count}, room=room)
         
         # Update stats for all clients
-        socketio.emit('stats_updated', get_all_stats())
+        stats_publisher.schedule_broadcast()
     
     @socketio.on('leave')
     def handle_leave(data):
@@ -310,7 +406,7 @@ def setup_socketio_events():
             emit('user_count', {'count': len(connected_users[room])}, room=room)
             
         # Update stats for all clients
-        socketio.emit('stats_updated', get_all_stats())
+        stats_publisher.schedule_broadcast()
     
     @socketio.on('chat_message')
     def handle_chat_message(data):
@@ -326,7 +422,7 @@ def setup_socketio_events():
         print(f"Received message from {username} in room {room}: {message[:20]}...")
         print(f"Current users in room {room}: {connected_users.get(room, {})}")
         
-        # Store the message in the database
+        # Queue the message for the database, it gets its id straight away
         chat_msg = add_chat_message(
             username=username,
             message=message,
@@ -334,24 +430,24 @@ def setup_socketio_events():
             user_ip=request.remote_addr
         )
         
-        # Broadcast the message to everyone in the room
-        socketio.emit('chat_message', chat_msg.to_dict(), room=room)
+        # Broadcast the message to everyone in the room without waiting for the write
+        socketio.emit('chat_message', chat_msg, room=room)
         
         # Log the broadcast
         print(f"Broadcasted message to room {room}")
         
         # Update stats for all clients
-        socketio.emit('stats_updated', get_all_stats())
+        stats_publisher.mark_dirty()
     
     @socketio.on('file_uploaded')
     def handle_file_uploaded(data):
         """Handle notification that a file was uploaded"""
-        emit('file_list_updated', {}, to=None)
+        # The upload itself already sent file_added to every client
         
         # Update stats for all clients
-        socketio.emit('stats_updated', get_all_stats())
+        stats_publisher.schedule_broadcast()
     
     @socketio.on('request_stats_update')
     def handle_stats_request():
         """Handle client request for updated stats"""
-        socketio.emit('stats_updated', get_all_stats(), room=request.sid) 
\ No newline at end of file
+        socketio.emit('stats_updated', stats_publisher.get_snapshot(), room=request.sid)
\ No newline at end of file
@@ -0,0 +1,154 @@
+"""
+FreeBox Assets Module
+Fingerprinted, precompressed frontend files held in memory
+"""
+
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+
+from flask import request, Response, abort
+
+# URL prefix of fingerprinted assets, skipped by visitor tracking
+ASSET_URL_PREFIX = '/static/'
+
+# Content types worth compressing besides text/*
+COMPRESSIBLE_TYPES = {'application/javascript', 'application/json', 'image/svg+xml'}
+
+# Local src and href attributes in index.html
+ASSET_REFERENCE = re.compile(r'(\b(?:src|href)=")([^"#?:]+)(")')
+
+
+def accepts_gzip():
+    """
+    Whether the client accepts a gzip encoded response
+    """
+    return request.accept_encodings['gzip'] > 0
+
+
+class Asset:
+    """
+    One frontend file, its gzip encoding and their validators
+    """
+
+    def __init__(self, data, mimetype, compress_level, min_size):
+        self.data = data
+        self.mimetype = mimetype
+        self.etag = hashlib.blake2b(data, digest_size=16).hexdigest()
+        self.gzip_data = None
+
+        compressible = mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+        if compressible and len(data) >= min_size:
+            # mtime=0 keeps the encoding identical across restarts
+            compressed = gzip.compress(data, compresslevel=compress_level, mtime=0)
+            if len(compressed) < len(data):
+                self.gzip_data = compressed
+
+    def response(self, cache_control):
+        """
+        Build a conditional response, gzip encoded if the client accepts it
+        """
+        if self.gzip_data is not None and accepts_gzip():
+            response = Response(self.gzip_data, mimetype=self.mimetype)
+            response.headers['Content-Encoding'] = 'gzip'
+            response.set_etag(self.etag + '-gzip')
+        else:
+            response = Response(self.data, mimetype=self.mimetype)
+            response.set_etag(self.etag)
+
+        if self.gzip_data is not None:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = cache_control
+        return response.make_conditional(request)
+
+
+class AssetPipeline:
+    """
+    Loads the frontend once at startup and serves it from memory.
+
+    Every file except index.html is fingerprinted with a hash of its
+    content and served under /static/ with a one year immutable
+    Cache-Control, so browsers never ask for it again until it changes.
+    References to those files in index.html are rewritten to the
+    fingerprinted URLs, and index.html itself is revalidated on every
+    visit with its ETag. Text files are gzip compressed once, at the
+    highest level, and sent compressed to clients that accept it.
+
+    Files added to the frontend folder after startup are still served
+    unfingerprinted by Flask's static route.
+    """
+
+    def __init__(self, compress_level=9, min_size=1024, max_age=365 * 24 * 3600):
+        self.compress_level = compress_level
+        self.min_size = min_size
+        self.max_age = max_age
+        self._assets = {}
+        self._index = None
+
+    def init_app(self, app):
+        """
+        Load, fingerprint and compress the app's static folder
+        """
+        self.compress_level = app.config.setdefault('STATIC_GZIP_LEVEL', 9)
+        self.min_size = app.config.setdefault('STATIC_GZIP_MIN_SIZE', 1024)
+        self.max_age = app.config.setdefault('STATIC_MAX_AGE', 365 * 24 * 3600)
+
+        assets = {}
+        urls = {}
+        for root, _, filenames in os.walk(app.static_folder):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, app.static_folder).replace(os.sep, '/')
+                if name == 'index.html':
+                    continue
+
+                with open(path, 'rb') as f:
+                    asset = Asset(f.read(), self._mimetype(name), self.compress_level, self.min_size)
+
+                stem, extension = os.path.splitext(name)
+                fingerprinted = f'{stem}.{asset.etag[:12]}{extension}'
+                assets[fingerprinted] = asset
+                urls[name] = ASSET_URL_PREFIX + fingerprinted
+
+        with open(os.path.join(app.static_folder, 'index.html'), encoding='utf-8') as f:
+            html = f.read()
+
+        def rewrite(match):
+            url = urls.get(match.group(2).lstrip('/'), match.group(2))
+            return match.group(1) + url + match.group(3)
+
+        html = ASSET_REFERENCE.sub(rewrite, html)
+
+        self._assets = assets
+        self._index = Asset(html.encode('utf-8'), 'text/html', self.compress_level, self.min_size)
+
+        app.add_url_rule(ASSET_URL_PREFIX + '<path:filename>', 'asset', self.serve)
+
+    def index(self):
+        """
+        Build the response for the main page
+        """
+        return self._index.response('no-cache')
+
+    def serve(self, filename):
+        """
+        View serving a fingerprinted asset
+        """
+        asset = self._assets.get(filename)
+        if asset is None:
+            abort(404)
+        return asset.response(f'public, max-age={self.max_age}, immutable')
+
+    @staticmethod
+    def _mimetype(name):
+        mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        # Some systems map .js to the obsolete text/javascript
+        if name.endswith('.js'):
+            mimetype = 'application/javascript'
+        return mimetype
+
+
+# Shared asset pipeline, bound to the app in create_app()
+asset_pipeline = AssetPipeline()
@@ -0,0 +1,236 @@
+"""
+FreeBox Bandwidth Module
+Fair sharing of download bandwidth between clients and streams
+"""
+
+import time
+import heapq
+import itertools
+import threading
+
+# Weight of each new throughput measurement in the running average
+RATE_SMOOTHING = 0.2
+
+
+class TokenBucket:
+    """
+    Rate limiter that lets callers borrow against future tokens.
+    take() returns how long to wait before sending, so callers never spin.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, amount):
+        """
+        Spend amount tokens and return the seconds until they are covered
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        return max(0.0, -self.tokens / self.rate)
+
+
+class DownloadStream:
+    """
+    One response body being sent to a client.
+    Call open() before the first byte and close() after the last one.
+    """
+
+    def __init__(self, scheduler, client, weight, priority):
+        self.scheduler = scheduler
+        self.client = client
+        self.weight = weight
+        self.priority = priority
+        self._open = False
+
+    def open(self):
+        if not self._open:
+            self._open = True
+            self.scheduler._register(self)
+
+    def acquire(self, size):
+        """
+        Wait for this stream's turn and return how many bytes it may send
+        """
+        return self.scheduler._acquire(self, size)
+
+    def close(self):
+        if self._open:
+            self._open = False
+            self.scheduler._unregister(self)
+
+
+class BandwidthScheduler:
+    """
+    Shares download bandwidth fairly between clients and their streams.
+
+    Streams ask for a quantum of bytes before each send. Under a global
+    rate limit, requests are granted in weighted fair queuing order, in
+    its start-time form, with each client as one flow. A request starts
+    at the client's last finish tag, or at the virtual time if that is
+    later, and finishes its size divided by the stream's weight after
+    that. The earliest start is granted first as tokens become available,
+    and the virtual time moves to the start of the last grant, so a
+    client that pauses briefly between sends keeps its place. All streams
+    of a client share one flow, so more downloads do not get it more.
+    Small files and previews get priority_weight times the share of bulk
+    transfers, so pages and media stay responsive during big downloads.
+
+    A per-client rate limit caps every client on top of that. With both
+    limits at zero, the default, downloads are only counted and send in
+    chunks as large as they ask for.
+    """
+
+    def __init__(self, rate_limit=0, client_rate_limit=0, quantum=64 * 1024,
+                 small_file_size=1024 * 1024, priority_weight=8):
+        self.rate_limit = rate_limit
+        self.client_rate_limit = client_rate_limit
+        self.quantum = quantum
+        self.small_file_size = small_file_size
+        self.priority_weight = priority_weight
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._streams = {}
+        self._client_tags = {}
+        self._client_buckets = {}
+        self._bucket = None
+        self._thread = None
+        self.bytes_sent = 0
+        self.priority_bytes_sent = 0
+        self._rate = 0.0
+        self._rate_bytes = 0
+        self._rate_updated = time.monotonic()
+
+    def init_app(self, app):
+        """
+        Read the limits from the app config and start the dispatcher
+        """
+        self.rate_limit = app.config.setdefault('DOWNLOAD_RATE_LIMIT', 0)
+        self.client_rate_limit = app.config.setdefault('DOWNLOAD_CLIENT_RATE_LIMIT', 0)
+        self.quantum = app.config.setdefault('DOWNLOAD_QUANTUM', 64 * 1024)
+        self.small_file_size = app.config.setdefault('DOWNLOAD_SMALL_FILE_SIZE', 1024 * 1024)
+        self.priority_weight = app.config.setdefault('DOWNLOAD_PRIORITY_WEIGHT', 8)
+
+        if self.rate_limit:
+            # Allow a short burst so an idle link starts at full speed
+            self._bucket = TokenBucket(self.rate_limit, max(self.quantum, self.rate_limit // 10))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='download-scheduler', daemon=True)
+                self._thread.start()
+
+    def stream(self, client, size, preview=False):
+        """
+        Create a stream for a response of size bytes to a client
+        """
+        priority = preview or size <= self.small_file_size
+        return DownloadStream(self, client, self.priority_weight if priority else 1, priority)
+
+    def stats(self):
+        """
+        Get the limits, the active streams and clients and the bytes sent
+        """
+        with self._lock:
+            self._update_rate(0)
+            return {
+                'rate_limit': self.rate_limit,
+                'client_rate_limit': self.client_rate_limit,
+                'streams': sum(len(streams) for streams in self._streams.values()),
+                'clients': len(self._streams),
+                'queued': len(self._queue),
+                'bytes_sent': self.bytes_sent,
+                'priority_bytes_sent': self.priority_bytes_sent,
+                'bytes_per_second': round(self._rate)
+            }
+
+    def _register(self, stream):
+        with self._lock:
+            self._streams.setdefault(stream.client, []).append(stream)
+
+    def _unregister(self, stream):
+        with self._lock:
+            streams = self._streams.get(stream.client, [])
+            if stream in streams:
+                streams.remove(stream)
+            if not streams:
+                self._streams.pop(stream.client, None)
+                self._client_tags.pop(stream.client, None)
+                self._client_buckets.pop(stream.client, None)
+
+    def _acquire(self, stream, size):
+        """
+        Wait until the stream may send and return the granted byte count
+        """
+        if self.rate_limit or self.client_rate_limit:
+            size = max(1, min(size, self.quantum))
+
+        if self.client_rate_limit:
+            with self._lock:
+                bucket = self._client_buckets.get(stream.client)
+                if bucket is None:
+                    bucket = TokenBucket(self.client_rate_limit, max(self.quantum, self.client_rate_limit // 10))
+                    self._client_buckets[stream.client] = bucket
+                delay = bucket.take(size)
+            if delay:
+                time.sleep(delay)
+
+        if self._bucket is not None:
+            granted = threading.Event()
+            with self._lock:
+                # Idle clients start at the virtual time instead of saving up credit
+                start_tag = max(self._virtual_time, self._client_tags.get(stream.client, 0.0))
+                self._client_tags[stream.client] = start_tag + size / stream.weight
+                heapq.heappush(self._queue, (start_tag, next(self._sequence), size, granted))
+            self._wake.set()
+            granted.wait()
+
+        with self._lock:
+            self.bytes_sent += size
+            if stream.priority:
+                self.priority_bytes_sent += size
+            self._update_rate(size)
+        return size
+
+    def _update_rate(self, size):
+        """
+        Fold sent bytes into the throughput average
+        Must be called with the lock held.
+        """
+        self._rate_bytes += size
+        now = time.monotonic()
+        elapsed = now - self._rate_updated
+        if elapsed >= 1.0:
+            rate = self._rate_bytes / elapsed
+            self._rate += RATE_SMOOTHING * (rate - self._rate)
+            self._rate_bytes = 0
+            self._rate_updated = now
+
+    def _run(self):
+        """
+        Dispatcher loop: grant queued requests in start tag order
+        """
+        while True:
+            self._wake.wait()
+            with self._lock:
+                if not self._queue:
+                    self._wake.clear()
+                    continue
+                start_tag, _, size, granted = heapq.heappop(self._queue)
+                self._virtual_time = max(self._virtual_time, start_tag)
+
+            # Requests are granted in order, so only this one waits for tokens
+            delay = self._bucket.take(size)
+            if delay:
+                time.sleep(delay)
+            granted.set()
+
+
+# Shared bandwidth scheduler, bound to the app in create_app()
+bandwidth_scheduler = BandwidthScheduler()
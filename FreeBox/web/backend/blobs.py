@@ -0,0 +1,212 @@
+"""
+FreeBox Blobs Module
+Content-addressable storage for file data shared between file records
+"""
+
+import os
+import hashlib
+import threading
+
+from backend.periodic import PeriodicWorker
+from backend.database import (
+    db, File, add_file, add_blob, get_blob_by_hash, get_unreferenced_blobs,
+    rebuild_blob_refs
+)
+
+# Directory inside storage that holds the blobs
+BLOBS_DIR = 'blobs'
+
+
+class BlobStore(PeriodicWorker):
+    """
+    Stores each distinct file content once, under its SHA-256 hash.
+
+    File records reference a blob and raise its ref count, so duplicate
+    uploads keep their own name and description without another copy on
+    disk, and deleting a file only touches the database. A background
+    thread garbage collects blobs that are no longer referenced.
+
+    Blobs are created, linked and collected under one lock so a blob is
+    never removed while a new file is being attached to it.
+    """
+
+    def __init__(self, gc_interval=300.0):
+        super().__init__(gc_interval)
+        self.storage_dir = None
+        self._app = None
+        self._lock = threading.Lock()
+        self._collect_listeners = []
+
+    def init_app(self, app, storage_dir):
+        """
+        Migrate existing storage into blobs and start the collector thread
+        """
+        self._app = app
+        self.storage_dir = storage_dir
+        self.interval = app.config.setdefault('BLOB_GC_INTERVAL', 300.0)
+
+        with app.app_context():
+            self.migrate()
+            self.collect()
+
+        self.start('blob-gc')
+
+    def add_collect_listener(self, listener):
+        """
+        Call listener(file_hash) whenever a blob is collected
+        Lets caches derived from the content evict their entries
+        """
+        self._collect_listeners.append(listener)
+
+    def path_for_hash(self, file_hash):
+        """
+        Get the path of the blob with the given hash
+        Blobs are fanned out by the first two hash characters
+        """
+        return os.path.join(self.storage_dir, BLOBS_DIR, file_hash[:2], file_hash)
+
+    def path_for(self, file_record):
+        """
+        Get the path of the data for a file record
+        Files that could not be migrated still point at their old location
+        """
+        if file_record.blob is not None:
+            return self.path_for_hash(file_record.blob.file_hash)
+        return os.path.join(self.storage_dir, file_record.filename)
+
+    def store(self, temp_file_path, file_hash, size, **file_fields):
+        """
+        Add a file whose data is in temp_file_path
+        The data becomes a new blob unless one with the same hash exists,
+        in which case the temporary file is removed.
+        Returns the new file record and whether its data was a duplicate.
+        """
+        with self._lock:
+            blob = get_blob_by_hash(file_hash)
+            duplicate = blob is not None
+
+            if duplicate:
+                os.remove(temp_file_path)
+            else:
+                self._ingest(temp_file_path, file_hash)
+                blob = add_blob(file_hash, size)
+
+            # A failure here leaves an unreferenced blob for the collector
+            file_record = add_file(file_hash=file_hash, size=size, blob=blob, **file_fields)
+
+        return file_record, duplicate
+
+    def link(self, file_hash, size, **file_fields):
+        """
+        Add a file whose data is already stored, without receiving it again
+        Returns the new file record, or None if there is no matching blob
+        """
+        with self._lock:
+            blob = get_blob_by_hash(file_hash)
+            if blob is None or blob.size != size or not os.path.exists(self.path_for_hash(file_hash)):
+                return None
+
+            return add_file(file_hash=file_hash, size=size, blob=blob, **file_fields)
+
+    def collect(self):
+        """
+        Remove blobs that are no longer referenced by any file
+        """
+        with self._lock:
+            blobs = get_unreferenced_blobs()
+            for blob in blobs:
+                try:
+                    os.remove(self.path_for_hash(blob.file_hash))
+                except FileNotFoundError:
+                    pass
+                db.session.delete(blob)
+            db.session.commit()
+
+        for blob in blobs:
+            for listener in self._collect_listeners:
+                try:
+                    listener(blob.file_hash)
+                except Exception as e:
+                    print(f"Error evicting data for blob {blob.file_hash}: {e}")
+
+        return len(blobs)
+
+    def repair(self):
+        """
+        Recompute ref counts from the file records, then collect orphans
+        """
+        with self._lock:
+            rebuild_blob_refs()
+        return self.collect()
+
+    def migrate(self):
+        """
+        Move files stored under their own name into the blob store
+        Duplicate copies are removed and their records share one blob.
+        Records whose data is missing are left without a blob.
+        """
+        files = File.query.filter(File.blob_id.is_(None)).all()
+        migrated = 0
+
+        for file_record in files:
+            path = os.path.join(self.storage_dir, file_record.filename)
+            if not os.path.isfile(path):
+                print(f"Cannot migrate {file_record.filename}: file is missing")
+                continue
+
+            file_hash = file_record.file_hash or self._hash_file(path)
+            size = os.path.getsize(path)
+
+            with self._lock:
+                blob = get_blob_by_hash(file_hash)
+                if blob is None:
+                    self._ingest(path, file_hash)
+                    blob = add_blob(file_hash, size)
+                else:
+                    os.remove(path)
+
+                file_record.file_hash = file_hash
+                file_record.blob = blob
+                blob.ref_count += 1
+                db.session.commit()
+
+            migrated += 1
+
+        if migrated:
+            print(f"Migrated {migrated} files into the blob store")
+
+        return migrated
+
+    def _ingest(self, path, file_hash):
+        """
+        Move a file into the blob store under its hash
+        """
+        blob_path = self.path_for_hash(file_hash)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        # Same file system as the rest of storage, so no data is copied
+        os.replace(path, blob_path)
+
+    @staticmethod
+    def _hash_file(path):
+        """
+        Calculate the SHA-256 hash of a file
+        """
+        hash_sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hash_sha256.update(chunk)
+        return hash_sha256.hexdigest()
+
+    def tick(self):
+        """
+        Collect unreferenced blobs, run every interval
+        """
+        try:
+            with self._app.app_context():
+                self.collect()
+        except Exception as e:
+            print(f"Error collecting unreferenced blobs: {e}")
+
+
+# Shared blob store instance, bound to the app in create_app()
+blob_store = BlobStore()
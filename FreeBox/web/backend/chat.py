@@ -4,19 +4,33 @@ Handles the chat functionality for FreeBox
 """
 
 from flask import Blueprint, request, jsonify
-from backend.database import add_chat_message, get_recent_chat_messages
+from backend.database import add_chat_message, get_chat_messages, chat_room_namespace
+from backend.responsecache import response_cache
 
 # Create a blueprint for chat-related routes
 chat_bp = Blueprint('chat', __name__)
 
+# Messages sent on join and per history page by default
+HISTORY_PAGE_SIZE = 50
+
+# Largest page of chat history a client can ask for
+MAX_HISTORY_PAGE_SIZE = 200
+
 @chat_bp.route('/api/chat/messages', methods=['GET'])
 def get_messages():
-    """Get recent chat messages"""
+    """Get a page of chat messages, oldest first"""
     room = request.args.get('room', 'main')
-    limit = request.args.get('limit', 50, type=int)
+    limit = min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), MAX_HISTORY_PAGE_SIZE)
+    before = request.args.get('before', type=int)
+    after = request.args.get('after', type=int)
     
-    messages = get_recent_chat_messages(room, limit)
-    return jsonify([message.to_dict() for message in messages])
+    if before is not None and after is not None:
+        return jsonify({'error': 'Use either before or after, not both'}), 400
+    
+    return response_cache.respond(
+        chat_room_namespace(room),
+        lambda: get_chat_messages(room, limit, before=before, after=after)
+    )
 
 @chat_bp.route('/api/chat/messages', methods=['POST'])
 def post_message():
@@ -33,7 +47,7 @@ def post_message():
     if not message.strip():
         return jsonify({'success': False, 'error': 'Message cannot be empty'}), 400
     
-    # Add message to database
+    # Add message, it is written to the database in the background
     chat_message = add_chat_message(
         username=username,
         message=message,
@@ -46,7 +60,7 @@ def post_message():
     
     return jsonify({
         'success': True,
-        'message': chat_message.to_dict()
+        'message': chat_message
     })
 
 @chat_bp.route('/api/chat/rooms', methods=['GET'])
@@ -0,0 +1,324 @@
+"""
+FreeBox Chunked Uploads Module
+Resumable upload sessions that receive a file as independent chunks
+"""
+
+import os
+import glob
+import time
+import uuid
+import hashlib
+import threading
+
+from backend.admission import upload_scheduler
+from backend.offload import run_blocking
+from backend.periodic import PeriodicWorker
+
+# Prefix of the files that chunks are assembled into
+PART_FILE_PREFIX = 'upload_'
+PART_FILE_SUFFIX = '.part'
+
+
+class UploadSession:
+    """
+    State of one chunked upload.
+
+    Chunks are written at their offset into a preallocated part file, so
+    they can arrive in any order and several can be in flight at once.
+    Received data is tracked as a sorted list of merged [start, end) ranges.
+    """
+
+    def __init__(self, upload_id, path, size, filename, description='', expected_hash=None, reservation=None):
+        self.id = upload_id
+        self.path = path
+        self.size = size
+        self.filename = filename
+        self.description = description
+        # Hash declared by the client, checked against the received data
+        self.expected_hash = expected_hash
+        self.ranges = []
+        self.last_activity = time.monotonic()
+        self.finalizing = False
+        # Hash of the first hashed bytes, extended whenever the received
+        # prefix grows. Held by whichever request is extending it.
+        self.hasher = hashlib.sha256()
+        self.hashed = 0
+        self.hash_lock = threading.Lock()
+        # Disk space held for data not yet received, released on discard
+        self.reservation = reservation
+        # Times syncs of the data, covering every chunk of the session
+        self.meter = upload_scheduler.meter(reservation)
+
+    @property
+    def received(self):
+        """Number of bytes received so far"""
+        return sum(end - start for start, end in self.ranges)
+
+    @property
+    def contiguous(self):
+        """Number of bytes received without a gap from the start of the file"""
+        ranges = self.ranges
+        return ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+
+    @property
+    def complete(self):
+        """Whether every byte of the file has been received"""
+        return self.size == 0 or self.ranges == [[0, self.size]]
+
+    def add_range(self, start, end):
+        """Record [start, end) as received, merging it with adjacent ranges"""
+        if start >= end:
+            return
+        merged = []
+        for range_start, range_end in self.ranges:
+            if range_end < start or range_start > end:
+                merged.append([range_start, range_end])
+            else:
+                start = min(start, range_start)
+                end = max(end, range_end)
+        merged.append([start, end])
+        merged.sort()
+        self.ranges = merged
+
+    def to_dict(self):
+        """
+        Convert session state to dictionary for API responses
+        """
+        return {
+            'upload_id': self.id,
+            'filename': self.filename,
+            'size': self.size,
+            'received': self.received,
+            'ranges': [list(r) for r in self.ranges],
+            'complete': self.complete
+        }
+
+
+class ChunkedUploadManager(PeriodicWorker):
+    """
+    Registry of in-progress chunked uploads.
+
+    Sessions live in memory and their part files live in the storage
+    directory. A background thread removes sessions that have seen no chunk
+    for longer than the session TTL, together with their part files.
+    """
+
+    def __init__(self, chunk_size=4 * 1024 * 1024, session_ttl=3600.0):
+        super().__init__(min(60.0, session_ttl))
+        self.chunk_size = chunk_size
+        self.max_chunk_size = chunk_size * 4
+        self.session_ttl = session_ttl
+        self.buffer_size = 1024 * 1024
+        self.storage_dir = None
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def init_app(self, app, storage_dir):
+        """
+        Configure the manager and start the expiry thread
+        """
+        self.storage_dir = storage_dir
+        self.chunk_size = app.config.setdefault('CHUNKED_UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024)
+        self.max_chunk_size = app.config.setdefault('CHUNKED_UPLOAD_MAX_CHUNK_SIZE', self.chunk_size * 4)
+        self.session_ttl = app.config.setdefault('CHUNKED_UPLOAD_SESSION_TTL', 3600.0)
+        self.interval = min(60.0, self.session_ttl)
+
+        # Sessions do not survive a restart, so their part files are orphans
+        for path in glob.glob(os.path.join(storage_dir, f"{PART_FILE_PREFIX}*{PART_FILE_SUFFIX}")):
+            self._remove_file(path)
+
+        self.start('upload-expiry')
+
+    def create(self, filename, size, description='', expected_hash=None, reservation=None):
+        """
+        Start a new upload session and preallocate its part file
+        reservation is the disk space held for its data, released when the
+        session is discarded or expires.
+        """
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(self.storage_dir, f"{PART_FILE_PREFIX}{upload_id}{PART_FILE_SUFFIX}")
+
+        # Sparse preallocation, chunks are written in place at their offset
+        with open(path, 'wb') as f:
+            f.truncate(size)
+
+        session = UploadSession(upload_id, path, size, filename, description, expected_hash, reservation)
+        with self._lock:
+            self._sessions[upload_id] = session
+        return session
+
+    def get(self, upload_id):
+        """
+        Get an active session by ID, or None if it does not exist
+        """
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is not None and not session.finalizing:
+                session.last_activity = time.monotonic()
+                return session
+        return None
+
+    def write_chunk(self, session, offset, length, stream):
+        """
+        Write length bytes read from stream at offset in the part file
+        Raises ValueError if the chunk does not fit the declared file size
+        """
+        if offset < 0 or length < 0 or offset + length > session.size:
+            raise ValueError('Chunk is outside the file')
+        if length > self.max_chunk_size:
+            raise ValueError(f'Chunk is larger than {self.max_chunk_size} bytes')
+
+        # Extend the prefix hash while writing if this chunk continues it
+        hasher = None
+        if offset == session.hashed and session.hash_lock.acquire(blocking=False):
+            if offset == session.hashed:
+                hasher = session.hasher.copy()
+            else:
+                session.hash_lock.release()
+
+        written = 0
+        try:
+            with open(session.path, 'r+b', buffering=0) as f:
+                f.seek(offset)
+                while written < length:
+                    data = stream.read(min(self.buffer_size, length - written))
+                    if not data:
+                        break
+                    f.write(data)
+                    session.meter.wrote(f, len(data))
+                    if hasher is not None:
+                        hasher.update(data)
+                    written += len(data)
+        finally:
+            if hasher is not None and written == length:
+                session.hasher = hasher
+                session.hashed = offset + length
+            with self._lock:
+                if written == length:
+                    session.add_range(offset, offset + length)
+                session.last_activity = time.monotonic()
+            if hasher is not None:
+                session.hash_lock.release()
+
+        if written != length:
+            raise ValueError(f'Chunk ended after {written} of {length} bytes')
+
+        self.advance_hash(session)
+        return session
+
+    def advance_hash(self, session):
+        """
+        Hash the received data that now continues the hashed prefix.
+
+        Chunks sent in parallel finish out of order, so most of them cannot
+        be hashed while they are written. Once the chunks before them have
+        arrived, they are read back from the part file, normally still in
+        the page cache, on a real thread. If another request is already
+        hashing, it picks up the new data when it is done.
+        """
+        while session.contiguous > session.hashed and session.hash_lock.acquire(blocking=False):
+            try:
+                end = session.contiguous
+                session.hasher = run_blocking(
+                    self._hash_file, session.path, session.hasher.copy(), session.hashed, end
+                )
+                session.hashed = end
+            except Exception as e:
+                # Left for finish_hash() to read back
+                print(f"Error hashing upload {session.id}: {e}")
+                return
+            finally:
+                session.hash_lock.release()
+
+    def begin_finalize(self, session):
+        """
+        Claim a complete session for finalization
+        Returns False if it is incomplete or another request already claimed it
+        """
+        with self._lock:
+            if session.finalizing or not session.complete:
+                return False
+            session.finalizing = True
+            return True
+
+    def finish_hash(self, session):
+        """
+        Return the SHA-256 of the assembled file
+        Waits for a request still extending the hash, then reads back
+        whatever is left, normally nothing, on a real thread.
+        """
+        with session.hash_lock:
+            hasher = run_blocking(
+                self._hash_file, session.path, session.hasher.copy(), session.hashed, session.size
+            )
+        return hasher.hexdigest()
+
+    def _hash_file(self, path, hasher, start, end):
+        """
+        Feed bytes [start, end) of a file to hasher and return it
+        Runs on a real thread, so it must not take any green lock.
+        """
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                block = f.read(min(self.buffer_size, remaining))
+                if not block:
+                    raise ValueError('Part file is shorter than the upload')
+                hasher.update(block)
+                remaining -= len(block)
+        return hasher
+
+    def discard(self, session, remove_file=True):
+        """
+        Forget a session, removing its part file unless it was moved into place
+        """
+        with self._lock:
+            self._sessions.pop(session.id, None)
+        if session.reservation is not None:
+            session.reservation.release()
+        if remove_file:
+            self._remove_file(session.path)
+
+    def expire(self):
+        """
+        Remove sessions that have been idle for longer than the session TTL
+        """
+        cutoff = time.monotonic() - self.session_ttl
+        with self._lock:
+            expired = [
+                session for session in self._sessions.values()
+                if session.last_activity < cutoff and not session.finalizing and not session.hash_lock.locked()
+            ]
+            for session in expired:
+                del self._sessions[session.id]
+
+        for session in expired:
+            if session.reservation is not None:
+                session.reservation.release()
+            self._remove_file(session.path)
+
+        return len(expired)
+
+    def tick(self):
+        """
+        Expire idle sessions, run every interval
+        """
+        try:
+            self.expire()
+        except Exception as e:
+            print(f"Error expiring upload sessions: {e}")
+
+    @staticmethod
+    def _remove_file(path):
+        """
+        Remove a part file, ignoring files that are already gone
+        """
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# Shared manager instance, bound to the app in create_app()
+upload_sessions = ChunkedUploadManager()
@@ -0,0 +1,163 @@
+"""
+FreeBox Compression Module
+gzip encoding of dynamic responses, buffered or streamed
+"""
+
+import zlib
+
+from flask import request
+
+from backend.assets import accepts_gzip
+from backend.sendfile import FileBody
+
+# Content types worth compressing besides text/*
+COMPRESSIBLE_TYPES = {
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml'
+}
+
+# Bytes of streamed input compressed before the output is flushed
+STREAM_FLUSH_BYTES = 64 * 1024
+
+
+class ResponseCompressor:
+    """
+    Gzip encodes responses for clients that send Accept-Encoding: gzip.
+
+    Only text, JSON and similar types are compressed. Everything else,
+    such as images, video, audio and archives, is already compressed and
+    is left alone, as are partial responses, responses with their own
+    Content-Encoding and anything marked no-transform. Buffered bodies
+    under min_size bytes are sent as they are, since the gzip header
+    would eat most of the saving. The response cache stores its gzip
+    bodies with encode(), so cache hits are not compressed again. The
+    default level of 6 gets most of the size reduction for a fraction
+    of the CPU time of level 9 on a Pi.
+
+    Streamed bodies, such as large text previews, are compressed chunk
+    by chunk as they are sent, so they are never held in memory whole.
+    Inline file responses up to max_file_size bytes are streamed this
+    way too, giving up sendfile() for them. Larger ones and attachments
+    keep zero-copy, resumable downloads. Compressed responses get a weak
+    ETag, since their bytes differ from the identity encoding while the
+    content is the same.
+    """
+
+    def __init__(self, level=6, min_size=1024, max_file_size=1024 * 1024):
+        self.level = level
+        self.min_size = min_size
+        self.max_file_size = max_file_size
+
+    def init_app(self, app):
+        """
+        Read the settings from the app config and compress every response
+        """
+        self.level = app.config.setdefault('COMPRESSION_LEVEL', 6)
+        self.min_size = app.config.setdefault('COMPRESSION_MIN_SIZE', 1024)
+        self.max_file_size = app.config.setdefault('COMPRESSION_MAX_FILE_SIZE', 1024 * 1024)
+        app.after_request(self.compress)
+
+    def compress(self, response):
+        """
+        after_request hook: encode the response if it is worth it
+        """
+        if response.status_code == 304:
+            return self._not_modified(response)
+        if not self._should_compress(response):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        if not accepts_gzip():
+            return response
+
+        if response.is_streamed:
+            body = response.response
+            if isinstance(body, FileBody):
+                # The compressed bytes have to go through Python
+                body.sock = None
+
+            response.response = self._stream(body)
+            if hasattr(body, 'close'):
+                response.call_on_close(body.close)
+            response.direct_passthrough = False
+            del response.headers['Content-Length']
+            # Byte ranges refer to the identity encoding
+            del response.headers['Accept-Ranges']
+        else:
+            compressed = self.encode(response.get_data())
+            if compressed is None:
+                return response
+            response.set_data(compressed)
+
+        response.headers['Content-Encoding'] = 'gzip'
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def encode(self, data):
+        """
+        Gzip encode a buffered body
+        Returns None if it is too small or does not get any smaller.
+        """
+        if len(data) < self.min_size:
+            return None
+
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compressed = compressor.compress(data) + compressor.flush()
+        if len(compressed) >= len(data):
+            return None
+        return compressed
+
+    def _not_modified(self, response):
+        """
+        Send a 304 with the weak ETag if that is the one the client holds
+        """
+        etag, weak = response.get_etag()
+        if etag and not weak and f'W/"{etag}"' in request.headers.get('If-None-Match', ''):
+            response.set_etag(etag, weak=True)
+            response.vary.add('Accept-Encoding')
+        return response
+
+    def _should_compress(self, response):
+        """
+        Whether the response type and status allow compression at all
+        """
+        if response.status_code != 200 or 'Content-Encoding' in response.headers:
+            return False
+        if 'Content-Range' in response.headers or response.cache_control.no_transform:
+            return False
+        if response.headers.get('Content-Disposition', '').startswith('attachment'):
+            return False
+        if isinstance(response.response, FileBody) and (response.content_length or 0) > self.max_file_size:
+            # Compressing through Python would cost the hub more than it saves
+            return False
+
+        mimetype = response.mimetype or ''
+        return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+    def _stream(self, body):
+        """
+        Yield the gzip encoding of a streamed body
+        Output is flushed every STREAM_FLUSH_BYTES of input, so the client
+        can show the first part of a big preview before the rest is sent.
+        """
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        pending = 0
+        for chunk in body:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compressor.compress(chunk)
+            pending += len(chunk)
+            if pending >= STREAM_FLUSH_BYTES:
+                data += compressor.flush(zlib.Z_SYNC_FLUSH)
+                pending = 0
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+# Shared response compressor, bound to the app in create_app()
+response_compressor = ResponseCompressor()
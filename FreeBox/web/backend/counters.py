@@ -0,0 +1,95 @@
+"""
+FreeBox Counters Module
+Write-behind in-memory counters for the Stats table
+"""
+
+import datetime
+
+from backend.periodic import WriteBehindBuffer
+
+
+class CounterStore(WriteBehindBuffer):
+    """
+    In-memory view of the Stats table with batched write-behind.
+
+    Increments are applied in memory immediately and accumulated as pending
+    deltas. A background thread flushes all pending deltas in a single
+    transaction every flush interval, and once more at interpreter shutdown,
+    so a crash loses at most one interval worth of counts.
+    """
+
+    def __init__(self, flush_interval=5.0):
+        super().__init__(flush_interval, 'stats counters')
+        self._db = None
+        self._model = None
+        self._values = {}
+
+    def init_app(self, app, db, model):
+        """
+        Load the current counter values and start the flush thread
+        """
+        self._app = app
+        self._db = db
+        self._model = model
+        self.interval = app.config.setdefault('STATS_FLUSH_INTERVAL', 5.0)
+
+        with app.app_context():
+            self.load()
+
+        self.start('stats-flush')
+
+    def load(self):
+        """
+        Reload counter values from the database, keeping unflushed deltas
+        """
+        stats = self._model.query.all()
+        with self._lock:
+            self._values = {
+                stat.name: stat.value + self._pending.get(stat.name, 0)
+                for stat in stats
+            }
+
+    def increment(self, name, amount=1):
+        """
+        Increment a counter in memory and return its new value
+        Returns None if the counter does not exist
+        """
+        with self._lock:
+            if name not in self._values:
+                return None
+            self._values[name] += amount
+            self._pending[name] = self._pending.get(name, 0) + amount
+            return self._values[name]
+
+    def get(self, name, default=0):
+        """
+        Get the current value of a counter, including unflushed deltas
+        """
+        with self._lock:
+            return self._values.get(name, default)
+
+    def values(self):
+        """
+        Get a copy of all counter values, including unflushed deltas
+        """
+        with self._lock:
+            return dict(self._values)
+
+    def _write(self, pending):
+        """
+        Add the pending deltas to the Stats rows
+        """
+        now = datetime.datetime.utcnow()
+        for name, delta in pending.items():
+            self._model.query.filter_by(name=name).update(
+                {
+                    self._model.value: self._model.value + delta,
+                    self._model.last_updated: now
+                },
+                synchronize_session=False
+            )
+        self._db.session.commit()
+
+    def _restore(self, pending):
+        for name, delta in pending.items():
+            self._pending[name] = self._pending.get(name, 0) + delta
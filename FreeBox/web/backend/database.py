@@ -4,13 +4,72 @@ Handles database operations and models for the FreeBox application
 """
 
 import os
+import re
+import json
+import base64
 import datetime
+import itertools
+import threading
 from flask_sqlalchemy import SQLAlchemy
+from backend.counters import CounterStore
+from backend.recent import RecentMessages
+from backend.writequeue import GroupCommitQueue
+from backend.visitors import VisitorTracker
+from backend.searchpages import SearchSnapshots
+from backend.engine import RoutingSession, configure_engine, apply_engine_profile, wal_checkpointer
+from backend.responsecache import response_cache
 
 # Initialize SQLAlchemy
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# In-memory counters backing the Stats table
+stat_counters = CounterStore()
+
+# In-memory buffers of the latest chat messages in each room
+recent_messages = RecentMessages()
+
+# Visits counted in memory and written to the Visitor table in batches
+visitor_tracker = VisitorTracker()
+
+# Rankings of recent searches, so their later pages stay consistent
+search_snapshots = SearchSnapshots()
+
+# Chat messages waiting for the next group commit
+chat_writes = GroupCommitQueue('chat')
+
+# Queued chat messages get their ids here, so they can be broadcast before
+# they are written. The lock keeps ids in the order messages are queued.
+chat_message_ids = itertools.count(1)
+chat_message_lock = threading.Lock()
+
+# Response cache namespace of the file list, invalidated by file writes
+FILE_LIST_NAMESPACE = 'files'
 
 # Define models
+class Blob(db.Model):
+    """
+    Content-addressed copy of file data on disk
+    Shared by every File with the same hash and reclaimed once unreferenced
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    file_hash = db.Column(db.String(64), unique=True, nullable=False)  # SHA-256 hash is 64 chars
+    size = db.Column(db.Integer, nullable=False)  # Size in bytes
+    ref_count = db.Column(db.Integer, default=0, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    has_thumbnail = db.Column(db.Boolean, default=False)
+    
+    def to_dict(self):
+        """
+        Convert blob to dictionary for API responses
+        """
+        return {
+            'id': self.id,
+            'file_hash': self.file_hash,
+            'size': self.size,
+            'ref_count': self.ref_count,
+            'has_thumbnail': bool(self.has_thumbnail)
+        }
+
 class File(db.Model):
     """
     File model representing a file stored in the FreeBox
@@ -25,6 +84,18 @@ class File(db.Model):
     uploader_ip = db.Column(db.String(45), nullable=True)  # IPv6 addresses can be long
     description = db.Column(db.Text, nullable=True)
     file_hash = db.Column(db.String(64), nullable=True, index=True)  # SHA-256 hash is 64 chars
+    blob_id = db.Column(db.Integer, db.ForeignKey('blob.id'), nullable=True, index=True)
+    blob = db.relationship('Blob', lazy='joined')
+    
+    # One index per list sort order, with the id as tie-breaker so keyset
+    # pages can seek straight to the row after the cursor
+    __table_args__ = (
+        db.Index('ix_file_created_at_id', 'created_at', 'id'),
+        db.Index('ix_file_size_id', 'size', 'id'),
+        db.Index('ix_file_original_filename_id', 'original_filename', 'id'),
+        db.Index('ix_file_download_count_id', 'download_count', 'id'),
+        db.Index('ix_file_mime_type', 'mime_type'),
+    )
     
     def to_dict(self):
         """
@@ -37,7 +108,9 @@ class File(db.Model):
             'mime_type': self.mime_type,
             'created_at': self.created_at.timestamp(),
             'download_count': self.download_count,
-            'description': self.description
+            'description': self.description,
+            'file_hash': self.file_hash,
+            'thumbnail_url': f'/api/thumbnails/{self.blob.file_hash}' if self.blob is not None and self.blob.has_thumbnail else None
         }
 
 class ChatMessage(db.Model):
@@ -51,6 +124,11 @@ class ChatMessage(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     user_ip = db.Column(db.String(45), nullable=True)
     
+    # Ids grow with time, so history pages seek on (room, id)
+    __table_args__ = (
+        db.Index('ix_chat_message_room_id', 'room', 'id'),
+    )
+    
     def to_dict(self):
         """
         Convert message to dictionary for API responses
@@ -82,6 +160,24 @@ class Stats(db.Model):
             'last_updated': self.last_updated.timestamp()
         }
 
+class Aggregate(db.Model):
+    """
+    Materialized aggregate kept up to date by the write paths
+    Lets stats snapshots avoid full-table COUNT and SUM queries
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    value = db.Column(db.Integer, default=0)
+    
+    def to_dict(self):
+        """
+        Convert aggregate to dictionary for API responses
+        """
+        return {
+            'name': self.name,
+            'value': self.value
+        }
+
 class Visitor(db.Model):
     """
     Visitor record for unique IP tracking
@@ -106,13 +202,14 @@ class Visitor(db.Model):
 # Start time of the server for uptime calculation
 SERVER_START_TIME = datetime.datetime.utcnow()
 
-def init_db(app):
+def init_db(app, db_path=None):
     """
     Initialize the database with the Flask app
     """
     # Configure database
-    db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'freebox.db')
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    if db_path is None:
+        db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'freebox.db')
+    configure_engine(app, db_path)
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
     # Initialize database with app
@@ -120,11 +217,50 @@ def init_db(app):
     
     # Create tables if they don't exist
     with app.app_context():
+        # WAL, pragmas and the reader pool, set before the first connection
+        apply_engine_profile(app, db)
+        
         db.create_all()
         
+        # Add columns and indexes introduced after the tables were first created
+        ensure_columns()
+        ensure_indexes()
+        
+        # Create and fill the full-text search index on first run
+        ensure_search_index()
+        
         # Initialize default stats if they don't exist
         init_default_stats()
         
+        # Build the materialized aggregates on first run
+        init_aggregates()
+    
+    # Load counters into memory and start flushing them in the background
+    stat_counters.init_app(app, db, Stats)
+    
+    # Count visits in memory and write them in the background
+    visitor_tracker.init_app(app, load_visitor_ips, write_visits)
+    
+    # Pin the ranking of each search for paging through its results
+    search_snapshots.init_app(app)
+    
+    # Checkpoint the WAL in the background instead of during commits
+    wal_checkpointer.init_app(app, db_path)
+    
+    # Write chat messages in the background, batched into group commits
+    with app.app_context():
+        init_chat_message_ids()
+    chat_writes.init_app(
+        app,
+        write_chat_messages,
+        interval_ms=app.config.setdefault('CHAT_GROUP_COMMIT_MS', 5),
+        max_batch=app.config.setdefault('CHAT_GROUP_COMMIT_MAX_BATCH', 500)
+    )
+    
+    # Keep recent chat history in memory, starting with the busiest rooms
+    # Queued messages are written first so a room never loads without them
+    recent_messages.init_app(app, db, ChatMessage, before_load=chat_writes.flush)
+        
     return db
 
 def init_default_stats():
@@ -146,9 +282,117 @@ def init_default_stats():
     
     db.session.commit()
 
-def add_file(filename, original_filename, size, mime_type=None, uploader_ip=None, description=None, file_hash=None):
+def ensure_columns():
+    """
+    Add any model columns missing from an existing database
+    db.create_all() never alters tables that already exist
+    """
+    inspector = db.inspect(db.engine)
+    for table in db.metadata.tables.values():
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                db.session.execute(db.text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+    db.session.commit()
+
+def ensure_indexes():
+    """
+    Create any model indexes missing from an existing database
+    db.create_all() only creates indexes together with new tables
+    """
+    for table in db.metadata.tables.values():
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+def ensure_search_index():
+    """
+    Create the full-text search index if it does not exist yet
+    A new index is filled from the files already in the database.
+    """
+    exists = db.session.execute(
+        db.text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': FILE_SEARCH_TABLE}
+    ).first()
+    if exists:
+        return False
+    
+    db.session.execute(db.text(
+        f"CREATE VIRTUAL TABLE {FILE_SEARCH_TABLE} USING fts5("
+        "original_filename, description, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    ))
+    # Rank matches in the name above matches in the description
+    db.session.execute(db.text(
+        f"INSERT INTO {FILE_SEARCH_TABLE}({FILE_SEARCH_TABLE}, rank) VALUES ('rank', 'bm25(10.0, 1.0)')"
+    ))
+    rebuild_search_index()
+    return True
+
+def rebuild_search_index():
+    """
+    Re-index every file to repair the full-text search index
+    """
+    db.session.execute(db.text(f"DELETE FROM {FILE_SEARCH_TABLE}"))
+    db.session.execute(db.text(
+        f"INSERT INTO {FILE_SEARCH_TABLE}(rowid, original_filename, description) "
+        "SELECT id, original_filename, coalesce(description, '') FROM file"
+    ))
+    db.session.commit()
+    return File.query.count()
+
+# Names of the materialized aggregates
+AGGREGATE_NAMES = ['files_count', 'messages_count', 'visitors_count', 'total_storage']
+
+def init_aggregates():
+    """
+    Build the aggregates if any of them are missing
+    """
+    existing = {aggregate.name for aggregate in Aggregate.query.all()}
+    if not all(name in existing for name in AGGREGATE_NAMES):
+        rebuild_aggregates()
+
+def rebuild_aggregates():
+    """
+    Recompute all aggregates from the underlying tables to repair drift
+    """
+    values = {
+        'files_count': File.query.count(),
+        'messages_count': ChatMessage.query.count(),
+        'visitors_count': Visitor.query.count(),
+        'total_storage': db.session.query(db.func.sum(File.size)).scalar() or 0
+    }
+    
+    for name, value in values.items():
+        aggregate = Aggregate.query.filter_by(name=name).first()
+        if aggregate:
+            aggregate.value = value
+        else:
+            db.session.add(Aggregate(name=name, value=value))
+    
+    db.session.commit()
+    return values
+
+def adjust_aggregate(name, delta):
+    """
+    Adjust an aggregate as part of the current transaction
+    Callers commit the change together with the row it describes
+    """
+    Aggregate.query.filter_by(name=name).update(
+        {Aggregate.value: Aggregate.value + delta},
+        synchronize_session=False
+    )
+
+def get_aggregates():
+    """
+    Get all aggregates as a dictionary
+    """
+    return {aggregate.name: aggregate.value for aggregate in Aggregate.query.all()}
+
+def add_file(filename, original_filename, size, mime_type=None, uploader_ip=None, description=None, file_hash=None, blob=None):
     """
     Add a file record to the database
+    If a blob is given the file references it and its ref count is raised
     """
     file = File(
         filename=filename,
@@ -157,10 +401,21 @@ def add_file(filename, original_filename, size, mime_type=None, uploader_ip=None
         mime_type=mime_type,
         uploader_ip=uploader_ip,
         description=description,
-        file_hash=file_hash
+        file_hash=file_hash,
+        blob=blob
     )
     db.session.add(file)
+    if blob is not None:
+        adjust_blob_refs(blob.id, 1)
+    
+    # Index the name and description in the same transaction
+    db.session.flush()
+    index_file(file)
+    
+    adjust_aggregate('files_count', 1)
+    adjust_aggregate('total_storage', size)
     db.session.commit()
+    response_cache.invalidate(FILE_LIST_NAMESPACE)
     
     # Update stats
     increment_stat('total_files_uploaded')
@@ -198,6 +453,7 @@ def increment_download_count(file_id):
     if file:
         file.download_count += 1
         db.session.commit()
+        response_cache.invalidate(FILE_LIST_NAMESPACE)
         
         # Update stats
         increment_stat('total_downloads')
@@ -212,114 +468,441 @@ def delete_file(file_id):
     """
     file = get_file_by_id(file_id)
     if file:
+        # The blob stays on disk until garbage collection finds it unreferenced
+        if file.blob_id is not None:
+            adjust_blob_refs(file.blob_id, -1)
         db.session.delete(file)
+        unindex_file(file.id)
+        adjust_aggregate('files_count', -1)
+        adjust_aggregate('total_storage', -file.size)
         db.session.commit()
+        response_cache.invalidate(FILE_LIST_NAMESPACE)
         return True
     return False
 
 
-def get_all_files(limit=100, offset=0):
+def get_blob_by_hash(file_hash):
+    """
+    Get blob record by hash
+    """
+    return Blob.query.filter_by(file_hash=file_hash).first()
+
+
+def add_blob(file_hash, size):
+    """
+    Add an unreferenced blob record to the database
+    """
+    blob = Blob(file_hash=file_hash, size=size, ref_count=0)
+    db.session.add(blob)
+    db.session.commit()
+    return blob
+
+
+def adjust_blob_refs(blob_id, delta):
+    """
+    Adjust a blob's ref count as part of the current transaction
+    """
+    Blob.query.filter_by(id=blob_id).update(
+        {Blob.ref_count: Blob.ref_count + delta},
+        synchronize_session=False
+    )
+
+
+def set_blob_thumbnail(file_hash, has_thumbnail=True):
+    """
+    Record whether a blob has a thumbnail
+    Returns False if the blob no longer exists
+    """
+    updated = Blob.query.filter_by(file_hash=file_hash).update(
+        {Blob.has_thumbnail: has_thumbnail},
+        synchronize_session=False
+    )
+    db.session.commit()
+    
+    # Listed files show the thumbnail URL of their blob
+    response_cache.invalidate(FILE_LIST_NAMESPACE)
+    return updated > 0
+
+
+def get_blobs_without_thumbnail():
+    """
+    Get (file_hash, mime_type) for every blob that has no thumbnail yet
+    """
+    return (
+        db.session.query(Blob.file_hash, db.func.min(File.mime_type))
+        .join(File, File.blob_id == Blob.id)
+        .filter(db.or_(Blob.has_thumbnail.is_(None), Blob.has_thumbnail.is_(False)))
+        .group_by(Blob.id)
+        .all()
+    )
+
+
+def get_unreferenced_blobs():
+    """
+    Get all blobs that no file references any more
+    """
+    return Blob.query.filter(Blob.ref_count <= 0).all()
+
+
+def rebuild_blob_refs():
+    """
+    Recompute every blob's ref count from the file records to repair drift
+    """
+    counts = dict(
+        db.session.query(File.blob_id, db.func.count(File.id))
+        .filter(File.blob_id.isnot(None))
+        .group_by(File.blob_id)
+        .all()
+    )
+    
+    for blob in Blob.query.all():
+        blob.ref_count = counts.get(blob.id, 0)
+    
+    db.session.commit()
+    return counts
+
+
+# Columns the file list can be sorted by
+FILE_SORT_COLUMNS = {
+    'created_at': File.created_at,
+    'size': File.size,
+    'name': File.original_filename,
+    'download_count': File.download_count
+}
+
+def encode_cursor(*values):
+    """
+    Pack JSON values into an opaque, URL-safe cursor
+    """
+    payload = json.dumps(values, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """
+    Unpack the values in a cursor made by encode_cursor()
+    """
+    payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    return json.loads(payload)
+
+def encode_file_cursor(file_record, sort, order, mime_prefix):
     """
-    Get all files with pagination
+    Build the opaque cursor that resumes a file listing after file_record
+    """
+    value = getattr(file_record, FILE_SORT_COLUMNS[sort].key)
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+    return encode_cursor(sort, order, mime_prefix, value, file_record.id)
+
+def decode_file_cursor(cursor, sort, order, mime_prefix):
     """
-    return File.query.order_by(File.created_at.desc()).limit(limit).offset(offset).all()
+    Get the (value, id) position stored in a cursor
+    Raises ValueError if the cursor is malformed or belongs to another listing
+    """
+    try:
+        cursor_sort, cursor_order, cursor_mime_prefix, value, file_id = decode_cursor(cursor)
+        if sort == 'created_at':
+            value = datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+    
+    if (cursor_sort, cursor_order, cursor_mime_prefix) != (sort, order, mime_prefix) or not isinstance(file_id, int):
+        raise ValueError('Cursor does not match the requested listing')
+    
+    return value, file_id
+
+def get_all_files(limit=100, sort='created_at', order='desc', mime_prefix=None, cursor=None):
+    """
+    Get one page of files using keyset pagination
+    Pages seek on the (sort column, id) index instead of skipping rows, so
+    every page costs the same however deep it is.
+    Returns the files and the cursor for the next page, or None on the last.
+    """
+    if sort not in FILE_SORT_COLUMNS or order not in ('asc', 'desc'):
+        raise ValueError('Invalid sort order')
+    
+    column = FILE_SORT_COLUMNS[sort]
+    query = File.query
+    
+    if mime_prefix:
+        # A range instead of LIKE, which SQLite cannot serve from the index
+        upper = mime_prefix[:-1] + chr(ord(mime_prefix[-1]) + 1)
+        query = query.filter(File.mime_type >= mime_prefix, File.mime_type < upper)
+    
+    if cursor:
+        position = db.tuple_(column, File.id)
+        after = decode_file_cursor(cursor, sort, order, mime_prefix)
+        query = query.filter(position < after if order == 'desc' else position > after)
+    
+    if order == 'desc':
+        query = query.order_by(column.desc(), File.id.desc())
+    else:
+        query = query.order_by(column.asc(), File.id.asc())
+    
+    # Fetch one extra row to know whether there is another page
+    files = query.limit(limit + 1).all()
+    if len(files) <= limit:
+        return files, None
+    
+    files = files[:limit]
+    return files, encode_file_cursor(files[-1], sort, order, mime_prefix)
+
+
+# Full-text index over file names and descriptions, keyed by File.id
+FILE_SEARCH_TABLE = 'file_search'
+
+def index_file(file_record):
+    """
+    Add a file to the full-text search index
+    """
+    db.session.execute(
+        db.text(f"INSERT INTO {FILE_SEARCH_TABLE}(rowid, original_filename, description) VALUES (:id, :name, :description)"),
+        {'id': file_record.id, 'name': file_record.original_filename, 'description': file_record.description or ''}
+    )
+
+def unindex_file(file_id):
+    """
+    Remove a file from the full-text search index
+    """
+    db.session.execute(db.text(f"DELETE FROM {FILE_SEARCH_TABLE} WHERE rowid = :id"), {'id': file_id})
+
+def build_search_query(text):
+    """
+    Turn free text into an FTS5 query matching files that contain every
+    word, with the words treated as prefixes so results appear while typing
+    Quoting each word keeps FTS5 operators in the input from being parsed.
+    """
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text))
+
+def search_files(text, limit=50, cursor=None):
+    """
+    Search file names and descriptions, best matches first
+    The first page ranks the matches once and keeps the best ones in
+    search_snapshots; the cursor points into that ranking, so later pages
+    neither score again nor shift when files are added or deleted.
+    Past the kept ranking, or once it has been evicted, pages continue by
+    offset in the live ranking, which may skip or repeat files if the
+    index changed in between.
+    Returns the files and the cursor for the next page, or None on the last.
+    """
+    query = build_search_query(text)
+    if not query:
+        return [], None
+    
+    token, position = None, 0
+    if cursor:
+        try:
+            cursor_text, token, position = decode_cursor(cursor)
+        except (TypeError, ValueError) as e:
+            raise ValueError('Invalid cursor') from e
+        if cursor_text != text or not isinstance(position, int) or position < 0:
+            raise ValueError('Cursor does not match the requested search')
+    
+    snapshot = search_snapshots.get(token) if token else None
+    
+    if snapshot is not None and position < len(snapshot.ids):
+        ids = snapshot.ids[position:position + limit]
+        end = position + len(ids)
+        if end < len(snapshot.ids) or snapshot.truncated:
+            next_cursor = encode_cursor(text, token, end)
+        else:
+            next_cursor = None
+    elif cursor is None:
+        # Rank is bm25() with the weights set when the index was created
+        ranked = rank_search_matches(query, search_snapshots.max_results + 1, 0)
+        truncated = len(ranked) > search_snapshots.max_results
+        ranked = ranked[:search_snapshots.max_results]
+        ids = ranked[:limit]
+        if len(ranked) > limit:
+            token = search_snapshots.store(ranked, truncated)
+            next_cursor = encode_cursor(text, token, len(ids))
+        else:
+            next_cursor = None
+    else:
+        ranked = rank_search_matches(query, limit + 1, position)
+        ids = ranked[:limit]
+        next_cursor = encode_cursor(text, None, position + limit) if len(ranked) > limit else None
+    
+    files = {file.id: file for file in File.query.filter(File.id.in_(ids))}
+    return [files[file_id] for file_id in ids if file_id in files], next_cursor
+
+def rank_search_matches(query, limit, offset):
+    """
+    Get the ids of the files matching an FTS5 query, best matches first
+    """
+    rows = db.session.execute(
+        db.text(
+            f"SELECT rowid FROM {FILE_SEARCH_TABLE} WHERE {FILE_SEARCH_TABLE} MATCH :query "
+            f"ORDER BY rank, rowid LIMIT :limit OFFSET :offset"
+        ),
+        {'query': query, 'limit': limit, 'offset': offset}
+    ).all()
+    return [row.rowid for row in rows]
+
+
+def init_chat_message_ids():
+    """
+    Continue handing out chat message ids after the highest stored one
+    """
+    global chat_message_ids
+    chat_writes.flush()
+    last_id = db.session.query(db.func.max(ChatMessage.id)).scalar() or 0
+    chat_message_ids = itertools.count(last_id + 1)
+
+def write_chat_messages(rows):
+    """
+    Insert a batch of queued chat messages in one transaction
+    """
+    db.session.execute(db.insert(ChatMessage), rows)
+    adjust_aggregate('messages_count', len(rows))
+    db.session.commit()
+
+def chat_room_namespace(room):
+    """
+    Get the response cache namespace of a chat room's history
+    """
+    return f'chat:{room}'
 
 
 def add_chat_message(username, message, room='main', user_ip=None):
     """
-    Add a chat message to the database
+    Add a chat message and return it as a dictionary
+    The message gets its id and timestamp straight away, so it can be
+    broadcast at once, and is written by the next group commit.
     """
     chat_message = ChatMessage(
         username=username,
         message=message,
         room=room,
-        user_ip=user_ip
+        user_ip=user_ip,
+        timestamp=datetime.datetime.utcnow()
     )
-    db.session.add(chat_message)
-    db.session.commit()
+    
+    with chat_message_lock:
+        chat_message.id = next(chat_message_ids)
+        message_dict = chat_message.to_dict()
+        recent_messages.append(room, chat_message.id, message_dict)
+        chat_writes.submit({
+            'id': chat_message.id,
+            'username': username,
+            'message': message,
+            'room': room,
+            'timestamp': chat_message.timestamp,
+            'user_ip': user_ip
+        })
+    response_cache.invalidate(chat_room_namespace(room))
     
     # Update stats
     increment_stat('total_messages')
     
-    return chat_message
+    return message_dict
 
 
-def get_recent_chat_messages(room='main', limit=50):
+def get_chat_messages(room='main', limit=50, before=None, after=None):
     """
-    Get recent chat messages for a room
+    Get one page of chat messages for a room as dictionaries, oldest first
+    Without a cursor this is the latest page. before=<id> pages back to the
+    messages just older than id, after=<id> forward to those just newer.
+    Recent pages come from memory, older ones from the database.
     """
-    return ChatMessage.query.filter_by(room=room).order_by(
-        ChatMessage.timestamp.desc()
-    ).limit(limit).all()
+    messages = recent_messages.page(room, limit, before=before, after=after)
+    if messages is not None:
+        return messages
+    
+    query = ChatMessage.query.filter_by(room=room)
+    
+    if after is not None:
+        messages = query.filter(ChatMessage.id > after).order_by(ChatMessage.id.asc()).limit(limit).all()
+    else:
+        if before is not None:
+            query = query.filter(ChatMessage.id < before)
+        messages = query.order_by(ChatMessage.id.desc()).limit(limit).all()
+        messages.reverse()
+    
+    return [message.to_dict() for message in messages]
 
 
 def record_visit(ip_address):
     """
     Record a visit from an IP address
+    Only memory is touched, the visit is written by the next visitor flush.
+    Returns True if this is the first visit from the address.
     """
-    visitor = Visitor.query.filter_by(ip_address=ip_address).first()
-    
-    if visitor:
-        # Existing visitor - update visit count
-        visitor.visit_count += 1
-        visitor.last_visit = datetime.datetime.utcnow()
-    else:
-        # New visitor
-        visitor = Visitor(ip_address=ip_address)
-        db.session.add(visitor)
+    new = visitor_tracker.record(ip_address)
+    if new:
         increment_stat('total_unique_visitors')
     
     # Increment total visits
     increment_stat('total_visits')
     
+    return new
+
+
+def load_visitor_ips():
+    """
+    Get the IP address of every stored visitor
+    """
+    return [ip_address for (ip_address,) in db.session.query(Visitor.ip_address)]
+
+
+def write_visits(visits):
+    """
+    Write a batch of visits from the visitor tracker in one transaction
+    visits maps each IP address to (visits, first_visit, last_visit, new).
+    """
+    existing = {
+        visitor.ip_address: visitor
+        for visitor in Visitor.query.filter(Visitor.ip_address.in_(list(visits)))
+    }
+    added = 0
+    
+    for ip_address, (count, first_visit, last_visit, _) in visits.items():
+        visitor = existing.get(ip_address)
+        if visitor:
+            visitor.visit_count += count
+            visitor.last_visit = last_visit
+        else:
+            db.session.add(Visitor(
+                ip_address=ip_address,
+                first_visit=first_visit,
+                last_visit=last_visit,
+                visit_count=count
+            ))
+            added += 1
+    
+    adjust_aggregate('visitors_count', added)
     db.session.commit()
-    return visitor
 
 
 def increment_stat(name, amount=1):
     """
     Increment a statistic by a given amount
+    The change is applied in memory and written to the database in batches
+    Returns the new value, or None if the statistic does not exist
     """
-    stat = Stats.query.filter_by(name=name).first()
-    
-    if stat:
-        stat.value += amount
-        db.session.commit()
-        return stat
-    
-    return None
+    return stat_counters.increment(name, amount)
 
 
 def get_all_stats():
     """
     Get all statistics
     """
-    stats = Stats.query.all()
-    
-    # Convert to dictionary
-    stats_dict = {stat.name: stat.value for stat in stats}
+    # Counter values come from memory so unflushed increments are included
+    stats_dict = stat_counters.values()
     
     # Add uptime
     uptime_seconds = (datetime.datetime.utcnow() - SERVER_START_TIME).total_seconds()
     stats_dict['uptime_seconds'] = int(uptime_seconds)
     
-    # Get detailed file stats
-    files_count = File.query.count()
-    messages_count = ChatMessage.query.count()
-    visitors_count = Visitor.query.count()
+    # Add the materialized file, message, visitor and storage totals
+    stats_dict.update(get_aggregates())
     
-    # Calculate total storage used (in bytes)
-    total_storage = db.session.query(db.func.sum(File.size)).scalar() or 0
+    # Count chat messages and visitors that are still waiting to be written
+    stats_dict['messages_count'] = stats_dict.get('messages_count', 0) + chat_writes.depth()
+    stats_dict['visitors_count'] = stats_dict.get('visitors_count', 0) + visitor_tracker.pending_new()
     
-    # Calculate additional metrics
+    # Most downloaded file is a single lookup on the download_count index
     most_downloaded = File.query.order_by(File.download_count.desc()).first()
     
-    # Add calculated stats
-    stats_dict['visitors_count'] = visitors_count
-    stats_dict['files_count'] = files_count
-    stats_dict['messages_count'] = messages_count
-    stats_dict['total_storage'] = total_storage
-    
     # Add most downloaded file information
     if most_downloaded:
         stats_dict['most_downloaded'] = {
@@ -0,0 +1,200 @@
+"""
+FreeBox Downloads Module
+Conditional and byte-range responses for stored files
+"""
+
+import os
+import uuid
+import unicodedata
+from urllib.parse import quote
+from flask import request, send_file, current_app, Response
+from werkzeug.datastructures import Headers
+from werkzeug.http import http_date, is_resource_modified, quote_etag
+
+from backend.sendfile import FileBody, sendfile_socket
+from backend.bandwidth import bandwidth_scheduler
+
+
+def if_range_matches(etag):
+    """
+    Whether a Range request may be honoured given its If-Range header
+    Only strong ETags are compared; a date validator never matches
+    """
+    if_range = request.if_range
+    if if_range.etag is None and if_range.date is None:
+        return True
+    return if_range.etag is not None and if_range.etag == etag
+
+
+def is_new_download(etag):
+    """
+    Whether this request starts a logical download that should be counted
+    Resumed downloads, seeks and revalidations all reuse the same validator,
+    so only a full transfer or a range starting at byte 0 is counted.
+    """
+    if request.method != 'GET':
+        return False
+
+    if etag and request.if_none_match.contains(etag):
+        return False
+
+    byte_range = request.range
+    if byte_range is None or not if_range_matches(etag):
+        return True
+
+    return any(start == 0 for start, _ in byte_range.ranges)
+
+
+def resolve_ranges(byte_range, size):
+    """
+    Turn a parsed Range header into sorted, merged (start, stop) pairs
+    Overlapping and adjacent ranges are merged so a client cannot make the
+    server send the same bytes many times in one response.
+    """
+    resolved = []
+    for start, stop in byte_range.ranges:
+        if start < 0:
+            # Suffix range: the last -start bytes
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            resolved.append((start, stop))
+
+    resolved.sort()
+    merged = []
+    for start, stop in resolved:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def content_disposition(download_name, as_attachment):
+    """
+    Build the Content-Disposition header the same way send_file does
+    Non-ASCII names are sent as an RFC 5987 filename* parameter.
+    """
+    disposition = 'attachment' if as_attachment else 'inline'
+    try:
+        download_name.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        quoted = quote(download_name, safe="!#$&+^`|~")
+        names = {'filename': simple, 'filename*': f"UTF-8''{quoted}"}
+    else:
+        names = {'filename': download_name}
+
+    headers = Headers()
+    headers.set('Content-Disposition', disposition, **names)
+    return headers['Content-Disposition']
+
+
+def file_response(file_path, parts, status, mimetype, headers, trailer=b'', preview=False):
+    """
+    Build a response whose body is the given (prefix, start, stop) parts
+    The body goes out through sendfile() when the server supports it, at
+    the pace set by the bandwidth scheduler.
+    """
+    content_length = (
+        sum(len(prefix) + stop - start for prefix, start, stop in parts)
+        + len(trailer)
+    )
+    stream = bandwidth_scheduler.stream(request.remote_addr, content_length, preview)
+    body = FileBody(file_path, parts, trailer, sendfile_socket(request.environ), stream)
+
+    response = Response(body, status=status, mimetype=mimetype, direct_passthrough=True)
+    response.headers.update(headers)
+    response.headers['Content-Length'] = str(content_length)
+    return response
+
+
+def range_response(file_path, ranges, size, content_type, headers, preview=False):
+    """
+    Build a 206 response for one range, or multipart/byteranges for several
+    """
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        headers = dict(headers, **{'Content-Range': f'bytes {start}-{stop - 1}/{size}'})
+        return file_response(file_path, [(b'', start, stop)], 206, content_type, headers, preview=preview)
+
+    boundary = uuid.uuid4().hex
+    parts = [
+        (
+            (
+                f"\r\n--{boundary}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n"
+            ).encode('ascii'),
+            start,
+            stop
+        )
+        for start, stop in ranges
+    ]
+    trailer = f"\r\n--{boundary}--\r\n".encode('ascii')
+
+    return file_response(
+        file_path,
+        parts,
+        206,
+        f'multipart/byteranges; boundary={boundary}',
+        headers,
+        trailer,
+        preview
+    )
+
+
+def send_stored_file(file_path, file_record, content_type, as_attachment):
+    """
+    Send a stored file with ETag, If-None-Match, If-Range and Range support
+    The strong ETag is the file's SHA-256, so it is identical for every copy
+    of the same content and survives restarts. Bodies are sent with
+    sendfile() unless SENDFILE_DOWNLOADS is disabled, in which case full and
+    single-range responses fall back to Flask's send_file. Inline responses
+    count as previews for the bandwidth scheduler.
+    """
+    etag = file_record.file_hash
+    byte_range = request.range
+    multi_range = byte_range is not None and len(byte_range.ranges) > 1
+
+    # send_file rejects requests for several ranges, so those are always
+    # handled here
+    if not current_app.config.get('SENDFILE_DOWNLOADS', True) and not multi_range:
+        response = send_file(
+            file_path,
+            mimetype=content_type,
+            as_attachment=as_attachment,
+            download_name=file_record.original_filename,
+            conditional=True,
+            etag=etag or True
+        )
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response
+
+    stat = os.stat(file_path)
+    size = stat.st_size
+    last_modified = http_date(stat.st_mtime)
+
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Last-Modified': last_modified,
+        'Content-Disposition': content_disposition(file_record.original_filename, as_attachment)
+    }
+    if etag:
+        headers['ETag'] = quote_etag(etag)
+
+    if request.method in ('GET', 'HEAD') and not is_resource_modified(
+        request.environ, etag=etag, last_modified=last_modified
+    ):
+        return Response(status=304, headers=headers)
+
+    if byte_range is not None and if_range_matches(etag):
+        ranges = resolve_ranges(byte_range, size)
+
+        if not ranges:
+            return Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+
+        return range_response(file_path, ranges, size, content_type, headers, not as_attachment)
+
+    return file_response(file_path, [(b'', 0, size)], 200, content_type, headers, preview=not as_attachment)
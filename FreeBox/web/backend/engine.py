@@ -0,0 +1,231 @@
+"""
+FreeBox Engine Module
+SQLite engine profile: WAL, connection pragmas, one writer connection, a
+pool of read connections and a background checkpoint scheduler
+"""
+
+import os
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.sql.elements import TextClause
+from flask_sqlalchemy.session import Session
+
+from backend.offload import run_blocking
+from backend.periodic import PeriodicWorker
+
+# Bind key of the read-only connection pool
+READER_BIND = 'reader'
+
+# Session info key set once the current transaction has written
+WRITING_KEY = 'freebox.writing'
+
+# Statements that only read, when given as text
+READ_KEYWORDS = ('SELECT', 'WITH')
+
+
+def configure_engine(app, db_path):
+    """
+    Set the database URI and engine options, before db.init_app()
+    The 'tuned' profile (the default) gives the app a single writer
+    connection and a separate pool of readers on the same database file.
+    The 'default' profile is a plain SQLite engine with default settings.
+    """
+    uri = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+
+    if app.config.setdefault('SQLITE_ENGINE_PROFILE', 'tuned') != 'tuned':
+        return
+
+    read_pool_size = app.config.setdefault('SQLITE_READ_POOL_SIZE', 4)
+    app.config.setdefault('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    app.config.setdefault('SQLITE_CACHE_SIZE_KB', 8 * 1024)
+    app.config.setdefault('SQLITE_MMAP_SIZE', 64 * 1024 * 1024)
+
+    # SQLite allows one writer at a time, so writers queue for the single
+    # connection instead of retrying on a locked database
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': 1,
+        'max_overflow': 0,
+        'pool_timeout': 30
+    }
+    app.config['SQLALCHEMY_BINDS'] = {
+        READER_BIND: {
+            'url': uri,
+            'pool_size': read_pool_size,
+            # Bursts of requests may open extra readers for a while
+            'max_overflow': read_pool_size * 2,
+            'pool_timeout': 30
+        }
+    }
+
+
+def apply_engine_profile(app, db):
+    """
+    Set the connection pragmas on the engines, after db.init_app()
+    Must be called inside an app context, before the first connection.
+    """
+    if app.config['SQLITE_ENGINE_PROFILE'] != 'tuned':
+        return
+
+    common = [
+        f"PRAGMA busy_timeout = {int(app.config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        # Negative cache sizes are in KiB rather than pages
+        f"PRAGMA cache_size = {-int(app.config['SQLITE_CACHE_SIZE_KB'])}",
+        f"PRAGMA mmap_size = {int(app.config['SQLITE_MMAP_SIZE'])}",
+        "PRAGMA temp_store = MEMORY"
+    ]
+    writer_pragmas = [
+        # Readers keep reading while a write is in progress
+        "PRAGMA journal_mode = WAL",
+        # In WAL mode this only syncs at checkpoints. A power cut may lose
+        # the latest commits but cannot corrupt the database
+        "PRAGMA synchronous = NORMAL",
+        # Checkpoints run in the background instead of inside a commit
+        "PRAGMA wal_autocheckpoint = 0"
+    ] + common
+    reader_pragmas = ["PRAGMA query_only = 1"] + common
+
+    def pragma_listener(pragmas):
+        def on_connect(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+        return on_connect
+
+    event.listen(db.engines[None], 'connect', pragma_listener(writer_pragmas))
+    event.listen(db.engines[READER_BIND], 'connect', pragma_listener(reader_pragmas))
+
+
+def is_read_only(clause):
+    """
+    Whether a statement only reads from the database
+    """
+    if clause is None:
+        return False
+    if isinstance(clause, TextClause):
+        words = clause.text.split(None, 1)
+        return bool(words) and words[0].upper() in READ_KEYWORDS
+    return bool(getattr(clause, 'is_select', False))
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads to the reader pool and writes to the writer.
+
+    Once a transaction has written, the rest of it stays on the writer so
+    its reads see its own uncommitted changes. Without a reader bind every
+    statement goes to the default engine as usual.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and READER_BIND in self._db.engines:
+            if not self._flushing and not self.info.get(WRITING_KEY) and is_read_only(clause):
+                return self._db.engines[READER_BIND]
+            self.info[WRITING_KEY] = True
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def end_writing(session, transaction):
+    """
+    Send the reads of the next transaction to the readers again
+    """
+    if transaction.parent is None:
+        session.info.pop(WRITING_KEY, None)
+
+
+class CheckpointScheduler(PeriodicWorker):
+    """
+    Moves the WAL back into the database file from a background thread.
+
+    Commits never checkpoint themselves, so they stay fast. Instead a
+    passive checkpoint, which never waits for readers or writers, runs
+    every interval. When the WAL file has grown past max_wal_bytes a
+    truncating checkpoint resets it, and one more runs at shutdown. The
+    checkpoint itself runs on a real thread with its own connection, so
+    its disk syncs never stall the eventlet hub.
+    """
+
+    def __init__(self, interval=30.0, max_wal_bytes=16 * 1024 * 1024):
+        super().__init__(interval)
+        self.max_wal_bytes = max_wal_bytes
+        self.db_path = None
+        self.busy_timeout = 5.0
+        self._last_result = None
+
+    def init_app(self, app, db_path):
+        """
+        Start the checkpoint thread when the tuned profile is in use
+        """
+        if app.config['SQLITE_ENGINE_PROFILE'] != 'tuned':
+            return
+
+        self.db_path = db_path
+        self.interval = app.config.setdefault('SQLITE_CHECKPOINT_INTERVAL', 30.0)
+        self.max_wal_bytes = app.config.setdefault('SQLITE_WAL_MAX_BYTES', 16 * 1024 * 1024)
+        self.busy_timeout = app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000.0
+
+        self.start('wal-checkpoint')
+
+    def wal_size(self):
+        """
+        Get the size of the WAL file in bytes
+        """
+        try:
+            return os.path.getsize(f'{self.db_path}-wal')
+        except OSError:
+            return 0
+
+    def checkpoint(self, mode='PASSIVE'):
+        """
+        Run a checkpoint and return (busy, wal_pages, checkpointed_pages)
+        """
+        connection = sqlite3.connect(self.db_path, timeout=self.busy_timeout)
+        try:
+            result = connection.execute(f'PRAGMA wal_checkpoint({mode})').fetchone()
+        finally:
+            connection.close()
+        self._last_result = result
+        return result
+
+    def stats(self):
+        """
+        Get the WAL size and the result of the last checkpoint
+        """
+        result = self._last_result
+        return {
+            'wal_bytes': self.wal_size(),
+            'last_checkpoint': None if result is None else {
+                'busy': bool(result[0]),
+                'wal_pages': result[1],
+                'checkpointed_pages': result[2]
+            }
+        }
+
+    def shutdown(self):
+        """
+        Stop the checkpoint thread and reset the WAL
+        """
+        super().shutdown()
+        if self.db_path is not None:
+            try:
+                self.checkpoint('TRUNCATE')
+            except sqlite3.Error as e:
+                print(f"Error checkpointing the database at shutdown: {e}")
+
+    def tick(self):
+        """
+        Checkpoint the WAL, run every interval
+        """
+        mode = 'TRUNCATE' if self.wal_size() > self.max_wal_bytes else 'PASSIVE'
+        try:
+            run_blocking(self.checkpoint, mode)
+        except sqlite3.Error as e:
+            print(f"Error checkpointing the database: {e}")
+
+
+# Shared checkpoint scheduler, bound to the app in init_db()
+wal_checkpointer = CheckpointScheduler()
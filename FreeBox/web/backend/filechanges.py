@@ -0,0 +1,93 @@
+"""
+FreeBox File Changes Module
+Versioned log of file list changes, broadcast to clients as deltas
+"""
+
+import time
+import threading
+from collections import deque
+
+# Socket.IO event sent for each kind of change
+CHANGE_EVENTS = {
+    'added': 'file_added',
+    'updated': 'file_updated',
+    'deleted': 'file_deleted'
+}
+
+
+class FileChangeLog:
+    """
+    Numbers every change to the file list and remembers the latest ones.
+
+    Each change is broadcast on its own as file_added, file_updated (with
+    the file) or file_deleted (with its id), together with the new list
+    version. Versions go up by one per change, so a client that sees a
+    version jump knows it missed something and asks for the changes since
+    its version instead of reloading the list. Versions start from the
+    startup time in milliseconds, so they keep increasing across
+    restarts and an older process's version is never mistaken for a
+    recent one.
+    """
+
+    def __init__(self, size=1000):
+        self._socketio = None
+        self._lock = threading.Lock()
+        self._changes = deque(maxlen=size)
+        self._version = int(time.time() * 1000)
+        self._base_version = self._version
+
+    def init_app(self, app, socketio):
+        """
+        Bind the log to the SocketIO server and size it from the app config
+        """
+        self._socketio = socketio
+        size = app.config.setdefault('FILE_CHANGE_LOG_SIZE', 1000)
+        with self._lock:
+            self._changes = deque(self._changes, maxlen=size)
+
+    def version(self):
+        """
+        Get the version of the latest change
+        Read it before querying the files, so no later change is missed.
+        """
+        with self._lock:
+            return self._version
+
+    def record(self, kind, file=None, file_id=None):
+        """
+        Log a change and broadcast it
+        kind is 'added', 'updated' or 'deleted'. Added and updated changes
+        carry the file as a dictionary, deleted ones only its id.
+        """
+        with self._lock:
+            self._version += 1
+            change = {'version': self._version, 'type': kind}
+            if file is not None:
+                change['file'] = file
+            else:
+                change['id'] = file_id
+            self._changes.append(change)
+
+        if self._socketio is not None:
+            self._socketio.emit(CHANGE_EVENTS[kind], change)
+        return change
+
+    def since(self, version):
+        """
+        Get the changes after a version, oldest first
+        Returns None if some of them are no longer in the log, or the
+        version is not one this process handed out.
+        """
+        with self._lock:
+            if version < self._base_version or version > self._version:
+                return None
+
+            changes = [change for change in self._changes if change['version'] > version]
+            oldest = changes[0]['version'] if changes else self._version + 1
+            if oldest != version + 1:
+                return None
+            return changes
+
+
+# Shared change log, bound to the app in create_app()
+file_changes = FileChangeLog()
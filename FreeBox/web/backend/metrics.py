@@ -0,0 +1,166 @@
+"""
+FreeBox Metrics Module
+Background sampling of system metrics into a fixed-size history
+"""
+
+import time
+import shutil
+import threading
+from collections import deque
+
+import psutil
+
+from backend.offload import run_blocking
+from backend.periodic import PeriodicWorker
+
+
+def get_cpu_temperature():
+    """
+    Get CPU temperature in Celsius
+    Returns None if temperature information is not available
+    """
+    try:
+        # Try using psutil's sensors_temperatures()
+        temps = psutil.sensors_temperatures()
+        if not temps:
+            return None
+
+        # Different systems report CPU temp under different keys
+        # Common keys: 'coretemp', 'k10temp', 'cpu_thermal'
+        for chip_name, sensors in temps.items():
+            if chip_name.lower() in ['coretemp', 'k10temp', 'cpu_thermal', 'cpu-thermal', 'cpu thermal']:
+                # Take the first core or the package temperature
+                if sensors:
+                    return sensors[0].current
+
+        # If we reach here, we didn't find a recognizable temperature sensor
+        # Try the first available sensor as a fallback
+        for chip_name, sensors in temps.items():
+            if sensors:
+                return sensors[0].current
+
+        return None
+    except Exception as e:
+        print(f"Error getting CPU temperature: {e}")
+        return None
+
+
+class MetricsSampler(PeriodicWorker):
+    """
+    Samples CPU, memory, temperature and disk usage at a fixed cadence.
+
+    A background thread takes one sample every interval and appends it to
+    a ring buffer of the most recent samples. Requests read the latest
+    sample instead of measuring, so none of them waits for a CPU reading.
+    CPU usage is the average since the previous sample, so it covers the
+    whole interval rather than a short window inside a request. Other
+    modules add their own fields with add_source().
+    """
+
+    def __init__(self, interval=2.0, history_size=300):
+        super().__init__(interval)
+        self.storage_dir = None
+        self._sources = {}
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=history_size)
+
+    def init_app(self, app, storage_dir):
+        """
+        Take a first sample and start the sampling thread
+        """
+        self.storage_dir = storage_dir
+        self.interval = app.config.setdefault('METRICS_SAMPLE_INTERVAL', 2.0)
+        history_size = app.config.setdefault('METRICS_HISTORY_SIZE', 300)
+
+        with self._lock:
+            self._samples = deque(self._samples, maxlen=history_size)
+
+        # The first CPU reading has nothing to compare against, so prime it
+        psutil.cpu_percent(interval=None)
+        self.sample()
+
+        self.start('metrics-sampler')
+
+    def add_source(self, name, function):
+        """
+        Record function() as the field name of every sample
+        It may run on a real thread, so it must not take green locks.
+        """
+        self._sources[name] = function
+
+    def sample(self):
+        """
+        Measure the system once and record the sample
+        """
+        return self._record(self.measure())
+
+    def measure(self):
+        """
+        Measure the system once without recording it
+        Safe to run on a real thread, since it takes no locks.
+        """
+        memory = psutil.virtual_memory()
+        disk_usage = shutil.disk_usage(self.storage_dir)
+        sample = {
+            'timestamp': time.time(),
+            'cpu_percent': psutil.cpu_percent(interval=None),
+            'cpu_temperature': get_cpu_temperature(),
+            'memory_percent': memory.percent,
+            'memory_used': memory.used,
+            'memory_total': memory.total,
+            'disk_free': disk_usage.free,
+            'disk_total': disk_usage.total,
+            'disk_used': disk_usage.used
+        }
+        for name, function in self._sources.items():
+            sample[name] = function()
+        return sample
+
+    def latest(self):
+        """
+        Get a copy of the most recent sample
+        """
+        with self._lock:
+            if self._samples:
+                return dict(self._samples[-1])
+        return self.sample()
+
+    def history(self, since=None, limit=None):
+        """
+        Get the recorded samples, oldest first
+        since keeps only samples taken after that timestamp, and limit
+        keeps only the newest samples.
+        """
+        with self._lock:
+            samples = [dict(sample) for sample in self._samples if since is None or sample['timestamp'] > since]
+        if limit is not None:
+            samples = samples[-limit:] if limit > 0 else []
+        return samples
+
+    def _record(self, sample):
+        """
+        Append a sample to the history
+        """
+        with self._lock:
+            self._samples.append(sample)
+        return sample
+
+    def _run(self):
+        """
+        Sampling loop run by the background thread
+        """
+        next_sample = time.monotonic() + self.interval
+        while not self._stop.wait(max(0.0, next_sample - time.monotonic())):
+            try:
+                # Reading the sensors touches many files, keep it off the hub,
+                # but record the sample here since the lock is a green one
+                self._record(run_blocking(self.measure))
+            except Exception as e:
+                print(f"Error sampling system metrics: {e}")
+
+            # Keep a fixed cadence, skipping samples missed while busy
+            next_sample = max(next_sample + self.interval, time.monotonic())
+
+
+# Shared metrics sampler, bound to the app in create_app()
+metrics_sampler = MetricsSampler()
@@ -0,0 +1,16 @@
+"""
+FreeBox Offload Module
+Runs blocking work on real threads when eventlet is in charge
+"""
+
+from eventlet import patcher, tpool
+
+
+def run_blocking(function, *args):
+    """
+    Run CPU-bound or blocking work without stalling the eventlet hub
+    Green threads share one OS thread, so the work goes to a real thread.
+    """
+    if patcher.is_monkey_patched('thread'):
+        return tpool.execute(function, *args)
+    return function(*args)
@@ -0,0 +1,120 @@
+"""
+FreeBox Periodic Module
+Background threads that run a task every interval, and write-behind buffers
+"""
+
+import atexit
+import threading
+
+
+class PeriodicWorker:
+    """
+    Runs tick() on a daemon thread every interval seconds.
+
+    Subclasses call start() from init_app(), which starts the thread once
+    and stops it at interpreter shutdown. Subclasses that need more than
+    a fixed interval override _run() and loop until _stop is set.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, name):
+        """
+        Start the background thread unless it is already running
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def tick(self):
+        """
+        Work done every interval
+        """
+        raise NotImplementedError
+
+    def shutdown(self):
+        """
+        Stop the background thread
+        """
+        self._stop.set()
+
+    def _run(self):
+        """
+        Loop run by the background thread
+        """
+        while not self._stop.wait(self.interval):
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Error in {self._thread.name}: {e}")
+
+
+class WriteBehindBuffer(PeriodicWorker):
+    """
+    Changes accumulated in memory and written to the database in batches.
+
+    Subclasses add to _pending under _lock. Every interval, and once more
+    at interpreter shutdown, the pending changes are swapped out and
+    handed to _write() inside an app context, so a crash loses at most
+    one interval of changes. If the write fails, _restore() merges them
+    back into changes made since, so the next flush retries them.
+    """
+
+    def __init__(self, interval, description):
+        super().__init__(interval)
+        self.description = description
+        self._app = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+
+    def flush(self):
+        """
+        Write all pending changes in one batch
+        Returns the number of entries written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+
+            if not pending:
+                return 0
+
+            try:
+                with self._app.app_context():
+                    self._write(pending)
+            except Exception as e:
+                print(f"Error flushing {self.description}: {e}")
+                with self._lock:
+                    self._restore(pending)
+                return 0
+
+            return len(pending)
+
+    def tick(self):
+        self.flush()
+
+    def shutdown(self):
+        """
+        Stop the flush thread and write any remaining changes
+        """
+        super().shutdown()
+        if self._app is not None:
+            self.flush()
+
+    def _write(self, pending):
+        """
+        Write a batch of pending changes and commit
+        """
+        raise NotImplementedError
+
+    def _restore(self, pending):
+        """
+        Merge a batch that failed to write back into _pending
+        Called with _lock held.
+        """
+        raise NotImplementedError
@@ -0,0 +1,119 @@
+"""
+FreeBox Preview Module
+Paged text previews read through mmap with a small page cache
+"""
+
+import os
+import mmap
+import threading
+from collections import OrderedDict
+
+
+def is_continuation_byte(byte):
+    """Whether a byte is a UTF-8 continuation byte (10xxxxxx)"""
+    return byte & 0xC0 == 0x80
+
+
+class TextPreviewer:
+    """
+    Serves text files as pages of at most max_page_size bytes.
+
+    Pages are cut from an mmap of the file, so only the requested bytes are
+    read, however large the file is. Page boundaries are moved so they never
+    split a UTF-8 character and, where possible, end on a line break. Recent
+    pages are kept in an LRU keyed by the file hash, which stays valid as
+    long as the content exists.
+    """
+
+    def __init__(self, page_size=64 * 1024, max_page_size=256 * 1024, cache_pages=64):
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.cache_pages = cache_pages
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+
+    def init_app(self, app):
+        """
+        Read the page sizes and cache size from the app config
+        """
+        self.page_size = app.config.setdefault('PREVIEW_PAGE_SIZE', 64 * 1024)
+        self.max_page_size = app.config.setdefault('PREVIEW_MAX_PAGE_SIZE', 256 * 1024)
+        self.cache_pages = app.config.setdefault('PREVIEW_CACHE_PAGES', 64)
+
+    def page(self, file_path, cache_key, offset=0, length=None):
+        """
+        Get the page of text starting at byte offset
+        Returns a dictionary for the API response with the decoded text, the
+        actual byte range it covers and the offset of the next page.
+        """
+        if length is None:
+            length = self.page_size
+        # A page always moves forward, so a reader cannot loop on it
+        length = max(1, min(length, self.max_page_size))
+        offset = max(offset, 0)
+        key = (cache_key, offset, length)
+
+        with self._lock:
+            page = self._cache.get(key)
+            if page is not None:
+                self._cache.move_to_end(key)
+                return page
+
+        page = self._read_page(file_path, offset, length)
+
+        with self._lock:
+            self._cache[key] = page
+            while len(self._cache) > self.cache_pages:
+                self._cache.popitem(last=False)
+
+        return page
+
+    @staticmethod
+    def _read_page(file_path, offset, length):
+        """
+        Cut one page out of the file
+        """
+        size = os.path.getsize(file_path)
+
+        if offset >= size:
+            return {
+                'text': '',
+                'offset': size,
+                'next_offset': size,
+                'size': size,
+                'eof': True
+            }
+
+        with open(file_path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                # Skip the tail of a character started by the previous page
+                start = offset
+                while start < size and start - offset < 3 and is_continuation_byte(data[start]):
+                    start += 1
+
+                end = min(start + length, size)
+                if end < size:
+                    newline = data.rfind(b'\n', start, end)
+                    if newline != -1:
+                        # End on a line break so lines are never split
+                        end = newline + 1
+                    else:
+                        # Otherwise end before a character that does not fit
+                        back = 0
+                        while end > start + 1 and back < 3 and is_continuation_byte(data[end]):
+                            end -= 1
+                            back += 1
+
+                chunk = data[start:end]
+
+        return {
+            'text': chunk.decode('utf-8', errors='replace'),
+            'offset': start,
+            'next_offset': end,
+            'size': size,
+            'eof': end >= size
+        }
+
+
+# Shared previewer instance, bound to the app in create_app()
+text_previewer = TextPreviewer()
@@ -0,0 +1,230 @@
+"""
+FreeBox Recent Messages Module
+In-memory ring buffers of the latest chat messages in each room
+"""
+
+import json
+import threading
+from collections import OrderedDict, deque
+
+# Memory charged for each room on top of its messages
+ROOM_OVERHEAD = 256
+
+
+class RoomBuffer:
+    """
+    The newest messages of one room, oldest first, as (id, message, size)
+    The buffer always holds a contiguous run ending at the newest message.
+    complete is True while it also holds every older message of the room.
+    """
+
+    def __init__(self, capacity, complete):
+        self.messages = deque(maxlen=capacity)
+        self.complete = complete
+        self.size = ROOM_OVERHEAD
+
+    def append(self, message_id, message):
+        """
+        Add a message, dropping the oldest if the buffer is full
+        Returns the change in memory use.
+        """
+        before = self.size
+        if len(self.messages) == self.messages.maxlen:
+            self.size -= self.messages[0][2]
+            self.complete = False
+        size = len(json.dumps(message))
+        self.messages.append((message_id, message, size))
+        self.size += size
+        return self.size - before
+
+    def trim(self):
+        """
+        Drop the oldest message and return the memory it used
+        """
+        self.complete = False
+        size = self.messages.popleft()[2]
+        self.size -= size
+        return size
+
+
+class RecentMessages:
+    """
+    Serves recent chat history without touching the database.
+
+    Each room keeps its newest messages already converted to dictionaries.
+    Buffers are filled at startup for the most active rooms, and loaded
+    from the database the first time any other room is asked for. New
+    messages are appended as they are stored. A page is answered from
+    memory only when the buffer is known to hold all of it; anything
+    else returns None and the caller queries the database.
+
+    Total memory is capped across rooms by evicting the least recently
+    used rooms, or trimming a single oversized room.
+    """
+
+    def __init__(self, room_size=100, max_bytes=4 * 1024 * 1024):
+        self.room_size = room_size
+        self.max_bytes = max_bytes
+        self._model = None
+        self._before_load = None
+        self._lock = threading.Lock()
+        self._rooms = OrderedDict()
+        self._loading = {}
+        self._size = 0
+
+    def init_app(self, app, db, model, before_load=None):
+        """
+        Read the buffer sizes from the app config and warm the buffers
+        before_load() is called before a room is read from the database,
+        to write out messages that are only in memory so far.
+        """
+        self._model = model
+        self._before_load = before_load
+        self.room_size = app.config.setdefault('CHAT_RECENT_MESSAGES', 100)
+        self.max_bytes = app.config.setdefault('CHAT_RECENT_MAX_BYTES', 4 * 1024 * 1024)
+
+        with app.app_context():
+            self.warm(db)
+
+    def warm(self, db):
+        """
+        Load the most recently active rooms until the memory cap is reached
+        """
+        rooms = (
+            db.session.query(self._model.room)
+            .group_by(self._model.room)
+            .order_by(db.func.max(self._model.id).desc())
+            .all()
+        )
+        for (room,) in rooms:
+            # Each room is less active than the ones before it, so it is
+            # the first to go once the cap is reached
+            self.load_room(room, least_recent=True)
+            if room not in self._rooms:
+                break
+
+    def load_room(self, room, least_recent=False):
+        """
+        Fill the buffer of a room from the database
+        Messages stored while the query runs are merged in afterwards.
+        """
+        with self._lock:
+            if room in self._rooms or room in self._loading:
+                return
+            self._loading[room] = []
+
+        try:
+            if self._before_load is not None:
+                self._before_load()
+            rows = (
+                self._model.query.filter_by(room=room)
+                .order_by(self._model.id.desc())
+                .limit(self.room_size)
+                .all()
+            )
+        except Exception:
+            with self._lock:
+                self._loading.pop(room, None)
+            raise
+
+        buffer = RoomBuffer(self.room_size, complete=len(rows) < self.room_size)
+        for row in reversed(rows):
+            buffer.append(row.id, row.to_dict())
+
+        with self._lock:
+            last_id = buffer.messages[-1][0] if buffer.messages else 0
+            for message_id, message in self._loading.pop(room, []):
+                if message_id > last_id:
+                    buffer.append(message_id, message)
+            self._rooms[room] = buffer
+            if least_recent:
+                self._rooms.move_to_end(room, last=False)
+            self._size += buffer.size
+            self._enforce_cap()
+
+    def append(self, room, message_id, message):
+        """
+        Record a newly stored message
+        Rooms that are not buffered are left alone until they are asked for.
+        """
+        with self._lock:
+            if room in self._loading:
+                self._loading[room].append((message_id, message))
+                return
+
+            buffer = self._rooms.get(room)
+            if buffer is None:
+                return
+            # Rooms with new messages are likely to be read soon
+            self._rooms.move_to_end(room)
+            self._size += buffer.append(message_id, message)
+            self._enforce_cap()
+
+    def page(self, room, limit, before=None, after=None):
+        """
+        Get a page of messages as in get_chat_messages(), oldest first
+        Returns None if the buffer cannot answer it exactly.
+        """
+        buffer = self._get_buffer(room)
+        if buffer is None:
+            return None
+
+        with self._lock:
+            messages = buffer.messages
+
+            if after is not None:
+                # Everything newer than after is buffered if the buffer
+                # starts at or before it
+                if not buffer.complete and (not messages or messages[0][0] > after):
+                    return None
+                return [message for message_id, message, _ in messages if message_id > after][:limit]
+
+            older = [message for message_id, message, _ in messages if before is None or message_id < before]
+            if len(older) < limit and not buffer.complete:
+                return None
+            return older[-limit:]
+
+    def stats(self):
+        """
+        Get the number of buffered rooms and messages and the memory they use
+        """
+        with self._lock:
+            return {
+                'rooms': len(self._rooms),
+                'messages': sum(len(buffer.messages) for buffer in self._rooms.values()),
+                'bytes': self._size
+            }
+
+    def _get_buffer(self, room):
+        """
+        Get the buffer of a room, loading it on first use
+        """
+        with self._lock:
+            buffer = self._rooms.get(room)
+            if buffer is not None:
+                self._rooms.move_to_end(room)
+                return buffer
+
+        if self._model is None:
+            return None
+        self.load_room(room)
+
+        with self._lock:
+            return self._rooms.get(room)
+
+    def _enforce_cap(self):
+        """
+        Evict rooms, least recently used first, until under the memory cap
+        Must be called with the lock held.
+        """
+        while self._size > self.max_bytes and self._rooms:
+            if len(self._rooms) > 1:
+                _, buffer = self._rooms.popitem(last=False)
+                self._size -= buffer.size
+                continue
+
+            # A single room over the cap keeps as many messages as fit
+            buffer = next(iter(self._rooms.values()))
+            if not buffer.messages:
+                break
+            self._size -= buffer.trim()
@@ -0,0 +1,148 @@
+"""
+FreeBox Response Cache Module
+Pre-encoded JSON responses for hot read endpoints, revalidated with ETags
+"""
+
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import request, current_app, Response
+
+from backend.assets import accepts_gzip
+from backend.compression import response_compressor
+
+# Memory charged for each entry on top of its body
+ENTRY_OVERHEAD = 256
+
+
+class ResponseCache:
+    """
+    Caches encoded JSON bodies by endpoint and query arguments.
+
+    Every entry belongs to a namespace, such as 'files' or one chat room.
+    Write paths call invalidate() on the namespaces they change, which
+    bumps a generation counter, so stale entries are never served and
+    fall out of the LRU on their own. Entries can also expire after a
+    number of seconds, for data that changes without a write.
+
+    Responses carry a strong ETag of the body and Cache-Control: no-cache,
+    so browsers revalidate each poll and get 304 with no body until the
+    data changes. The gzip encoding is made once and stored next to the
+    body, and sent with the weak form of the ETag. Total body size is
+    capped by evicting the least recently used entries.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._not_modified = 0
+        self._evictions = 0
+
+    def init_app(self, app):
+        """
+        Read the memory cap from the app config
+        """
+        self.max_bytes = app.config.setdefault('RESPONSE_CACHE_MAX_BYTES', 8 * 1024 * 1024)
+
+    def invalidate(self, *namespaces):
+        """
+        Drop every cached response in the given namespaces
+        """
+        with self._lock:
+            for namespace in namespaces:
+                self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+    def respond(self, namespace, build, max_age=None):
+        """
+        Serve the current request from the cache, or build and cache it
+        build() returns the data to encode as JSON, or a complete response
+        such as an error, which is returned as it is and not cached.
+        max_age limits how many seconds an entry is served.
+        """
+        key = (request.endpoint, namespace, tuple(sorted(request.args.items(multi=True))))
+        now = time.monotonic()
+
+        with self._lock:
+            generation = self._generations.get(namespace, 0)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation and (entry[1] is None or now < entry[1]):
+                self._entries.move_to_end(key)
+                self._hits += 1
+                body, etag, gzip_body = entry[2], entry[3], entry[5]
+            else:
+                entry = None
+                self._misses += 1
+
+        if entry is None:
+            data = build()
+            if isinstance(data, (Response, tuple)):
+                return data
+
+            # Encoded exactly as jsonify() would
+            body = current_app.json.response(data).get_data()
+            etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+            gzip_body = response_compressor.encode(body)
+            expires = None if max_age is None else now + max_age
+            self._store(key, namespace, generation, expires, body, etag, gzip_body)
+
+        if gzip_body is not None and accepts_gzip():
+            response = Response(gzip_body, mimetype='application/json')
+            response.headers['Content-Encoding'] = 'gzip'
+            response.set_etag(etag, weak=True)
+        else:
+            response = Response(body, mimetype='application/json')
+            response.set_etag(etag)
+        if gzip_body is not None:
+            response.vary.add('Accept-Encoding')
+        response.cache_control.no_cache = True
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            with self._lock:
+                self._not_modified += 1
+        return response
+
+    def stats(self):
+        """
+        Get the number of entries, their memory use and the hit counters
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'not_modified': self._not_modified,
+                'evictions': self._evictions
+            }
+
+    def _store(self, key, namespace, generation, expires, body, etag, gzip_body):
+        """
+        Cache a response unless its namespace changed while it was built
+        """
+        size = len(body) + len(gzip_body or b'') + ENTRY_OVERHEAD
+        with self._lock:
+            if self._generations.get(namespace, 0) != generation or size > self.max_bytes:
+                return
+
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[4]
+            self._entries[key] = (generation, expires, body, etag, size, gzip_body)
+            self._size += size
+
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted[4]
+                self._evictions += 1
+
+
+# Shared response cache, bound to the app in create_app()
+response_cache = ResponseCache()
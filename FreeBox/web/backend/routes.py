@@ -4,18 +4,42 @@ Contains route definitions for file uploads and downloads
 """
 
 import os
+import re
 import mimetypes
 import uuid
 import hashlib
-from flask import Blueprint, request, jsonify, send_file, current_app, abort
+from flask import Blueprint, request, jsonify, send_file, current_app, abort, Response
+from werkzeug.formparser import FormDataParser
 from werkzeug.utils import secure_filename
-from backend.database import add_file, get_file_by_id, get_file_by_filename, increment_download_count, delete_file, get_all_stats, get_file_by_hash
-from backend.app import socketio
-import psutil
+from backend.database import get_file_by_id, get_file_by_filename, increment_download_count, delete_file
+from backend.stats import stats_publisher
+from backend.chunked import upload_sessions
+from backend.blobs import blob_store
+from backend.downloads import send_stored_file, is_new_download
+from backend.preview import text_previewer
+from backend.thumbnails import thumbnail_cache
+from backend.metrics import metrics_sampler
+from backend.admission import upload_scheduler, UploadRejected
+from backend.filechanges import file_changes
 
 # Create a blueprint for upload-related routes
 uploads_bp = Blueprint('uploads', __name__)
 
+# Write buffer for streamed uploads, large enough to keep SD card writes efficient
+UPLOAD_BUFFER_SIZE = 1024 * 1024
+
+# Hex-encoded SHA-256 digest as sent by clients
+SHA256_PATTERN = re.compile(r'^[0-9a-fA-F]{64}$')
+
+# Browser cache lifetime for thumbnails, which never change
+THUMBNAIL_MAX_AGE = 365 * 24 * 60 * 60
+
+# Characters of a large text file shown by a preview download
+PREVIEW_TEXT_LENGTH = 1024 * 1024
+
+# Characters read per chunk of a streamed preview
+PREVIEW_CHUNK_LENGTH = 64 * 1024
+
 def calculate_file_hash(file_path):
     """Calculate SHA256 hash of a file"""
     hash_sha256 = hashlib.sha256()
@@ -24,9 +48,221 @@ def calculate_file_hash(file_path):
             hash_sha256.update(chunk)
     return hash_sha256.hexdigest()
 
+class HashingFileWriter:
+    """
+    Write-only file sink that hashes and counts bytes as they are written.
+    Used as the Werkzeug stream factory target so uploads are written to
+    storage once, with no second pass to compute the hash.
+    """
+
+    def __init__(self, path, buffer_size=UPLOAD_BUFFER_SIZE, reservation=None):
+        self.path = path
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._file = open(path, 'wb', buffering=buffer_size)
+        self._meter = upload_scheduler.meter(reservation)
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        written = self._file.write(data)
+        self._meter.wrote(self._file, len(data))
+        return written
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        # Werkzeug rewinds finished parts; the data is never read back
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+def parse_streaming_upload(storage_dir, reservation=None):
+    """
+    Parse the multipart request body incrementally, streaming file parts
+    straight into the storage directory.
+    File data consumes the given space reservation as it is written.
+    Returns the form fields, the uploaded files and every writer created.
+    """
+    writers = []
+    
+    def stream_factory(total_content_length, content_type, filename, content_length=None):
+        writer = HashingFileWriter(
+            os.path.join(storage_dir, f"temp_{uuid.uuid4().hex}"),
+            reservation=reservation
+        )
+        writers.append(writer)
+        return writer
+    
+    parser = FormDataParser(
+        stream_factory=stream_factory,
+        max_form_memory_size=request.max_form_memory_size,
+        max_content_length=request.max_content_length
+    )
+    
+    try:
+        _, form, files = parser.parse(
+            request.stream,
+            request.mimetype,
+            request.content_length,
+            request.mimetype_params
+        )
+    finally:
+        # Flush everything to disk before the files are renamed or removed
+        for writer in writers:
+            writer.close()
+    
+    return form, files, writers
+
+def make_unique_filename(original_filename):
+    """Generate a unique storage filename to prevent overwriting"""
+    filename_parts = os.path.splitext(original_filename)
+    return f"{filename_parts[0]}_{uuid.uuid4().hex[:8]}{filename_parts[1]}"
+
+def new_file_fields(original_filename, description=''):
+    """Build the metadata for a new file record from the current request"""
+    return {
+        # Unique name so downloads by filename never collide
+        'filename': make_unique_filename(original_filename),
+        'original_filename': original_filename,
+        'mime_type': mimetypes.guess_type(original_filename)[0] or 'application/octet-stream',
+        'uploader_ip': request.remote_addr,
+        'description': description
+    }
+
+def file_added_response(file_record, duplicate):
+    """
+    Notify clients about a new file record and return the JSON response
+    """
+    # Make the thumbnail in the background if the content does not have one
+    thumbnail_cache.submit(file_record, blob_store.path_for(file_record))
+    
+    # Send the new file to all clients
+    file_data = file_record.to_dict()
+    file_changes.record('added', file=file_data)
+    
+    # Update stats for all clients
+    stats_publisher.mark_dirty()
+    
+    response = {
+        'success': True,
+        'file': file_data,
+        'duplicate': duplicate
+    }
+    if duplicate:
+        response['message'] = 'File content already exists, no extra storage was used'
+    
+    return jsonify(response)
+
+def upload_rejected_response(error):
+    """
+    Build the response for an upload refused by the upload scheduler
+    """
+    response = jsonify({'success': False, 'error': str(error)})
+    response.status_code = error.status
+    if error.retry_after is not None:
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def store_uploaded_file(temp_file_path, original_filename, file_size, file_hash, description=''):
+    """
+    Register a fully received upload.
+    The data is moved into the blob store, or the temporary file is removed
+    if a blob with the same hash already exists. Either way a new file record
+    keeps the uploader's filename and description. Returns the JSON response.
+    """
+    file_record, duplicate = blob_store.store(
+        temp_file_path,
+        file_hash,
+        file_size,
+        **new_file_fields(original_filename, description)
+    )
+    
+    return file_added_response(file_record, duplicate)
+
 @uploads_bp.route('/api/upload', methods=['POST'])
 def upload_file():
     """Handle file uploads"""
+    # Get the storage directory the app was created with
+    storage_dir = blob_store.storage_dir
+    
+    # Ensure storage directory exists
+    if not os.path.exists(storage_dir):
+        try:
+            os.makedirs(storage_dir)
+        except Exception as e:
+            return jsonify({'success': False, 'error': f'Failed to create storage directory: {str(e)}'}), 500
+    
+    # Wait for an upload slot before any of the body is read
+    try:
+        slot = upload_scheduler.admit(request.remote_addr, request.content_length or 0)
+    except UploadRejected as e:
+        return upload_rejected_response(e)
+    
+    with slot:
+        if current_app.config.get('STREAMING_UPLOADS', True):
+            return upload_file_streaming(storage_dir, slot.reservation)
+        
+        return upload_file_spooled(storage_dir)
+
+def upload_file_streaming(storage_dir, reservation=None):
+    """
+    Single-pass upload: the body is parsed as it arrives and file data is
+    hashed while it is written, so each byte touches the disk once
+    """
+    writers = []
+    try:
+        form, files, writers = parse_streaming_upload(storage_dir, reservation)
+        
+        if 'file' not in files:
+            return jsonify({'success': False, 'error': 'No file part'}), 400
+        
+        file = files['file']
+        
+        if file.filename == '':
+            return jsonify({'success': False, 'error': 'No selected file'}), 400
+        
+        # Get optional description and custom filename
+        description = form.get('description', '')
+        custom_filename = form.get('custom_filename', '')
+        
+        # If a custom filename was provided, use it as the original filename but secure it
+        original_filename = secure_filename(custom_filename or file.filename)
+        
+        writer = file.stream
+        return store_uploaded_file(
+            writer.path,
+            original_filename,
+            writer.size,
+            writer.hexdigest(),
+            description
+        )
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        # Remove temporary files that were not moved into place
+        for writer in writers:
+            if os.path.exists(writer.path):
+                try:
+                    os.remove(writer.path)
+                except:
+                    pass
+
+def upload_file_spooled(storage_dir):
+    """
+    Legacy upload: Werkzeug spools the body, the file is saved to a
+    temporary path and then read back to compute its hash
+    """
     if 'file' not in request.files:
         return jsonify({'success': False, 'error': 'No file part'}), 400
     
@@ -48,22 +284,8 @@ def upload_file():
     if custom_filename:
         original_filename = secure_filename(custom_filename)
     
-    filename_parts = os.path.splitext(original_filename)
-    unique_filename = f"{filename_parts[0]}_{uuid.uuid4().hex[:8]}{filename_parts[1]}"
-    
-    # Get the storage directory
-    storage_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'storage')
-    
-    # Ensure storage directory exists
-    if not os.path.exists(storage_dir):
-        try:
-            os.makedirs(storage_dir)
-        except Exception as e:
-            return jsonify({'success': False, 'error': f'Failed to create storage directory: {str(e)}'}), 500
-    
     # Temporary file path to calculate hash before final storage
-    temp_file_path = os.path.join(storage_dir, f"temp_{unique_filename}")
-    file_path = os.path.join(storage_dir, unique_filename)
+    temp_file_path = os.path.join(storage_dir, f"temp_{make_unique_filename(original_filename)}")
     
     try:
         # Save to temporary location first
@@ -71,50 +293,9 @@ def upload_file():
         
         # Calculate file hash to check for duplicates
         file_hash = calculate_file_hash(temp_file_path)
-        
-        # Get file info
         file_size = os.path.getsize(temp_file_path)
-        file_type = mimetypes.guess_type(original_filename)[0] or 'application/octet-stream'
-        
-        # Check if file with this hash already exists
-        existing_file = get_file_by_hash(file_hash)
-        if existing_file:
-            # Remove the temporary file since it's a duplicate
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
-                
-            return jsonify({
-                'success': True,
-                'file': existing_file.to_dict(),
-                'message': 'File already exists in the database',
-                'duplicate': True
-            })
-        
-        # Move from temp to final location
-        os.rename(temp_file_path, file_path)
-        
-        # Add to database with hash
-        file_record = add_file(
-            filename=unique_filename,
-            original_filename=original_filename,
-            size=file_size,
-            mime_type=file_type,
-            uploader_ip=request.remote_addr,
-            description=description,
-            file_hash=file_hash
-        )
-        
-        # Notify all clients that a new file was uploaded
-        socketio.emit('file_list_updated', {})
         
-        # Update stats for all clients
-        socketio.emit('stats_updated', get_all_stats())
-        
-        return jsonify({
-            'success': True,
-            'file': file_record.to_dict(),
-            'duplicate': False
-        })
+        return store_uploaded_file(temp_file_path, original_filename, file_size, file_hash, description)
     except Exception as e:
         # Remove any temporary files
         if os.path.exists(temp_file_path):
@@ -123,15 +304,198 @@ def upload_file():
             except:
                 pass
                 
-        # Remove the final file if it was created but failed to add to database
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except:
-                pass
-                
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@uploads_bp.route('/api/uploads', methods=['POST'])
+def create_upload_session():
+    """Start a resumable chunked upload"""
+    data = request.get_json(silent=True)
+    
+    if not data:
+        return jsonify({'success': False, 'error': 'No data provided'}), 400
+    
+    filename = data.get('filename', '')
+    size = data.get('size')
+    
+    if not filename:
+        return jsonify({'success': False, 'error': 'No filename provided'}), 400
+    
+    if not isinstance(size, int) or isinstance(size, bool) or size < 0:
+        return jsonify({'success': False, 'error': 'Invalid file size'}), 400
+    
+    # If a custom filename was provided, use it as the original filename but secure it
+    original_filename = secure_filename(data.get('custom_filename') or filename)
+    
+    if not original_filename:
+        return jsonify({'success': False, 'error': 'Invalid filename'}), 400
+    
+    # Optional SHA-256 computed by the client, used to skip duplicate transfers
+    file_hash = data.get('sha256')
+    if file_hash is not None:
+        if not isinstance(file_hash, str) or not SHA256_PATTERN.match(file_hash):
+            return jsonify({'success': False, 'error': 'Invalid SHA-256 hash'}), 400
+        file_hash = file_hash.lower()
+        
+        # The data is already stored, so no bytes need to be sent
+        file_record = blob_store.link(
+            file_hash,
+            size,
+            **new_file_fields(original_filename, data.get('description', ''))
+        )
+        if file_record:
+            return file_added_response(file_record, True)
+    
+    # Refuse uploads that would fill the disk before any data is sent, and
+    # hold the space for the session since its part file is sparse
+    try:
+        reservation = upload_scheduler.reserve(size)
+    except UploadRejected as e:
+        return upload_rejected_response(e)
+    
+    try:
+        session = upload_sessions.create(original_filename, size, data.get('description', ''), file_hash, reservation)
+    except Exception as e:
+        reservation.release()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    response = session.to_dict()
+    response.update({
+        'success': True,
+        'duplicate': False,
+        'chunk_size': upload_sessions.chunk_size,
+        'max_chunk_size': upload_sessions.max_chunk_size,
+        'session_ttl': upload_sessions.session_ttl
+    })
+    return jsonify(response), 201
+
+@uploads_bp.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload_session(upload_id):
+    """Return the byte ranges received so far for a chunked upload"""
+    session = upload_sessions.get(upload_id)
+    
+    if not session:
+        return jsonify({'success': False, 'error': 'Upload not found'}), 404
+    
+    response = session.to_dict()
+    response['success'] = True
+    return jsonify(response)
+
+@uploads_bp.route('/api/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Write one chunk of a chunked upload at the given offset"""
+    session = upload_sessions.get(upload_id)
+    
+    if not session:
+        return jsonify({'success': False, 'error': 'Upload not found'}), 404
+    
+    offset = request.args.get('offset', type=int)
+    length = request.content_length
+    
+    if offset is None:
+        return jsonify({'success': False, 'error': 'No offset provided'}), 400
+    
+    if length is None:
+        return jsonify({'success': False, 'error': 'Content-Length required'}), 411
+    
+    # Wait for an upload slot before the chunk is read, the space was
+    # reserved when the session was created
+    try:
+        slot = upload_scheduler.admit(request.remote_addr)
+    except UploadRejected as e:
+        return upload_rejected_response(e)
+    
+    try:
+        with slot:
+            upload_sessions.write_chunk(session, offset, length, request.stream)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    return jsonify({
+        'success': True,
+        'received': session.received,
+        'complete': session.complete
+    })
+
+@uploads_bp.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def finalize_upload_session(upload_id):
+    """Assemble a fully received chunked upload into a stored file"""
+    session = upload_sessions.get(upload_id)
+    
+    if not session:
+        return jsonify({'success': False, 'error': 'Upload not found'}), 404
+    
+    # Optional SHA-256 the client computed while the chunks were sent
+    data = request.get_json(silent=True) or {}
+    declared_hash = data.get('sha256')
+    if declared_hash is not None:
+        if not isinstance(declared_hash, str) or not SHA256_PATTERN.match(declared_hash):
+            return jsonify({'success': False, 'error': 'Invalid SHA-256 hash'}), 400
+        declared_hash = declared_hash.lower()
+        if session.expected_hash and declared_hash != session.expected_hash:
+            return jsonify({'success': False, 'error': 'SHA-256 hash does not match the one the upload was started with'}), 400
+    
+    if not upload_sessions.begin_finalize(session):
+        response = session.to_dict()
+        response.update({'success': False, 'error': 'Upload is incomplete'})
+        return jsonify(response), 409
+    
+    if declared_hash is not None:
+        session.expected_hash = declared_hash
+    
+    try:
+        file_hash = upload_sessions.finish_hash(session)
+        
+        # The declared hash only short-circuits duplicates, the data decides
+        if session.expected_hash and file_hash != session.expected_hash:
+            return jsonify({
+                'success': False,
+                'error': 'Uploaded data does not match the declared SHA-256 hash'
+            }), 422
+        
+        return store_uploaded_file(
+            session.path,
+            session.filename,
+            session.size,
+            file_hash,
+            session.description
+        )
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        # The part file is gone if it was stored or was a duplicate
+        upload_sessions.discard(session)
+
+@uploads_bp.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def cancel_upload_session(upload_id):
+    """Abandon a chunked upload and remove its data"""
+    session = upload_sessions.get(upload_id)
+    
+    if not session:
+        return jsonify({'success': False, 'error': 'Upload not found'}), 404
+    
+    upload_sessions.discard(session)
+    return jsonify({'success': True})
+
+def stream_text_preview(file_path):
+    """
+    Yield the first PREVIEW_TEXT_LENGTH characters of a text file in chunks
+    The preview is never held in memory whole, so it can be compressed
+    and sent as it is read.
+    """
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        remaining = PREVIEW_TEXT_LENGTH
+        while remaining > 0:
+            content = f.read(min(PREVIEW_CHUNK_LENGTH, remaining))
+            if not content:
+                return
+            remaining -= len(content)
+            yield content.encode('utf-8')
+        
+        if f.read(1):
+            yield "\n\n... (file truncated for preview) ...".encode('utf-8')
+
 @uploads_bp.route('/api/download/<int:file_id>', methods=['GET'])
 def download_file_by_id(file_id):
     """Download a file from storage by ID"""
@@ -140,8 +504,7 @@ def download_file_by_id(file_id):
     if not file_record:
         abort(404)
     
-    storage_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'storage')
-    file_path = os.path.join(storage_dir, file_record.filename)
+    file_path = blob_store.path_for(file_record)
     
     if not os.path.exists(file_path):
         abort(404)
@@ -149,55 +512,78 @@ def download_file_by_id(file_id):
     # Check if this is a preview request
     is_preview = request.args.get('preview', 'false').lower() == 'true'
     
-    if not is_preview:
-        # Only increment download count for actual downloads, not previews
+    # Only count actual downloads, not previews, and only once per logical
+    # download rather than once per range request
+    if not is_preview and is_new_download(file_record.file_hash):
         increment_download_count(file_id)
         
-        # Emit event to notify clients about the download
-        file_data = file_record.to_dict()
-        socketio.emit('file_downloaded', {'file': file_data})
+        # Send the new download count to all clients
+        file_changes.record('updated', file=file_record.to_dict())
         
         # Update stats for all clients
-        socketio.emit('stats_updated', get_all_stats())
+        stats_publisher.mark_dirty()
     
     # Determine content type
     content_type = file_record.mime_type or mimetypes.guess_type(file_record.original_filename)[0] or 'application/octet-stream'
     
-    # For video files, ensure proper streaming capabilities
-    is_video = content_type.startswith('video/')
-    
     # For previews of large text files, we might want to read only the first part
     # This is especially important for very large text files
-    if is_preview and content_type.startswith('text/') and os.path.getsize(file_path) > 1024 * 1024:  # If larger than 1MB
-        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-            content = f.read(1024 * 1024)  # Read first 1MB
-            
-            if len(content) == 1024 * 1024:
-                content += "\n\n... (file truncated for preview) ..."
-        
-        return content, 200, {'Content-Type': content_type}
-    
-    # For video files in preview mode, we want to enable partial content support for streaming
-    if is_preview and is_video:
-        response = send_file(
-            file_path,
-            mimetype=content_type,
-            as_attachment=False,  # Never force download for video preview
-            download_name=file_record.original_filename,
-            conditional=True  # Enable partial content support
-        )
-        # Add headers for proper video streaming
-        response.headers.add('Accept-Ranges', 'bytes')
-        return response
+    if is_preview and content_type.startswith('text/') and os.path.getsize(file_path) > PREVIEW_TEXT_LENGTH:
+        return Response(stream_text_preview(file_path), mimetype=content_type)
     
-    # Default handling for other file types
-    return send_file(
+    # Every file type supports ranges, so video can stream and interrupted
+    # downloads can resume
+    return send_stored_file(
         file_path,
-        mimetype=content_type,
-        as_attachment=not is_preview,  # Don't force download in preview mode
-        download_name=file_record.original_filename
+        file_record,
+        content_type,
+        as_attachment=not is_preview  # Don't force download in preview mode
     )
 
+@uploads_bp.route('/api/files/<int:file_id>/text', methods=['GET'])
+def preview_text(file_id):
+    """Return one page of a text file for the viewer"""
+    file_record = get_file_by_id(file_id)
+    
+    if not file_record:
+        return jsonify({'success': False, 'error': 'File not found'}), 404
+    
+    file_path = blob_store.path_for(file_record)
+    
+    if not os.path.exists(file_path):
+        return jsonify({'success': False, 'error': 'File not found'}), 404
+    
+    offset = request.args.get('offset', 0, type=int)
+    length = request.args.get('length', None, type=int)
+    
+    if length is not None and length <= 0:
+        return jsonify({'success': False, 'error': 'Length must be positive'}), 400
+    
+    try:
+        page = text_previewer.page(file_path, file_record.file_hash or file_path, offset, length)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    response = dict(page)
+    response['success'] = True
+    return jsonify(response)
+
+@uploads_bp.route('/api/thumbnails/<file_hash>', methods=['GET'])
+def get_thumbnail(file_hash):
+    """Serve a cached thumbnail"""
+    if not SHA256_PATTERN.match(file_hash):
+        abort(404)
+    
+    thumbnail_path = thumbnail_cache.path_for_hash(file_hash.lower())
+    
+    if not os.path.exists(thumbnail_path):
+        abort(404)
+    
+    # Thumbnails are addressed by content hash, so they never change
+    response = send_file(thumbnail_path, mimetype='image/jpeg', max_age=THUMBNAIL_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
 @uploads_bp.route('/api/download/filename/<path:filename>', methods=['GET'])
 def download_file_by_name(filename):
     """Download a file from storage by filename"""
@@ -207,32 +593,26 @@ def download_file_by_name(filename):
     if not file_record:
         abort(404)
     
-    # Before calling download_file_by_id, get the updated file record after incrementing download count
-    increment_download_count(file_record.id)
-    updated_file = get_file_by_id(file_record.id)
-    
-    # Emit event to notify clients about the download
-    socketio.emit('file_downloaded', {'file': updated_file.to_dict()})
-    
-    # Update stats for all clients
-    socketio.emit('stats_updated', get_all_stats())
-    
-    # Use the existing route but skip the increment since we already did it
-    storage_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'storage')
-    file_path = os.path.join(storage_dir, file_record.filename)
+    file_path = blob_store.path_for(file_record)
     
     if not os.path.exists(file_path):
         abort(404)
     
+    # Count once per logical download rather than once per range request
+    if is_new_download(file_record.file_hash):
+        increment_download_count(file_record.id)
+        updated_file = get_file_by_id(file_record.id)
+        
+        # Send the new download count to all clients
+        file_changes.record('updated', file=updated_file.to_dict())
+        
+        # Update stats for all clients
+        stats_publisher.mark_dirty()
+    
     # Determine content type
     content_type = file_record.mime_type or mimetypes.guess_type(file_record.original_filename)[0] or 'application/octet-stream'
     
-    return send_file(
-        file_path,
-        mimetype=content_type,
-        as_attachment=True,
-        download_name=file_record.original_filename
-    )
+    return send_stored_file(file_path, file_record, content_type, as_attachment=True)
 
 @uploads_bp.route('/api/files/<int:file_id>', methods=['DELETE'])
 def delete_file_route(file_id):
@@ -242,21 +622,14 @@ def delete_file_route(file_id):
     if not file_record:
         return jsonify({'success': False, 'error': 'File not found'}), 404
     
-    storage_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'storage')
-    file_path = os.path.join(storage_dir, file_record.filename)
-    
     try:
-        # Delete from filesystem if it exists
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        
-        # Delete from database
+        # Only the metadata is removed, the blob is collected once unreferenced
         if delete_file(file_id):
-            # Notify all clients that the file list has changed
-            socketio.emit('file_list_updated', {})
+            # Tell all clients the file is gone
+            file_changes.record('deleted', file_id=file_id)
             
             # Update stats for all clients
-            socketio.emit('stats_updated', get_all_stats())
+            stats_publisher.mark_dirty()
             
             return jsonify({'success': True})
         else:
@@ -268,12 +641,13 @@ def delete_file_route(file_id):
 def server_status():
     """Return server status information that can help clients optimize uploads"""
     try:
-        # Get CPU and memory usage data
-        cpu_percent = psutil.cpu_percent(interval=0.5)
-        memory = psutil.virtual_memory()
+        # Get CPU and memory usage from the latest sample
+        system = metrics_sampler.latest()
+        cpu_percent = system['cpu_percent']
+        memory_percent = system['memory_percent']
         
         # Calculate available memory percentage (100 - used_percent)
-        available_memory_percent = 100 - memory.percent
+        available_memory_percent = 100 - memory_percent
         
         # Based on server load, suggest the optimal number of concurrent uploads
         # Prioritize CPU availability since it's typically the bottleneck for file processing
@@ -296,18 +670,23 @@ def server_status():
         elif available_memory_percent < 40:
             # Low memory - reduce concurrent uploads
             recommended_concurrent = max(1, recommended_concurrent // 2)
+        
+        # More uploads than the scheduler admits per client would only queue
+        upload_slots = upload_scheduler.stats()
+        recommended_concurrent = min(recommended_concurrent, upload_slots['per_client_limit'])
             
         return jsonify({
             'success': True,
             'server_load': {
                 'cpu_percent': cpu_percent,
-                'memory_percent': memory.percent,
+                'memory_percent': memory_percent,
                 'available_memory_percent': available_memory_percent
             },
-            'recommended_concurrent_uploads': recommended_concurrent
+            'recommended_concurrent_uploads': recommended_concurrent,
+            'upload_slots': upload_slots
         })
     except Exception as e:
-        # If there's an error with psutil, default to conservative values
+        # If there's an error sampling the system, default to conservative values
         return jsonify({
             'success': True,
             'server_load': {
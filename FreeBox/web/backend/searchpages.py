@@ -0,0 +1,68 @@
+"""
+FreeBox Search Pages Module
+Ranked search results pinned in memory so later pages stay consistent
+"""
+
+import uuid
+import threading
+from collections import OrderedDict
+
+
+class SearchSnapshot:
+    """
+    The ranked file ids of one search, best match first
+    truncated is True when the search matched more files than were kept.
+    """
+
+    def __init__(self, ids, truncated):
+        self.ids = ids
+        self.truncated = truncated
+
+
+class SearchSnapshots:
+    """
+    Keeps the ranking of recent searches for paging through them.
+
+    bm25 scores depend on statistics of the whole index, so adding or
+    deleting any file shifts every rank. A cursor holding the last rank
+    would then skip or repeat results. Instead, the first page of a
+    search stores the ids of its best max_results matches under a token,
+    and later pages are sliced from that list without scoring again.
+    Files added after the first page do not appear in later pages, and
+    deleted ones are dropped when the page is loaded. Only the most
+    recent max_snapshots searches are kept.
+    """
+
+    def __init__(self, max_snapshots=64, max_results=1000):
+        self.max_snapshots = max_snapshots
+        self.max_results = max_results
+        self._lock = threading.Lock()
+        self._snapshots = OrderedDict()
+
+    def init_app(self, app):
+        """
+        Read the limits from the app config
+        """
+        self.max_snapshots = app.config.setdefault('SEARCH_SNAPSHOTS', 64)
+        self.max_results = app.config.setdefault('SEARCH_SNAPSHOT_SIZE', 1000)
+
+    def store(self, ids, truncated):
+        """
+        Keep a ranking and return the token that finds it again
+        """
+        token = uuid.uuid4().hex[:16]
+        with self._lock:
+            self._snapshots[token] = SearchSnapshot(ids, truncated)
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+        return token
+
+    def get(self, token):
+        """
+        Get a stored ranking, or None if it was evicted or never existed
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(token)
+            if snapshot is not None:
+                self._snapshots.move_to_end(token)
+            return snapshot
@@ -0,0 +1,163 @@
+"""
+FreeBox Sendfile Module
+Zero-copy file responses that cooperate with the eventlet hub
+"""
+
+import os
+import eventlet
+import eventlet.wsgi
+from eventlet.hubs import trampoline
+
+# Environ keys set by SendfileHttpProtocol: the client socket, and a
+# callable that makes the server write each body chunk as soon as it is
+# yielded
+SOCKET_ENVIRON_KEY = 'freebox.socket'
+UNBUFFER_ENVIRON_KEY = 'freebox.unbuffer'
+
+# Largest single sendfile() call, so one download cannot hog the hub
+SENDFILE_CHUNK_SIZE = 1024 * 1024
+
+# Read size for the fallback path and for the first bytes of a response
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class SendfileHttpProtocol(eventlet.wsgi.HttpProtocol):
+    """
+    eventlet HTTP protocol that exposes the client socket to the app
+    Pass it to socketio.run(..., protocol=SendfileHttpProtocol).
+    """
+
+    def get_environ(self):
+        environ = super().get_environ()
+        environ[SOCKET_ENVIRON_KEY] = self.connection
+
+        # Middleware may hand the app a copy of the environ, but the server
+        # reads its write buffering setting from this one
+        def unbuffer():
+            environ['eventlet.minimum_write_chunk_size'] = 0
+        environ[UNBUFFER_ENVIRON_KEY] = unbuffer
+
+        return environ
+
+
+def sendfile_socket(environ):
+    """
+    Get the client socket if the body can be sent with os.sendfile()
+    Returns None for other servers, TLS connections and HEAD requests.
+    Must be called before the response is returned to the server.
+    """
+    sock = environ.get(SOCKET_ENVIRON_KEY)
+    if sock is None or not hasattr(os, 'sendfile') or environ.get('REQUEST_METHOD') == 'HEAD':
+        return None
+    if environ.get('wsgi.url_scheme') == 'https':
+        return None
+
+    # Write every chunk the app yields straight away, so the headers are on
+    # the wire before the body is handed to sendfile()
+    environ[UNBUFFER_ENVIRON_KEY]()
+    return sock
+
+
+class FileBody:
+    """
+    WSGI response body made of file ranges, each optionally preceded by a
+    small header such as a multipart boundary.
+
+    When the client socket is available the ranges are sent with
+    os.sendfile(), so file data never passes through Python. The socket is
+    non-blocking under eventlet, so a full send buffer parks this green
+    thread on the hub instead of blocking the process. Otherwise the file
+    is read and yielded in chunks like any other body. Given a bandwidth
+    stream, every piece of file data waits for its turn first.
+    """
+
+    def __init__(self, file_path, parts, trailer=b'', sock=None, stream=None):
+        self.file_path = file_path
+        self.parts = parts
+        self.trailer = trailer
+        self.sock = sock
+        self.stream = stream
+        self._file = None
+
+    def __iter__(self):
+        self._file = open(self.file_path, 'rb')
+        if self.stream is not None:
+            self.stream.open()
+        headers_sent = False
+
+        for prefix, start, stop in self.parts:
+            if prefix:
+                yield prefix
+                headers_sent = True
+
+            if self.sock is None:
+                yield from self._read(start, stop)
+                continue
+
+            if not headers_sent and start < stop:
+                # The server only sends the status line and headers together
+                # with the first body bytes, so send a small piece normally
+                first = min(stop, start + READ_CHUNK_SIZE)
+                yield from self._read(start, first)
+                headers_sent = True
+                start = first
+
+            self._sendfile(start, stop)
+
+        if self.trailer:
+            yield self.trailer
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        if self.stream is not None:
+            self.stream.close()
+
+    def _allowance(self, size):
+        """
+        Wait until up to size bytes may be sent and return how many
+        """
+        if self.stream is None:
+            return size
+        return self.stream.acquire(size)
+
+    def _read(self, start, stop):
+        """
+        Yield [start, stop) of the file in chunks
+        """
+        self._file.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            data = self._file.read(self._allowance(min(READ_CHUNK_SIZE, remaining)))
+            if not data:
+                raise IOError('File ended before the response was complete')
+            remaining -= len(data)
+            yield data
+
+    def _sendfile(self, start, stop):
+        """
+        Send [start, stop) of the file straight from the page cache
+        """
+        sock_fd = self.sock.fileno()
+        file_fd = self._file.fileno()
+        timeout = self.sock.gettimeout()
+        offset = start
+        allowed = 0
+
+        while offset < stop:
+            if not allowed:
+                allowed = self._allowance(min(SENDFILE_CHUNK_SIZE, stop - offset))
+
+            try:
+                sent = os.sendfile(sock_fd, file_fd, offset, allowed)
+            except BlockingIOError:
+                trampoline(sock_fd, write=True, timeout=timeout)
+                continue
+
+            if sent == 0:
+                raise IOError('File ended before the response was complete')
+            offset += sent
+            allowed -= sent
+
+            # Give other green threads a turn between chunks
+            eventlet.sleep(0)
@@ -0,0 +1,138 @@
+"""
+FreeBox Stats Module
+Coalesces stats updates into throttled, cached broadcasts
+"""
+
+import time
+import datetime
+import threading
+
+from backend.database import get_all_stats, SERVER_START_TIME
+
+
+class StatsPublisher:
+    """
+    Keeps a cached stats snapshot and broadcasts it to all clients.
+
+    Write paths call mark_dirty() instead of computing stats themselves.
+    The snapshot is recomputed at most once per interval and every burst of
+    events results in a single 'stats_updated' broadcast.
+    """
+
+    def __init__(self, interval_ms=1000):
+        self.interval = interval_ms / 1000.0
+        self._app = None
+        self._socketio = None
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._snapshot_time = 0.0
+        self._dirty = True
+        self._scheduled = False
+        self._last_broadcast = 0.0
+
+    def init_app(self, app, socketio):
+        """
+        Bind the publisher to the Flask app and SocketIO server
+        """
+        self._app = app
+        self._socketio = socketio
+        self.interval = app.config.setdefault('STATS_BROADCAST_INTERVAL_MS', 1000) / 1000.0
+
+    def mark_dirty(self):
+        """
+        Flag the stats as changed and schedule a coalesced broadcast
+        """
+        with self._lock:
+            self._dirty = True
+        self.schedule_broadcast()
+
+    def schedule_broadcast(self):
+        """
+        Schedule a broadcast of the current snapshot unless one is pending
+        """
+        with self._lock:
+            if self._scheduled or self._socketio is None:
+                return
+            self._scheduled = True
+        self._socketio.start_background_task(self._broadcast_later)
+
+    def get_snapshot(self):
+        """
+        Return the cached stats snapshot, recomputing it if it is stale
+        """
+        with self._lock:
+            needs_refresh = self._snapshot is None or (
+                self._dirty and time.monotonic() - self._snapshot_time >= self.interval
+            )
+
+        if needs_refresh:
+            snapshot = self._refresh()
+        else:
+            snapshot = self._snapshot
+
+        return self._with_live_fields(snapshot)
+
+    def _refresh(self):
+        """
+        Recompute the snapshot from the database
+        """
+        with self._lock:
+            # Clear the flag first so changes made while computing re-dirty it
+            self._dirty = False
+
+        with self._app.app_context():
+            snapshot = get_all_stats()
+
+        with self._lock:
+            self._snapshot = snapshot
+            self._snapshot_time = time.monotonic()
+
+        return snapshot
+
+    def _broadcast_later(self):
+        """
+        Background task that waits out the throttle window and broadcasts
+        """
+        with self._lock:
+            ready_at = self._last_broadcast + self.interval
+            if self._dirty:
+                # get_snapshot() only recomputes a snapshot once it is interval
+                # old, for example after /api/stats refreshed it just now
+                ready_at = max(ready_at, self._snapshot_time + self.interval)
+
+        delay = ready_at - time.monotonic()
+        if delay > 0:
+            self._socketio.sleep(delay)
+
+        # Allow the next event to schedule another broadcast
+        with self._lock:
+            self._scheduled = False
+
+        try:
+            snapshot = self.get_snapshot()
+            self._socketio.emit('stats_updated', snapshot)
+        except Exception as e:
+            print(f"Error broadcasting stats: {e}")
+        finally:
+            self._last_broadcast = time.monotonic()
+
+        # A change that arrived while waiting may have missed this snapshot
+        with self._lock:
+            dirty = self._dirty
+        if dirty:
+            self.schedule_broadcast()
+
+    @staticmethod
+    def _with_live_fields(snapshot):
+        """
+        Copy a snapshot and refresh the fields that change with time alone
+        """
+        snapshot = dict(snapshot)
+        now = datetime.datetime.utcnow()
+        snapshot['uptime_seconds'] = int((now - SERVER_START_TIME).total_seconds())
+        snapshot['timestamp'] = now.timestamp()
+        return snapshot
+
+
+# Shared publisher instance, bound to the app in create_app()
+stats_publisher = StatsPublisher()
@@ -0,0 +1,207 @@
+"""
+FreeBox Thumbnails Module
+Background generation and caching of thumbnails for the file list
+"""
+
+import os
+import queue
+import shutil
+import subprocess
+import threading
+
+from backend.database import get_blobs_without_thumbnail, set_blob_thumbnail
+from backend.offload import run_blocking
+
+# Directory inside storage that holds the thumbnails
+THUMBNAILS_DIR = 'thumbnails'
+
+# Generators by MIME type prefix, tried in registration order
+_generators = []
+
+
+def register_generator(mime_prefix, generator):
+    """
+    Register a thumbnail generator for MIME types starting with mime_prefix
+    A generator is called as generator(source_path, dest_path, size) and
+    writes a JPEG no larger than size x size pixels to dest_path.
+    """
+    _generators.append((mime_prefix, generator))
+
+
+def find_generator(mime_type):
+    """
+    Get the first generator registered for a MIME type, or None
+    """
+    for mime_prefix, generator in _generators:
+        if mime_type and mime_type.startswith(mime_prefix):
+            return generator
+    return None
+
+
+def pillow_thumbnail(source_path, dest_path, size):
+    """
+    Downscale an image with Pillow, honouring its EXIF orientation
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as image:
+        # Let JPEG decoding skip straight to a nearby scale
+        image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        image.convert('RGB').save(dest_path, 'JPEG', quality=80, optimize=True)
+
+
+def ffmpeg_poster_frame(source_path, dest_path, size):
+    """
+    Grab a poster frame from a video with ffmpeg
+    """
+    subprocess.run(
+        [
+            'ffmpeg', '-v', 'error', '-y',
+            '-ss', '1', '-i', source_path,
+            '-frames:v', '1',
+            '-vf', f'scale={size}:{size}:force_original_aspect_ratio=decrease',
+            '-f', 'image2', '-c:v', 'mjpeg',
+            dest_path
+        ],
+        check=True,
+        timeout=60,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+
+try:
+    import PIL  # noqa: F401
+    register_generator('image/', pillow_thumbnail)
+except ImportError:
+    print("Pillow is not installed, image thumbnails are disabled")
+
+if shutil.which('ffmpeg'):
+    register_generator('video/', ffmpeg_poster_frame)
+
+
+class ThumbnailCache:
+    """
+    On-disk thumbnail cache keyed by file hash.
+
+    New files are queued and a small pool of workers generates their
+    thumbnails in the background. Since thumbnails belong to the content,
+    every file sharing a blob shares its thumbnail, and the thumbnail is
+    evicted when the blob store collects the blob.
+    """
+
+    def __init__(self, workers=2, size=256):
+        self.workers = workers
+        self.size = size
+        self.storage_dir = None
+        self._app = None
+        self._socketio = None
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._threads = []
+
+    def init_app(self, app, socketio, storage_dir, blob_store):
+        """
+        Start the workers and queue thumbnails missing from earlier runs
+        """
+        self._app = app
+        self._socketio = socketio
+        self.storage_dir = storage_dir
+        self.workers = app.config.setdefault('THUMBNAIL_WORKERS', 2)
+        self.size = app.config.setdefault('THUMBNAIL_SIZE', 256)
+
+        blob_store.add_collect_listener(self.evict)
+
+        if not self._threads:
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'thumbnails-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+        with app.app_context():
+            for file_hash, mime_type in get_blobs_without_thumbnail():
+                self._enqueue(file_hash, mime_type, blob_store.path_for_hash(file_hash))
+
+    def path_for_hash(self, file_hash):
+        """
+        Get the path of the thumbnail for a file hash
+        """
+        return os.path.join(self.storage_dir, THUMBNAILS_DIR, file_hash[:2], f"{file_hash}.jpg")
+
+    def submit(self, file_record, source_path):
+        """
+        Queue a thumbnail for a file unless it has one or cannot have one
+        """
+        if file_record.blob is None or file_record.blob.has_thumbnail:
+            return False
+        return self._enqueue(file_record.file_hash, file_record.mime_type, source_path)
+
+    def evict(self, file_hash):
+        """
+        Remove the thumbnail of content that no longer exists
+        """
+        try:
+            os.remove(self.path_for_hash(file_hash))
+        except FileNotFoundError:
+            pass
+
+    def _enqueue(self, file_hash, mime_type, source_path):
+        """
+        Queue a job if a generator handles the type and none is pending
+        """
+        generator = find_generator(mime_type)
+        if generator is None:
+            return False
+
+        with self._lock:
+            if file_hash in self._pending:
+                return False
+            self._pending.add(file_hash)
+
+        self._queue.put((file_hash, generator, source_path))
+        return True
+
+    def _generate(self, file_hash, generator, source_path):
+        """
+        Write a thumbnail to a temporary path and move it into place
+        """
+        dest_path = self.path_for_hash(file_hash)
+        temp_path = f"{dest_path}.tmp"
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        try:
+            run_blocking(generator, source_path, temp_path, self.size)
+            os.replace(temp_path, dest_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _run(self):
+        """
+        Worker loop run by each background thread
+        """
+        while True:
+            file_hash, generator, source_path = self._queue.get()
+            try:
+                self._generate(file_hash, generator, source_path)
+                with self._app.app_context():
+                    stored = set_blob_thumbnail(file_hash)
+                if not stored:
+                    # The blob was collected while its thumbnail was made
+                    self.evict(file_hash)
+                    continue
+                self._socketio.emit('thumbnail_ready', {
+                    'file_hash': file_hash,
+                    'thumbnail_url': f'/api/thumbnails/{file_hash}'
+                })
+            except Exception as e:
+                print(f"Error generating thumbnail for {file_hash}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(file_hash)
+
+
+# Shared thumbnail cache instance, bound to the app in create_app()
+thumbnail_cache = ThumbnailCache()
@@ -0,0 +1,76 @@
+"""
+FreeBox Visitors Module
+In-memory visitor accounting with batched write-behind
+"""
+
+import datetime
+
+from backend.periodic import WriteBehindBuffer
+
+
+class VisitorTracker(WriteBehindBuffer):
+    """
+    Counts visits per IP address in memory and writes them in batches.
+
+    Every known address is kept in a set, so telling a new visitor from a
+    returning one never needs a query. Visits are accumulated per address
+    and a background thread hands them to write_batch(visits) every flush
+    interval, and once more at interpreter shutdown, so the request path
+    never writes to the database.
+    """
+
+    def __init__(self, flush_interval=5.0):
+        super().__init__(flush_interval, 'visitors')
+        self._write_batch = None
+        self._known = set()
+
+    def init_app(self, app, load_known, write_batch):
+        """
+        Load the known addresses and start the flush thread
+        load_known() returns every stored address. write_batch(visits) is
+        called inside an app context with a dictionary of address to
+        (visits, first_visit, last_visit, new) and must commit.
+        """
+        self._app = app
+        self._write_batch = write_batch
+        self.interval = app.config.setdefault('VISITOR_FLUSH_INTERVAL', 5.0)
+
+        with app.app_context():
+            known = set(load_known())
+        with self._lock:
+            self._known = known | {address for address, visit in self._pending.items() if visit[3]}
+
+        self.start('visitor-flush')
+
+    def record(self, ip_address):
+        """
+        Count a visit from an address
+        Returns True if the address has never visited before.
+        """
+        now = datetime.datetime.utcnow()
+        with self._lock:
+            new = ip_address not in self._known
+            if new:
+                self._known.add(ip_address)
+
+            visits, first_visit, _, pending_new = self._pending.get(ip_address, (0, now, now, False))
+            self._pending[ip_address] = (visits + 1, first_visit, now, pending_new or new)
+            return new
+
+    def pending_new(self):
+        """
+        Get the number of new visitors not written to the database yet
+        """
+        with self._lock:
+            return sum(1 for visit in self._pending.values() if visit[3])
+
+    def _write(self, pending):
+        self._write_batch(pending)
+
+    def _restore(self, pending):
+        for address, (visits, first_visit, last_visit, new) in pending.items():
+            later = self._pending.get(address)
+            if later is not None:
+                visits += later[0]
+                last_visit = later[2]
+            self._pending[address] = (visits, first_visit, last_visit, new)
@@ -0,0 +1,129 @@
+"""
+FreeBox Write Queue Module
+Group commit of queued database inserts from a single background writer
+"""
+
+import threading
+from collections import deque
+
+from backend.periodic import PeriodicWorker
+
+
+class GroupCommitQueue(PeriodicWorker):
+    """
+    Queue of rows written to the database by one background thread.
+
+    Callers submit rows and return immediately. The writer waits a few
+    milliseconds after the first row arrives so rows submitted meanwhile
+    join the batch, then writes the batch with write_batch(rows) in one
+    transaction, so a burst costs one commit instead of one per row.
+    Rows are written in submission order. A failed batch is put back at
+    the front of the queue and retried, and the queue is flushed once
+    more at interpreter shutdown.
+    """
+
+    def __init__(self, name, interval_ms=5, max_batch=500, retry_delay=1.0):
+        super().__init__(interval_ms / 1000.0)
+        self.name = name
+        self.max_batch = max_batch
+        self.retry_delay = retry_delay
+        self._app = None
+        self._write_batch = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._queue = deque()
+        self._wake = threading.Event()
+        self._max_depth = 0
+        self._batches = 0
+        self._written = 0
+
+    def init_app(self, app, write_batch, interval_ms=5, max_batch=500):
+        """
+        Bind the queue to the app and start the writer thread
+        write_batch(rows) is called inside an app context and must commit.
+        """
+        self._app = app
+        self._write_batch = write_batch
+        self.interval = interval_ms / 1000.0
+        self.max_batch = max_batch
+
+        self.start(f'{self.name}-writer')
+
+    def submit(self, row):
+        """
+        Queue a row for the next batch
+        """
+        with self._lock:
+            self._queue.append(row)
+            self._max_depth = max(self._max_depth, len(self._queue))
+        self._wake.set()
+
+    def depth(self):
+        """
+        Get the number of rows waiting to be written
+        """
+        with self._lock:
+            return len(self._queue)
+
+    def stats(self):
+        """
+        Get the queue depth, its peak and the number of batches and rows written
+        """
+        with self._lock:
+            return {
+                'depth': len(self._queue),
+                'max_depth': self._max_depth,
+                'batches': self._batches,
+                'written': self._written
+            }
+
+    def flush(self):
+        """
+        Write every queued row, one batch at a time
+        Returns False if a batch failed and was put back.
+        """
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    if not self._queue:
+                        return True
+                    batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+
+                try:
+                    with self._app.app_context():
+                        self._write_batch(batch)
+                except Exception as e:
+                    print(f"Error writing {len(batch)} queued {self.name} rows: {e}")
+                    # Put the batch back in front of newer rows to keep the order
+                    with self._lock:
+                        self._queue.extendleft(reversed(batch))
+                    return False
+
+                with self._lock:
+                    self._batches += 1
+                    self._written += len(batch)
+
+    def shutdown(self):
+        """
+        Stop the writer thread and write any remaining rows
+        """
+        super().shutdown()
+        self._wake.set()
+        if self._app is not None:
+            self.flush()
+
+    def _run(self):
+        """
+        Writer loop run by the background thread
+        """
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+
+            # Let rows submitted in the next few milliseconds join the batch
+            if self._stop.wait(self.interval):
+                break
+
+            if not self.flush():
+                self._stop.wait(self.retry_delay)
+                self._wake.set()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+FreeBox Database Benchmark
+Measures read and write latency and throughput under a mixed load for the
+default and the tuned SQLite engine profiles.
+
+Usage:
+    python benchmarks/db_bench.py --seconds 10 --readers 20 --writers 4
+
+Each profile runs in its own process under eventlet, like the server, on a
+fresh database in a temporary directory next to the FreeBox database, so
+the disk is the same. Readers list pages of files, writers add files and
+count downloads.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+WEB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, fraction):
+    """Get a percentile of a list of values"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_profile(profile, seconds, readers, writers, files, directory):
+    """Run the mixed load against one profile and return the measurements"""
+    import eventlet
+    eventlet.monkey_patch()
+
+    sys.path.insert(0, WEB_DIR)
+    from flask import Flask
+    from backend.database import db, File, init_db, add_file, increment_download_count, get_all_files, rebuild_search_index
+
+    app = Flask(__name__)
+    app.config['SQLITE_ENGINE_PROFILE'] = profile
+    init_db(app, os.path.join(directory, 'bench.db'))
+
+    with app.app_context():
+        db.session.execute(db.insert(File), [
+            {'filename': f'seed_{i}.bin', 'original_filename': f'seed {i}.bin', 'size': i, 'download_count': 0}
+            for i in range(files)
+        ])
+        db.session.commit()
+        rebuild_search_index()
+
+    results = {'read': [], 'write': [], 'errors': 0}
+    deadline = time.monotonic() + seconds
+
+    def reader():
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                with app.app_context():
+                    page, _ = get_all_files(50)
+                    [file.to_dict() for file in page]
+            except Exception:
+                results['errors'] += 1
+            results['read'].append(time.perf_counter() - start)
+            eventlet.sleep(0)
+
+    def writer(index):
+        count = 0
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                with app.app_context():
+                    file_record = add_file(f'bench_{index}_{count}.bin', f'bench {index} {count}.bin', count)
+                    increment_download_count(file_record.id)
+            except Exception:
+                results['errors'] += 1
+            results['write'].append(time.perf_counter() - start)
+            count += 1
+            eventlet.sleep(0)
+
+    pool = eventlet.GreenPool()
+    for _ in range(readers):
+        pool.spawn(reader)
+    for index in range(writers):
+        pool.spawn(writer, index)
+    pool.waitall()
+
+    return {
+        'profile': profile,
+        'reads_per_second': len(results['read']) / seconds,
+        'writes_per_second': len(results['write']) / seconds,
+        'read_p50_ms': percentile(results['read'], 0.5) * 1000,
+        'read_p99_ms': percentile(results['read'], 0.99) * 1000,
+        'write_p50_ms': percentile(results['write'], 0.5) * 1000,
+        'write_p99_ms': percentile(results['write'], 0.99) * 1000,
+        'errors': results['errors']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the FreeBox database under mixed load')
+    parser.add_argument('--seconds', type=float, default=10, help='duration of each run')
+    parser.add_argument('--readers', type=int, default=20, help='concurrent readers')
+    parser.add_argument('--writers', type=int, default=4, help='concurrent writers')
+    parser.add_argument('--files', type=int, default=5000, help='files in the database before the run')
+    parser.add_argument('--profiles', nargs='+', default=['default', 'tuned'], help='engine profiles to compare')
+    parser.add_argument('--run-profile', help=argparse.SUPPRESS)
+    parser.add_argument('--dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_profile:
+        result = run_profile(args.run_profile, args.seconds, args.readers, args.writers, args.files, args.dir)
+        print(json.dumps(result))
+        return
+
+    for profile in args.profiles:
+        directory = tempfile.mkdtemp(prefix='db_bench_', dir=WEB_DIR)
+        try:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--run-profile', profile, '--dir', directory,
+                 '--seconds', str(args.seconds), '--readers', str(args.readers),
+                 '--writers', str(args.writers), '--files', str(args.files)],
+                cwd=WEB_DIR,
+                check=True,
+                capture_output=True,
+                text=True
+            ).stdout
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{profile:>8}: reads {result['reads_per_second']:8.1f}/s "
+              f"(p50 {result['read_p50_ms']:6.2f} ms, p99 {result['read_p99_ms']:7.2f} ms)  "
+              f"writes {result['writes_per_second']:7.1f}/s "
+              f"(p50 {result['write_p50_ms']:6.2f} ms, p99 {result['write_p99_ms']:7.2f} ms)  "
+              f"errors {result['errors']}")
+
+
+if __name__ == '__main__':
+    main()
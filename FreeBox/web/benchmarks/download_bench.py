@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+FreeBox Download Benchmark
+Measures aggregate download throughput and server CPU time for the sendfile
+and the send_file download paths with 1, 10 and 50 concurrent clients.
+
+Usage:
+    python benchmarks/download_bench.py --size-mb 64
+
+Each mode starts its own server process on a local port, uploads a file of
+random data, downloads it from every client at once, then deletes it again.
+The servers keep their database and storage in a temporary directory, and
+run without a download rate limit so the limiter does not cap either path.
+"""
+
+import os
+import sys
+import json
+import shutil
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+
+import psutil
+
+WEB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNK_SIZE = 1024 * 1024
+
+
+def serve(port, use_sendfile, data_dir):
+    """Run a FreeBox server with the requested download mode"""
+    import eventlet
+    eventlet.monkey_patch()
+
+    sys.path.insert(0, WEB_DIR)
+    from backend.app import create_app, socketio
+    from backend.sendfile import SendfileHttpProtocol
+
+    app = create_app(data_dir, {
+        'SENDFILE_DOWNLOADS': use_sendfile,
+        'DOWNLOAD_RATE_LIMIT': 0
+    })
+    socketio.run(app, host='127.0.0.1', port=port, log_output=False, protocol=SendfileHttpProtocol)
+
+
+def wait_for_server(port, timeout=30):
+    """Wait until the server answers /api/status"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/status')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('Server did not start')
+
+
+def upload(port, size_mb):
+    """Upload a file of random data through the chunked API"""
+    data = os.urandom(size_mb * CHUNK_SIZE)
+
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('POST', '/api/uploads', body=json.dumps({'filename': 'bench.bin', 'size': len(data)}),
+                 headers={'Content-Type': 'application/json'})
+    session = json.loads(conn.getresponse().read())
+
+    chunk_size = session['chunk_size']
+    for offset in range(0, len(data), chunk_size):
+        conn.request('PUT', f"/api/uploads/{session['upload_id']}?offset={offset}",
+                     body=data[offset:offset + chunk_size])
+        conn.getresponse().read()
+
+    conn.request('POST', f"/api/uploads/{session['upload_id']}/complete")
+    result = json.loads(conn.getresponse().read())
+    if not result.get('success'):
+        raise RuntimeError(f"Upload failed: {result.get('error')}")
+    return result['file']['id']
+
+
+def download(port, file_id):
+    """Download a file and return the number of bytes received"""
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    # Previews are not counted, so the benchmark leaves the stats alone
+    conn.request('GET', f'/api/download/{file_id}?preview=true')
+    response = conn.getresponse()
+    received = 0
+    for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+        received += len(chunk)
+    conn.close()
+    return received
+
+
+def delete(port, file_id):
+    """Delete an uploaded file"""
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('DELETE', f'/api/files/{file_id}')
+    conn.getresponse().read()
+
+
+def run_clients(port, file_id, clients):
+    """Download the file from several clients at once, return total bytes"""
+    totals = [0] * clients
+
+    def client(index):
+        totals[index] = download(port, file_id)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(totals)
+
+
+def run_mode(name, use_sendfile, port, size_mb, client_counts, data_dir):
+    """Benchmark one download mode and print the results"""
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', str(port), '--data-dir', data_dir]
+        + (['--sendfile'] if use_sendfile else []),
+        cwd=WEB_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for_server(port)
+        process = psutil.Process(server.pid)
+        file_id = upload(port, size_mb)
+
+        # Warm the page cache so both modes read from memory
+        download(port, file_id)
+
+        for clients in client_counts:
+            cpu_before = process.cpu_times()
+            start = time.perf_counter()
+            received = run_clients(port, file_id, clients)
+            elapsed = time.perf_counter() - start
+            cpu_after = process.cpu_times()
+            cpu = (cpu_after.user - cpu_before.user) + (cpu_after.system - cpu_before.system)
+
+            expected = clients * size_mb * CHUNK_SIZE
+            if received != expected:
+                raise RuntimeError(f"Received {received} of {expected} bytes")
+
+            print(f"{name:>10} x{clients:<3}: {received / CHUNK_SIZE / elapsed:8.1f} MB/s  "
+                  f"{elapsed:6.2f} s  "
+                  f"server CPU {cpu:6.2f} s ({cpu / (received / CHUNK_SIZE) * 1000:.2f} ms/MB)")
+
+        delete(port, file_id)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark FreeBox downloads')
+    parser.add_argument('--size-mb', type=int, default=64, help='size of the downloaded file')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 10, 50], help='concurrent client counts')
+    parser.add_argument('--port', type=int, default=8766, help='port for the benchmark server')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--sendfile', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--data-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.sendfile, args.data_dir)
+        return
+
+    data_dir = tempfile.mkdtemp(prefix='freebox-bench-')
+    try:
+        run_mode('send_file', False, args.port, args.size_mb, args.clients, data_dir)
+        run_mode('sendfile', True, args.port, args.size_mb, args.clients, data_dir)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
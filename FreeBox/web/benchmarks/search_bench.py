@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+FreeBox Search Benchmark
+Measures file search latency through the FTS5 index against a LIKE scan
+over the same columns, with 10k and 100k files.
+
+Usage:
+    python benchmarks/search_bench.py --files 10000 100000
+
+The files are generated in a temporary database, so the FreeBox database
+is never touched.
+"""
+
+import os
+import sys
+import time
+import string
+import random
+import argparse
+import tempfile
+import statistics
+
+from flask import Flask
+
+WEB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, WEB_DIR)
+
+from backend.database import db, File, ensure_search_index, rebuild_search_index, search_files  # noqa: E402
+
+# Vocabulary size for generated names and descriptions
+VOCABULARY_SIZE = 5000
+EXTENSIONS = ['jpg', 'png', 'mp4', 'pdf', 'txt', 'zip', 'mp3', 'docx']
+
+
+def make_app(db_path):
+    """Create a bare app bound to a temporary database"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def make_vocabulary():
+    """Generate random words to build names and descriptions from"""
+    return [
+        ''.join(random.choices(string.ascii_lowercase, k=random.randint(4, 9)))
+        for _ in range(VOCABULARY_SIZE)
+    ]
+
+
+def pick_words(vocabulary, count):
+    """Pick words with a Zipf-like skew, so a few words are very common"""
+    return [vocabulary[min(int(random.paretovariate(1.0)) - 1, len(vocabulary) - 1)] for _ in range(count)]
+
+
+def populate(count, vocabulary):
+    """Insert count files with generated names and descriptions"""
+    rows = []
+    for i in range(count):
+        name = '_'.join(random.sample(vocabulary, 2))
+        rows.append({
+            'filename': f'{name}_{i}.bin',
+            'original_filename': f'{name}_{i}.{random.choice(EXTENSIONS)}',
+            'size': random.randint(1, 1024 * 1024),
+            'description': ' '.join(pick_words(vocabulary, 5)),
+            'download_count': 0
+        })
+    db.session.execute(db.insert(File), rows)
+    db.session.commit()
+
+
+def like_search(text, limit):
+    """Search the way a client filtering the full list would, with a LIKE scan"""
+    pattern = f'%{text}%'
+    return (
+        File.query
+        .filter(db.or_(File.original_filename.like(pattern), File.description.like(pattern)))
+        .order_by(File.created_at.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def measure(function, queries, limit):
+    """Run every query and return the latencies in milliseconds"""
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        function(query, limit)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name, count, timings):
+    """Print latency percentiles"""
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:>6} {count:>7} files: p50 {statistics.median(timings):7.2f} ms  "
+          f"p95 {p95:7.2f} ms  max {timings[-1]:7.2f} ms")
+
+
+def run(count, vocabulary, queries, limit):
+    """Benchmark both search paths on a fresh database with count files"""
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        app = make_app(db_path)
+        with app.app_context():
+            db.create_all()
+            populate(count, vocabulary)
+
+            start = time.perf_counter()
+            ensure_search_index()
+            print(f"Indexed {count} files in {time.perf_counter() - start:.2f} s")
+
+            start = time.perf_counter()
+            rebuild_search_index()
+            print(f"Rebuilt the index in {time.perf_counter() - start:.2f} s")
+
+            report('fts5', count, measure(search_files, queries, limit))
+            report('like', count, measure(like_search, queries, limit))
+    finally:
+        os.remove(db_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark FreeBox file search')
+    parser.add_argument('--files', type=int, nargs='+', default=[10000, 100000], help='numbers of files to index')
+    parser.add_argument('--queries', type=int, default=200, help='searches per run')
+    parser.add_argument('--limit', type=int, default=50, help='results per search')
+    args = parser.parse_args()
+
+    # Mix whole words, prefixes as typed and two-word searches
+    vocabulary = make_vocabulary()
+    queries = []
+    for _ in range(args.queries):
+        word = random.choice(vocabulary)
+        queries.append(random.choice([word, word[:4], f'{word} {pick_words(vocabulary, 1)[0][:4]}']))
+
+    for count in args.files:
+        run(count, vocabulary, queries, args.limit)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+FreeBox Upload Benchmark
+Measures upload throughput and server peak RSS for the spooled and the
+streaming upload paths.
+
+Usage:
+    python benchmarks/upload_bench.py --size-mb 512
+
+Each mode starts its own server process on a local port, uploads a file of
+random data through /api/upload, then deletes the uploaded file again.
+The servers keep their database and storage in a temporary directory, so
+the FreeBox database and storage are never touched.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+
+import psutil
+
+WEB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNK_SIZE = 1024 * 1024
+
+
+def serve(port, streaming, data_dir):
+    """Run a FreeBox server with the requested upload mode"""
+    import eventlet
+    eventlet.monkey_patch()
+
+    sys.path.insert(0, WEB_DIR)
+    from backend.app import create_app, socketio
+
+    app = create_app(data_dir)
+    app.config['STREAMING_UPLOADS'] = streaming
+    socketio.run(app, host='127.0.0.1', port=port, log_output=False)
+
+
+def wait_for_server(port, timeout=30):
+    """Wait until the server answers /api/status"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/status')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('Server did not start')
+
+
+def make_test_file(size_mb):
+    """Create a temporary file of random data"""
+    fd, path = tempfile.mkstemp(suffix='.bin')
+    with os.fdopen(fd, 'wb') as f:
+        for _ in range(size_mb):
+            f.write(os.urandom(CHUNK_SIZE))
+    return path
+
+
+def upload(port, path):
+    """Stream a multipart upload of path and return the JSON response"""
+    boundary = uuid.uuid4().hex
+    head = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="file"; filename="bench.bin"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode()
+    tail = f'\r\n--{boundary}--\r\n'.encode()
+    length = len(head) + os.path.getsize(path) + len(tail)
+
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.putrequest('POST', '/api/upload')
+    conn.putheader('Content-Type', f'multipart/form-data; boundary={boundary}')
+    conn.putheader('Content-Length', str(length))
+    conn.endheaders()
+
+    conn.send(head)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            conn.send(chunk)
+    conn.send(tail)
+
+    return json.loads(conn.getresponse().read())
+
+
+def delete(port, file_id):
+    """Delete an uploaded file"""
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('DELETE', f'/api/files/{file_id}')
+    conn.getresponse().read()
+
+
+def run_mode(name, streaming, port, path, data_dir):
+    """Benchmark one upload mode and print the results"""
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', str(port), '--data-dir', data_dir]
+        + (['--streaming'] if streaming else []),
+        cwd=WEB_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for_server(port)
+        process = psutil.Process(server.pid)
+        baseline_rss = process.memory_info().rss
+        peak_rss = baseline_rss
+
+        # Sample the server RSS while the upload runs
+        done = threading.Event()
+
+        def sample():
+            nonlocal peak_rss
+            while not done.is_set():
+                peak_rss = max(peak_rss, process.memory_info().rss)
+                time.sleep(0.05)
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+
+        start = time.perf_counter()
+        result = upload(port, path)
+        elapsed = time.perf_counter() - start
+
+        done.set()
+        sampler.join()
+
+        if not result.get('success'):
+            raise RuntimeError(f"Upload failed: {result.get('error')}")
+        delete(port, result['file']['id'])
+
+        size_mb = os.path.getsize(path) / CHUNK_SIZE
+        print(f"{name:>10}: {size_mb / elapsed:8.1f} MB/s  "
+              f"{elapsed:6.2f} s  "
+              f"peak RSS {peak_rss / CHUNK_SIZE:7.1f} MB "
+              f"(+{(peak_rss - baseline_rss) / CHUNK_SIZE:.1f} MB)")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark FreeBox uploads')
+    parser.add_argument('--size-mb', type=int, default=256, help='size of the uploaded file')
+    parser.add_argument('--port', type=int, default=8765, help='port for the benchmark server')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--streaming', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--data-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.streaming, args.data_dir)
+        return
+
+    path = make_test_file(args.size_mb)
+    data_dir = tempfile.mkdtemp(prefix='freebox-bench-')
+    try:
+        run_mode('spooled', False, args.port, path, data_dir)
+        run_mode('streaming', True, args.port, path, data_dir)
+    finally:
+        os.remove(path)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -14,6 +14,10 @@ document.addEventListener('DOMContentLoaded', () => {
     const fileTableBody = document.getElementById('file-table-body');
     const noFilesMessage = document.getElementById('no-files-message');
     const loadingFiles = document.getElementById('loading-files');
+    const fileSearchInput = document.getElementById('file-search');
+    const fileTypeFilter = document.getElementById('file-type-filter');
+    const fileSortSelect = document.getElementById('file-sort');
+    const loadMoreFilesBtn = document.getElementById('load-more-files-btn');
     const statusText = document.querySelector('.status-text');
     const globalFileDescription = document.getElementById('global-file-description');
     const clearQueueBtn = document.createElement('button');
@@ -28,6 +32,18 @@ document.addEventListener('DOMContentLoaded', () => {
     // Track files to upload
     let filesToUpload = [];
     
+    // File list paging: cursor for the next page and number of files shown
+    let fileListCursor = null;
+    let fileListCount = 0;
+    let fileListRequest = 0;
+    
+    // Version of the file list shown, kept current by file change events,
+    // and the files shown by id
+    let fileListVersion = null;
+    let fetchingFileChanges = false;
+    let pendingFileChanges = [];
+    const listedFiles = new Map();
+    
     // WebSocket/Socket.IO
     let socket;
     let isConnected = false;
@@ -36,6 +52,12 @@ document.addEventListener('DOMContentLoaded', () => {
     let username = localStorage.getItem('freebox_username') || generateRandomUsername();
     let currentRoom = 'main';
     
+    // Chat scroll-back: id of the oldest message shown and whether there are older ones
+    const CHAT_HISTORY_PAGE_SIZE = 50;
+    let oldestChatMessageId = null;
+    let hasOlderChatMessages = false;
+    let loadingOlderChatMessages = false;
+    
     // Track number of online users
     let onlineUsers = 1; // Start with 1 (yourself)
     
@@ -54,6 +76,9 @@ document.addEventListener('DOMContentLoaded', () => {
     const viewerVideo = document.getElementById('viewer-video');
     const viewerText = document.getElementById('viewer-text');
     
+    // Paging state of the text file shown in the viewer
+    let textPreview = null;
+    
     // DOM elements for video player
     const videoCurrentTime = document.getElementById('video-current-time');
     const videoDuration = document.getElementById('video-duration');
@@ -184,6 +209,11 @@ document.addEventListener('DOMContentLoaded', () => {
                 // Request updated stats
                 socket.emit('request_stats_update');
                 
+                // Catch up on file changes missed while disconnected
+                if (fileListVersion !== null) {
+                    fetchFileChanges();
+                }
+                
                 // Add a system message
                 addSystemMessage('Connected to the server. Chat is ready.');
             });
@@ -212,6 +242,10 @@ document.addEventListener('DOMContentLoaded', () => {
                 // Clear the chat
                 chatMessages.innerHTML = '';
                 
+                // Only the latest page is sent, older messages load on scroll
+                oldestChatMessageId = messages.length ? messages[0].id : null;
+                hasOlderChatMessages = messages.length >= CHAT_HISTORY_PAGE_SIZE;
+                
                 // Add all messages
                 messages.forEach(message => {
                     addChatMessage(message, false); // Don't auto-scroll for each message
@@ -243,16 +277,14 @@ document.addEventListener('DOMContentLoaded', () => {
                 updateUserCount();
             });
             
-            // File events
-            socket.on('file_list_updated', () => {
-                // Reload the file list
-                loadFiles();
-            });
+            // File list changes, applied in version order
+            socket.on('file_added', receiveFileChange);
+            socket.on('file_updated', receiveFileChange);
+            socket.on('file_deleted', receiveFileChange);
             
-            // File download event
-            socket.on('file_downloaded', (data) => {
-                // Update download count in the UI without reloading the entire file list
-                updateFileDownloadCount(data.file);
+            // Thumbnail generated in the background
+            socket.on('thumbnail_ready', (data) => {
+                showThumbnail(data.file_hash, data.thumbnail_url);
             });
             
             // Stats update event
@@ -314,17 +346,70 @@ document.addEventListener('DOMContentLoaded', () => {
     function loadFiles() {
         showLoading(true);
         
-        fetch('/api/files')
+        fetchFilePage(null, false)
+            .finally(() => {
+                showLoading(false);
+            });
+    }
+    
+    // Append the next page of files to the list
+    function loadMoreFiles() {
+        if (!fileListCursor || loadMoreFilesBtn.disabled) {
+            return;
+        }
+        
+        loadMoreFilesBtn.disabled = true;
+        fetchFilePage(fileListCursor, true)
+            .finally(() => {
+                loadMoreFilesBtn.disabled = false;
+            });
+    }
+    
+    // Fetch one page of the file list with the selected filter and sort order,
+    // or of the search results while there is a search query
+    function fetchFilePage(cursor, append) {
+        const query = fileSearchInput.value.trim();
+        let params;
+        let url;
+        
+        if (query) {
+            params = new URLSearchParams({ q: query });
+            url = '/api/files/search';
+        } else {
+            const [sort, order] = fileSortSelect.value.split(':');
+            params = new URLSearchParams({ sort, order });
+            if (fileTypeFilter.value) {
+                params.set('mime', fileTypeFilter.value);
+            }
+            url = '/api/files';
+        }
+        if (cursor) {
+            params.set('cursor', cursor);
+        }
+        
+        // Ignore responses for a listing that has since been replaced
+        const request = ++fileListRequest;
+        
+        return fetch(`${url}?${params}`)
             .then(response => response.json())
-            .then(files => {
-                displayFiles(files);
+            .then(data => {
+                if (request !== fileListRequest) {
+                    return;
+                }
+                if (data.error) {
+                    throw new Error(data.error);
+                }
+                
+                fileListCursor = data.next_cursor;
+                if (!append) {
+                    // Search results are ranked, so new files are not added to them
+                    fileListVersion = query ? null : data.version;
+                }
+                displayFiles(data.files, append);
             })
             .catch(error => {
                 console.error('Error loading files:', error);
                 showErrorMessage('Failed to load files. Please try again.');
-            })
-            .finally(() => {
-                showLoading(false);
             });
     }
     
@@ -560,16 +645,23 @@ document.addEventListener('DOMContentLoaded', () => {
     }
     
     // Display files in the table
-    function displayFiles(files) {
-        fileTableBody.innerHTML = '';
+    function displayFiles(files, append = false) {
+        if (!append) {
+            fileTableBody.innerHTML = '';
+            fileListCount = 0;
+            listedFiles.clear();
+        }
+        fileListCount += files.length;
+        
+        // Offer the next page while there is one
+        loadMoreFilesBtn.classList.toggle('hidden', !fileListCursor);
         
-        if (files.length === 0) {
-            noFilesMessage.classList.remove('hidden');
+        updateFileCount();
+        
+        if (fileListCount === 0) {
             return;
         }
         
-        noFilesMessage.classList.add('hidden');
-        
         // Add a checkbox column to the table header
         const headerRow = document.querySelector('#file-table thead tr');
         if (!headerRow.querySelector('.select-column')) {
@@ -593,121 +685,140 @@ document.addEventListener('DOMContentLoaded', () => {
             headerRow.insertBefore(selectHeader, headerRow.firstChild);
         }
         
-        // Update file count display
+        files.forEach(file => {
+            listedFiles.set(String(file.id), file);
+            fileTableBody.appendChild(createFileRow(file));
+        });
+    }
+    
+    // Show the number of listed files, or the empty list message
+    function updateFileCount() {
         const fileCountDisplay = document.getElementById('file-count-display');
         if (fileCountDisplay) {
-            fileCountDisplay.textContent = `(${files.length} ${files.length === 1 ? 'file' : 'files'})`;
+            const more = fileListCursor ? '+' : '';
+            fileCountDisplay.textContent = `(${fileListCount}${more} ${fileListCount === 1 && !more ? 'file' : 'files'})`;
         }
         
-        files.forEach(file => {
-            const row = document.createElement('tr');
-            row.dataset.fileId = file.id;
-            
-            // Add checkbox cell
-            const checkboxCell = document.createElement('td');
-            const checkbox = document.createElement('input');
-            checkbox.type = 'checkbox';
-            checkbox.className = 'file-select-checkbox';
-            checkbox.dataset.fileId = file.id;
-            checkbox.dataset.fileName = file.filename;
-            checkbox.addEventListener('change', function() {
-                handleCheckboxChange(this);
-            });
-            checkboxCell.appendChild(checkbox);
-            row.appendChild(checkboxCell);
-            
-            // Name cell with description as tooltip
-            const nameCell = document.createElement('td');
-            const nameSpan = document.createElement('span');
-            nameSpan.textContent = file.filename;
-            
-            // Add file type icon based on extension
-            const fileExtension = getFileExtension(file.filename).toLowerCase();
-            
-            // Create file icon element
-            const fileIcon = document.createElement('span');
-            fileIcon.className = 'file-icon';
-            
-            // Determine icon based on file type
-            if (imageFileExtensions.includes(fileExtension)) {
-                fileIcon.textContent = '🖼️ ';
-                fileIcon.title = 'Image file';
-            } else if (videoFileExtensions.includes(fileExtension)) {
-                fileIcon.textContent = '🎬 ';
-                fileIcon.title = 'Video file';
-            } else if (textFileExtensions.includes(fileExtension)) {
-                fileIcon.textContent = '📄 ';
-                fileIcon.title = 'Text file';
-            } else {
-                fileIcon.textContent = '📁 ';
-                fileIcon.title = 'File';
-            }
-            
-            // Add description as tooltip if available
-            if (file.description) {
-                nameSpan.title = file.description;
-                nameSpan.className = 'file-with-description';
-            }
-            
-            // Add icon before filename
-            nameCell.appendChild(fileIcon);
-            nameCell.appendChild(nameSpan);
-            
-            // Add description as a small text if available
-            if (file.description) {
-                const descriptionDiv = document.createElement('div');
-                descriptionDiv.className = 'file-description';
-                descriptionDiv.textContent = file.description;
-                nameCell.appendChild(descriptionDiv);
-            }
-            
-            const sizeCell = document.createElement('td');
-            sizeCell.textContent = formatFileSize(file.size);
-            
-            const dateCell = document.createElement('td');
-            dateCell.textContent = formatDate(file.created_at);
-            
-            const downloadsCell = document.createElement('td');
-            downloadsCell.textContent = file.download_count;
-            
-            const actionsCell = document.createElement('td');
-            
-            // View button for previewing
-            const viewBtn = document.createElement('button');
-            viewBtn.textContent = 'View';
-            viewBtn.className = 'file-action-btn view';
-            viewBtn.setAttribute('data-file-id', file.id);
-            viewBtn.addEventListener('click', () => {
-                openFileViewer(file);
-            });
-            
-            const downloadBtn = document.createElement('button');
-            downloadBtn.textContent = 'Download';
-            downloadBtn.className = 'file-action-btn';
-            downloadBtn.setAttribute('data-file-id', file.id);
-            downloadBtn.addEventListener('click', () => {
-                window.location.href = `/api/download/${file.id}`;
-            });
-            
-            const deleteBtn = document.createElement('button');
-            deleteBtn.textContent = 'Delete';
-            deleteBtn.className = 'file-action-btn delete';
-            deleteBtn.addEventListener('click', () => {
-                showDeleteConfirmation([file]);
-            });
-            
-            actionsCell.appendChild(viewBtn);
-            actionsCell.appendChild(downloadBtn);
-            actionsCell.appendChild(deleteBtn);
-            
-            row.appendChild(nameCell);
-            row.appendChild(sizeCell);
-            row.appendChild(dateCell);
-            row.appendChild(downloadsCell);
-            row.appendChild(actionsCell);
-            
-            fileTableBody.appendChild(row);
+        noFilesMessage.classList.toggle('hidden', fileListCount !== 0);
+    }
+    
+    // Build the table row for one file
+    function createFileRow(file) {
+        const row = document.createElement('tr');
+        row.dataset.fileId = file.id;
+        if (file.file_hash) {
+            row.dataset.fileHash = file.file_hash;
+        }
+        
+        // Add checkbox cell
+        const checkboxCell = document.createElement('td');
+        const checkbox = document.createElement('input');
+        checkbox.type = 'checkbox';
+        checkbox.className = 'file-select-checkbox';
+        checkbox.dataset.fileId = file.id;
+        checkbox.dataset.fileName = file.filename;
+        checkbox.addEventListener('change', function() {
+            handleCheckboxChange(this);
+        });
+        checkboxCell.appendChild(checkbox);
+        row.appendChild(checkboxCell);
+        
+        // Name cell with description as tooltip
+        const nameCell = document.createElement('td');
+        const nameSpan = document.createElement('span');
+        nameSpan.textContent = file.filename;
+        
+        // Add file type icon based on extension
+        const fileExtension = getFileExtension(file.filename).toLowerCase();
+        
+        // Create file icon element
+        const fileIcon = document.createElement('span');
+        fileIcon.className = 'file-icon';
+        
+        // Determine icon based on file type
+        if (imageFileExtensions.includes(fileExtension)) {
+            fileIcon.textContent = '🖼️ ';
+            fileIcon.title = 'Image file';
+        } else if (videoFileExtensions.includes(fileExtension)) {
+            fileIcon.textContent = '🎬 ';
+            fileIcon.title = 'Video file';
+        } else if (textFileExtensions.includes(fileExtension)) {
+            fileIcon.textContent = '📄 ';
+            fileIcon.title = 'Text file';
+        } else {
+            fileIcon.textContent = '📁 ';
+            fileIcon.title = 'File';
+        }
+        
+        // Show the thumbnail instead of the icon once the server has one
+        if (file.thumbnail_url) {
+            setFileThumbnail(fileIcon, file.thumbnail_url);
+        }
+        
+        // Add description as tooltip if available
+        if (file.description) {
+            nameSpan.title = file.description;
+            nameSpan.className = 'file-with-description';
+        }
+        
+        // Add icon before filename
+        nameCell.appendChild(fileIcon);
+        nameCell.appendChild(nameSpan);
+        
+        // Add description as a small text if available
+        if (file.description) {
+            const descriptionDiv = document.createElement('div');
+            descriptionDiv.className = 'file-description';
+            descriptionDiv.textContent = file.description;
+            nameCell.appendChild(descriptionDiv);
+        }
+        
+        const sizeCell = document.createElement('td');
+        sizeCell.textContent = formatFileSize(file.size);
+        
+        const dateCell = document.createElement('td');
+        dateCell.textContent = formatDate(file.created_at);
+        
+        const downloadsCell = document.createElement('td');
+        downloadsCell.textContent = file.download_count;
+        
+        const actionsCell = document.createElement('td');
+        
+        // View button for previewing
+        const viewBtn = document.createElement('button');
+        viewBtn.textContent = 'View';
+        viewBtn.className = 'file-action-btn view';
+        viewBtn.setAttribute('data-file-id', file.id);
+        viewBtn.addEventListener('click', () => {
+            openFileViewer(file);
         });
+        
+        const downloadBtn = document.createElement('button');
+        downloadBtn.textContent = 'Download';
+        downloadBtn.className = 'file-action-btn';
+        downloadBtn.setAttribute('data-file-id', file.id);
+        downloadBtn.addEventListener('click', () => {
+            window.location.href = `/api/download/${file.id}`;
+        });
+        
+        const deleteBtn = document.createElement('button');
+        deleteBtn.textContent = 'Delete';
+        deleteBtn.className = 'file-action-btn delete';
+        deleteBtn.addEventListener('click', () => {
+            showDeleteConfirmation([file]);
+        });
+        
+        actionsCell.appendChild(viewBtn);
+        actionsCell.appendChild(downloadBtn);
+        actionsCell.appendChild(deleteBtn);
+        
+        row.appendChild(nameCell);
+        row.appendChild(sizeCell);
+        row.appendChild(dateCell);
+        row.appendChild(downloadsCell);
+        row.appendChild(actionsCell);
+        
+        return row;
     }
     
     // Handle checkbox change
@@ -871,6 +982,55 @@ document.addEventListener('DOMContentLoaded', () => {
     
     // Add a chat message to the UI
     function addChatMessage(message, shouldScroll = true) {
+        chatMessages.appendChild(createChatMessageElement(message));
+        
+        // Scroll to the bottom if requested
+        if (shouldScroll) {
+            scrollChatToBottom();
+        }
+    }
+    
+    // Load the page of messages before the oldest one shown
+    function loadOlderChatMessages() {
+        if (!hasOlderChatMessages || loadingOlderChatMessages || oldestChatMessageId === null) {
+            return;
+        }
+        
+        loadingOlderChatMessages = true;
+        const params = new URLSearchParams({
+            room: currentRoom,
+            before: oldestChatMessageId,
+            limit: CHAT_HISTORY_PAGE_SIZE
+        });
+        
+        fetch(`/api/chat/messages?${params}`)
+            .then(response => response.json())
+            .then(messages => {
+                hasOlderChatMessages = messages.length >= CHAT_HISTORY_PAGE_SIZE;
+                if (!messages.length) {
+                    return;
+                }
+                oldestChatMessageId = messages[0].id;
+                
+                // Prepend the page without moving the messages in view
+                const fragment = document.createDocumentFragment();
+                messages.forEach(message => {
+                    fragment.appendChild(createChatMessageElement(message));
+                });
+                const previousHeight = chatMessages.scrollHeight;
+                chatMessages.insertBefore(fragment, chatMessages.firstChild);
+                chatMessages.scrollTop += chatMessages.scrollHeight - previousHeight;
+            })
+            .catch(error => {
+                console.error('Error loading chat history:', error);
+            })
+            .finally(() => {
+                loadingOlderChatMessages = false;
+            });
+    }
+    
+    // Build the element for one chat message
+    function createChatMessageElement(message) {
         const isCurrentUser = message.username === username;
         
         const messageDiv = document.createElement('div');
@@ -892,12 +1052,7 @@ document.addEventListener('DOMContentLoaded', () => {
         messageDiv.appendChild(contentDiv);
         messageDiv.appendChild(timeDiv);
         
-        chatMessages.appendChild(messageDiv);
-        
-        // Scroll to the bottom if requested
-        if (shouldScroll) {
-            scrollChatToBottom();
-        }
+        return messageDiv;
     }
     
     // Add a system message
@@ -979,6 +1134,33 @@ document.addEventListener('DOMContentLoaded', () => {
     function setupEventListeners() {
         // File-related event listeners
         
+        // Reload the file list when the filter or sort order changes
+        fileTypeFilter.addEventListener('change', loadFiles);
+        fileSortSelect.addEventListener('change', loadFiles);
+        
+        // Search as the user types, once they pause
+        let searchTimer = null;
+        fileSearchInput.addEventListener('input', () => {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => {
+                // Search results are ranked and cover every type
+                const searching = fileSearchInput.value.trim() !== '';
+                fileTypeFilter.disabled = searching;
+                fileSortSelect.disabled = searching;
+                loadFiles();
+            }, 250);
+        });
+        
+        // Load the next page from the button, or automatically once it scrolls into view
+        loadMoreFilesBtn.addEventListener('click', loadMoreFiles);
+        if ('IntersectionObserver' in window) {
+            new IntersectionObserver(entries => {
+                if (entries.some(entry => entry.isIntersecting)) {
+                    loadMoreFiles();
+                }
+            }).observe(loadMoreFilesBtn);
+        }
+        
         // Open file dialog when select button is clicked
         selectFileBtn.addEventListener('click', () => {
             fileInput.click();
@@ -1017,6 +1199,13 @@ document.addEventListener('DOMContentLoaded', () => {
         
         // Chat-related event listeners
         
+        // Load older chat messages when scrolled to the top
+        chatMessages.addEventListener('scroll', () => {
+            if (chatMessages.scrollTop < 50) {
+                loadOlderChatMessages();
+            }
+        });
+        
         // Send message on button click
         sendMessageBtn.addEventListener('click', () => {
             sendChatMessage();
@@ -1350,6 +1539,8 @@ document.addEventListener('DOMContentLoaded', () => {
         let filesUploaded = 0;
         let filesInProgress = 0;
         let maxConcurrentUploads = 3; // Default value, will be updated based on server status
+        let perClientUploadSlots = 2; // Upload requests the server runs at once for this client
+        let chunksInFlight = 1; // Chunks sent at once per file, set once the file concurrency is known
         const fileProgress = {}; // Track progress for each file by index
         
         // Initialize progress for each file
@@ -1365,12 +1556,20 @@ document.addEventListener('DOMContentLoaded', () => {
                     // Update max concurrent uploads based on server recommendation
                     maxConcurrentUploads = data.recommended_concurrent_uploads || maxConcurrentUploads;
                     console.log(`Server recommends ${maxConcurrentUploads} concurrent uploads`);
+                    
+                    if (data.upload_slots && data.upload_slots.per_client_limit) {
+                        perClientUploadSlots = data.upload_slots.per_client_limit;
+                    }
                 }
             })
             .catch(error => {
                 console.warn('Could not fetch server status, using default concurrency:', error);
             })
             .finally(() => {
+                // Every chunk needs one of our upload slots on the server, so
+                // split them between the files instead of queueing the extra chunks
+                chunksInFlight = Math.max(1, Math.floor(perClientUploadSlots / maxConcurrentUploads));
+                
                 // Start uploading files regardless of whether the status fetch succeeded
                 uploadProgressInfo.textContent = `Starting uploads (${maxConcurrentUploads} at a time)...`;
                 
@@ -1392,7 +1591,6 @@ document.addEventListener('DOMContentLoaded', () => {
         // Function to upload a single file
         function uploadFile(index) {
             const file = filesToUpload[index];
-            const formData = new FormData();
             
             // Find the file item in the DOM
             const fileItem = fileList.querySelector(`[data-filename="${file.name}"]`);
@@ -1428,107 +1626,216 @@ document.addEventListener('DOMContentLoaded', () => {
             const displayName = customName || file.name;
             uploadProgressFile.textContent = `Now uploading: ${displayName}`;
             
-            // Append file to formData
-            formData.append('file', file);
-            
-            // Add custom filename if provided
-            if (customName) {
-                formData.append('custom_filename', customName);
-            }
-            
-            // Add description if provided
-            if (fileDescription) {
-                formData.append('description', fileDescription);
-            }
-            
-            // Use XMLHttpRequest for progress monitoring
-            const xhr = new XMLHttpRequest();
-            
-            // Track upload progress for this file
-            xhr.upload.addEventListener('progress', (e) => {
-                if (e.lengthComputable) {
-                    // Calculate progress percentage for this file (0-100)
-                    const thisFileProgress = (e.loaded / e.total) * 100;
-                    fileProgress[index] = thisFileProgress;
-                    
-                    // Calculate total progress across all files
-                    updateTotalProgress();
+            // Send the file as resumable chunks so a dropped connection
+            // only costs the chunk that was in flight
+            uploadFileInChunks(file, customName, fileDescription, (loaded) => {
+                // Calculate progress percentage for this file (0-100)
+                const thisFileProgress = file.size > 0 ? (loaded / file.size) * 100 : 100;
+                fileProgress[index] = thisFileProgress;
+                
+                // Calculate total progress across all files
+                updateTotalProgress();
+                
+                // Update individual file item progress if available
+                if (fileItem) {
+                    updateFileItemProgress(fileItem, thisFileProgress);
+                }
+            })
+                .then(response => {
+                    if (response.duplicate) {
+                        console.log(`Skipped upload of ${file.name}, the FreeBox already has it`);
+                    } else {
+                        console.log(`Uploaded file: ${file.name}`);
+                    }
+                    // Mark this file as complete (100%)
+                    fileProgress[index] = 100;
+                    filesUploaded++;
+                    filesInProgress--;
                     
-                    // Update individual file item progress if available
+                    // Remove uploading indicator and add completed indicator
                     if (fileItem) {
-                        updateFileItemProgress(fileItem, thisFileProgress);
+                        fileItem.classList.remove('uploading');
+                        fileItem.classList.add('upload-complete');
                     }
-                }
-            });
-            
-            // Handle successful upload
-            xhr.onload = function() {
-                if (xhr.status === 200) {
-                    try {
-                        const response = JSON.parse(xhr.responseText);
-                        if (response.success) {
-                            console.log(`Uploaded file: ${file.name}`);
-                            // Mark this file as complete (100%)
-                            fileProgress[index] = 100;
-                            filesUploaded++;
-                            filesInProgress--;
-                            
-                            // Remove uploading indicator and add completed indicator
-                            if (fileItem) {
-                                fileItem.classList.remove('uploading');
-                                fileItem.classList.add('upload-complete');
-                            }
-                            
-                            // Update overall progress
-                            updateTotalProgress();
-                            
-                            // Update status info
-                            uploadProgressInfo.textContent = `${filesUploaded} completed, ${filesInProgress} in progress (of ${filesToUpload.length})`;
-                            
-                            // If all files are uploaded, finish up
-                            if (filesUploaded === filesToUpload.length) {
-                                finishUpload();
-                            } else {
-                                // Otherwise, start a new upload if there are files waiting
-                                startUploads(index + 1);
-                            }
-                        } else {
-                            handleUploadError(`Failed to upload ${file.name}: ${response.error || 'Unknown error'}`);
-                            
-                            // Start the next file
-                            filesInProgress--;
-                            startUploads(index + 1);
-                        }
-                    } catch (error) {
-                        handleUploadError(`Failed to parse response for ${file.name}`);
-                        
-                        // Start the next file
-                        filesInProgress--;
+                    
+                    // Update overall progress
+                    updateTotalProgress();
+                    
+                    // Update status info
+                    uploadProgressInfo.textContent = `${filesUploaded} completed, ${filesInProgress} in progress (of ${filesToUpload.length})`;
+                    
+                    // If all files are uploaded, finish up
+                    if (filesUploaded === filesToUpload.length) {
+                        finishUpload();
+                    } else {
+                        // Otherwise, start a new upload if there are files waiting
                         startUploads(index + 1);
                     }
-                } else {
-                    handleUploadError(`Server returned status ${xhr.status} for ${file.name}`);
+                })
+                .catch(error => {
+                    handleUploadError(`Failed to upload ${file.name}: ${error.message || 'Unknown error'}`);
                     
                     // Start the next file
                     filesInProgress--;
                     startUploads(index + 1);
+                });
+        }
+        
+        // Upload a file through the chunked upload API
+        // Resolves with the finalize response (or the duplicate check response
+        // if the server already has the file), or rejects once a chunk has
+        // failed more than CHUNK_RETRIES times in a row
+        function uploadFileInChunks(file, customName, description, onProgress) {
+            const CHUNK_RETRIES = 5;
+            // Files up to this size are hashed before anything is sent, so a
+            // duplicate costs no transfer; larger ones are hashed while sending
+            const PREFLIGHT_HASH_MAX_SIZE = 16 * 1024 * 1024;
+            const preflightHash = file.size <= PREFLIGHT_HASH_MAX_SIZE;
+            const chunkLoaded = {};
+            
+            function reportProgress() {
+                let loaded = 0;
+                Object.values(chunkLoaded).forEach(bytes => {
+                    loaded += bytes;
+                });
+                onProgress(loaded);
+            }
+            
+            function parseResponse(xhr) {
+                try {
+                    return JSON.parse(xhr.responseText);
+                } catch (error) {
+                    return {};
                 }
-            };
+            }
             
-            // Handle upload error
-            xhr.onerror = function() {
-                handleUploadError(`Network error while uploading ${file.name}`);
-                
-                // Remove the file from progress tracking
-                filesInProgress--;
-                
-                // Try to start next file
-                startUploads(index + 1);
-            };
+            function sendChunk(uploadId, start, end) {
+                return new Promise((resolve, reject) => {
+                    const xhr = new XMLHttpRequest();
+                    
+                    xhr.upload.addEventListener('progress', (e) => {
+                        chunkLoaded[start] = e.loaded;
+                        reportProgress();
+                    });
+                    
+                    xhr.onload = function() {
+                        if (xhr.status === 200) {
+                            chunkLoaded[start] = end - start;
+                            reportProgress();
+                            resolve();
+                        } else {
+                            const response = parseResponse(xhr);
+                            const error = new Error(response.error || `Server returned status ${xhr.status}`);
+                            if (xhr.status === 429) {
+                                // The server is busy with other uploads, wait as long as it asks
+                                error.retryAfter = parseInt(xhr.getResponseHeader('Retry-After'), 10) || 1;
+                            } else if (xhr.status === 507) {
+                                // Retrying cannot help when the disk is full
+                                error.fatal = true;
+                            }
+                            reject(error);
+                        }
+                    };
+                    
+                    xhr.onerror = function() {
+                        reject(new Error('Network error'));
+                    };
+                    
+                    xhr.open('PUT', `/api/uploads/${uploadId}?offset=${start}`, true);
+                    xhr.setRequestHeader('Content-Type', 'application/octet-stream');
+                    xhr.send(file.slice(start, end));
+                });
+            }
+            
+            // Retry a chunk with a growing delay, discarding its partial progress
+            // Waiting for an upload slot does not count as a failed attempt
+            function sendChunkWithRetry(uploadId, start, end, attempt = 0) {
+                return sendChunk(uploadId, start, end).catch(error => {
+                    chunkLoaded[start] = 0;
+                    reportProgress();
+                    
+                    if (error.retryAfter) {
+                        return new Promise(resolve => setTimeout(resolve, 1000 * error.retryAfter))
+                            .then(() => sendChunkWithRetry(uploadId, start, end, attempt));
+                    }
+                    
+                    if (error.fatal || attempt >= CHUNK_RETRIES) {
+                        throw error;
+                    }
+                    
+                    return new Promise(resolve => setTimeout(resolve, 1000 * (attempt + 1)))
+                        .then(() => sendChunkWithRetry(uploadId, start, end, attempt + 1));
+                });
+            }
             
-            // Set up request and send
-            xhr.open('POST', '/api/upload', true);
-            xhr.send(formData);
+            // Hash small files locally first so the server can tell us whether
+            // it already has them before any file data is sent
+            return (preflightHash ? Sha256.hashBlob(file) : Promise.resolve(null))
+                .then(sha256 => fetch('/api/uploads', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({
+                        filename: file.name,
+                        custom_filename: customName,
+                        description: description,
+                        size: file.size,
+                        sha256: sha256
+                    })
+                }))
+                .then(response => response.json())
+                .then(session => {
+                    if (!session.success) {
+                        throw new Error(session.error);
+                    }
+                    
+                    // Already stored on the FreeBox, nothing to transfer
+                    if (session.duplicate) {
+                        onProgress(file.size);
+                        return session;
+                    }
+                    
+                    // Large files are hashed alongside the transfer and the
+                    // server checks the hash when the upload completes
+                    const fileHash = preflightHash ? Promise.resolve(null) : Sha256.hashBlob(file);
+                    
+                    // Queue every chunk, then drain the queue with a few workers
+                    const queue = [];
+                    for (let start = 0; start < file.size; start += session.chunk_size) {
+                        queue.push([start, Math.min(start + session.chunk_size, file.size)]);
+                    }
+                    
+                    function worker() {
+                        const chunk = queue.shift();
+                        if (!chunk) return Promise.resolve();
+                        return sendChunkWithRetry(session.upload_id, chunk[0], chunk[1]).then(worker);
+                    }
+                    
+                    const workers = [];
+                    for (let i = 0; i < chunksInFlight; i++) {
+                        workers.push(worker());
+                    }
+                    
+                    return Promise.all(workers)
+                        .then(() => fileHash)
+                        .then(sha256 => fetch(`/api/uploads/${session.upload_id}/complete`, {
+                            method: 'POST',
+                            headers: { 'Content-Type': 'application/json' },
+                            body: JSON.stringify({ sha256: sha256 })
+                        }))
+                        .then(response => response.json())
+                        .catch(error => {
+                            // Free the server-side session instead of waiting for it to expire
+                            queue.length = 0;
+                            fetch(`/api/uploads/${session.upload_id}`, { method: 'DELETE' }).catch(() => {});
+                            throw error;
+                        });
+                })
+                .then(response => {
+                    if (!response.success) {
+                        throw new Error(response.error);
+                    }
+                    return response;
+                });
         }
         
         // Update visual progress indicator for a file item
@@ -1605,13 +1912,11 @@ document.addEventListener('DOMContentLoaded', () => {
                 // Hide clear queue button
                 clearQueueBtn.style.display = 'none';
                 
-                // Notify all clients via WebSocket
+                // Every client, this one included, already got the new files
+                // as file_added events, so the list is not reloaded
                 if (isConnected) {
                     socket.emit('file_uploaded', {});
                 }
-                
-                // Reload the file list
-                loadFiles();
             }, 1000);
         }
         
@@ -1683,6 +1988,29 @@ document.addEventListener('DOMContentLoaded', () => {
     }
     
     // Update the download count for a specific file in the UI
+    function setFileThumbnail(fileIcon, thumbnailUrl) {
+        const thumbnail = document.createElement('img');
+        thumbnail.className = 'file-thumbnail';
+        thumbnail.src = thumbnailUrl;
+        thumbnail.alt = '';
+        thumbnail.loading = 'lazy';
+        
+        fileIcon.textContent = '';
+        fileIcon.appendChild(thumbnail);
+    }
+    
+    // Swap in a thumbnail for every listed file with the given content
+    function showThumbnail(fileHash, thumbnailUrl) {
+        const rows = fileTableBody.querySelectorAll(`tr[data-file-hash="${fileHash}"]`);
+        
+        for (const row of rows) {
+            const fileIcon = row.querySelector('.file-icon');
+            if (fileIcon && !fileIcon.querySelector('.file-thumbnail')) {
+                setFileThumbnail(fileIcon, thumbnailUrl);
+            }
+        }
+    }
+    
     function updateFileDownloadCount(file) {
         const rows = fileTableBody.querySelectorAll('tr');
         
@@ -1717,6 +2045,154 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
     
+    // File fields compared for each sort option of the file list
+    const FILE_SORT_KEYS = {
+        created_at: 'created_at',
+        size: 'size',
+        name: 'filename',
+        download_count: 'download_count'
+    };
+    
+    // Take a file change event, or catch up first if one was missed
+    function receiveFileChange(change) {
+        if (fetchingFileChanges) {
+            pendingFileChanges.push(change);
+            return;
+        }
+        
+        if (fileListVersion !== null) {
+            if (change.version <= fileListVersion) {
+                // Already part of the list
+                return;
+            }
+            if (change.version > fileListVersion + 1) {
+                // Some changes never arrived
+                fetchFileChanges();
+                return;
+            }
+        }
+        
+        applyFileChange(change);
+    }
+    
+    // Apply the changes after the version shown, or reload the list if the
+    // server no longer has all of them
+    function fetchFileChanges() {
+        if (fetchingFileChanges || fileListVersion === null) {
+            return;
+        }
+        
+        const since = fileListVersion;
+        fetchingFileChanges = true;
+        
+        fetch(`/api/files/changes?since=${since}`)
+            .then(response => {
+                if (response.status === 410) {
+                    return null;
+                }
+                if (!response.ok) {
+                    throw new Error(`Server returned status ${response.status}`);
+                }
+                return response.json();
+            })
+            .then(data => {
+                fetchingFileChanges = false;
+                
+                if (data === null) {
+                    loadFiles();
+                } else if (fileListVersion === since) {
+                    data.changes.forEach(applyFileChange);
+                }
+                
+                // Events that arrived meanwhile may be newer than the changes
+                const pending = pendingFileChanges;
+                pendingFileChanges = [];
+                pending.forEach(receiveFileChange);
+            })
+            .catch(error => {
+                fetchingFileChanges = false;
+                pendingFileChanges = [];
+                console.error('Error loading file changes:', error);
+                loadFiles();
+            });
+    }
+    
+    // Apply one file change to the rows shown
+    function applyFileChange(change) {
+        if (fileListVersion !== null) {
+            fileListVersion = change.version;
+        }
+        
+        const fileId = String(change.type === 'deleted' ? change.id : change.file.id);
+        const row = fileTableBody.querySelector(`tr[data-file-id="${fileId}"]`);
+        
+        if (change.type === 'deleted') {
+            if (row) {
+                removeFileRow(row, fileId);
+            }
+        } else if (change.type === 'updated') {
+            if (row) {
+                if (listedFiles.get(fileId).download_count !== change.file.download_count) {
+                    updateFileDownloadCount(change.file);
+                }
+                listedFiles.set(fileId, change.file);
+            }
+        } else if (row) {
+            listedFiles.set(fileId, change.file);
+            row.replaceWith(createFileRow(change.file));
+        } else if (fileListVersion !== null) {
+            insertFileRow(change.file);
+        }
+    }
+    
+    // Insert a new file where it sorts, if that is in the part of the list shown
+    function insertFileRow(file) {
+        if (fileTypeFilter.value && !(file.mime_type || '').startsWith(fileTypeFilter.value)) {
+            return;
+        }
+        
+        const [sort, order] = fileSortSelect.value.split(':');
+        const key = FILE_SORT_KEYS[sort] || 'created_at';
+        const direction = order === 'asc' ? 1 : -1;
+        
+        // Ties are broken by id in the same direction, as on the server
+        const comesBefore = (other) => {
+            if (file[key] !== other[key]) {
+                return (file[key] < other[key] ? -1 : 1) * direction < 0;
+            }
+            return (file.id - other.id) * direction < 0;
+        };
+        
+        const nextRow = Array.from(fileTableBody.rows).find(row => {
+            const other = listedFiles.get(row.dataset.fileId);
+            return other && comesBefore(other);
+        });
+        
+        if (nextRow) {
+            listedFiles.set(String(file.id), file);
+            fileListCount++;
+            fileTableBody.insertBefore(createFileRow(file), nextRow);
+            updateFileCount();
+        } else if (!fileListCursor) {
+            displayFiles([file], true);
+        }
+        // Otherwise it belongs on a page that has not been loaded yet
+    }
+    
+    // Remove a deleted file from the list and the selection
+    function removeFileRow(row, fileId) {
+        row.remove();
+        listedFiles.delete(fileId);
+        fileListCount--;
+        
+        if (selectedFiles.some(f => f.id === fileId)) {
+            selectedFiles = selectedFiles.filter(f => f.id !== fileId);
+            updateMultiActionBar();
+        }
+        
+        updateFileCount();
+    }
+    
     // Generate a random username
     function generateRandomUsername() {
         const adjectives = [
@@ -1801,6 +2277,9 @@ document.addEventListener('DOMContentLoaded', () => {
         viewerImage.src = '';
         viewerVideo.src = '';
         viewerText.textContent = '';
+        viewerText.removeAttribute('data-highlighted');
+        viewerText.className = '';
+        textPreview = null;
         
         // Determine file type and show appropriate viewer
         const fileExtension = getFileExtension(file.filename).toLowerCase();
@@ -1821,7 +2300,7 @@ document.addEventListener('DOMContentLoaded', () => {
             viewerVideo.src = `/api/download/${file.id}?preview=true`;
             
             // Set poster image if available (thumbnail)
-            viewerVideo.poster = '/img/video-poster.png';
+            viewerVideo.poster = file.thumbnail_url || '';
             
             // Add metadata
             viewerVideo.title = file.filename;
@@ -1833,20 +2312,9 @@ document.addEventListener('DOMContentLoaded', () => {
             // Show text viewer
             textViewer.style.display = 'flex';
             
-            // Load the text content
-            fetch(`/api/download/${file.id}?preview=true`)
-                .then(response => response.text())
-                .then(text => {
-                    viewerText.textContent = text;
-                    
-                    // Apply syntax highlighting if available
-                    if (typeof hljs !== 'undefined') {
-                        hljs.highlightElement(viewerText);
-                    }
-                })
-                .catch(error => {
-                    viewerText.textContent = `Error loading file: ${error.message}`;
-                });
+            // Load the first page, further pages load as the viewer scrolls
+            textPreview = { fileId: file.id, nextOffset: 0, loading: false, eof: false };
+            loadTextPage();
         }
         else {
             // Show unsupported file type message
@@ -1857,6 +2325,56 @@ document.addEventListener('DOMContentLoaded', () => {
         fileViewerModal.style.display = 'block';
     }
     
+    // Fetch the next page of the text file shown in the viewer
+    function loadTextPage() {
+        const state = textPreview;
+        if (!state || state.loading || state.eof) return;
+        state.loading = true;
+        
+        fetch(`/api/files/${state.fileId}/text?offset=${state.nextOffset}`)
+            .then(response => response.json())
+            .then(page => {
+                // Ignore pages for a file that is no longer shown
+                if (state !== textPreview) return;
+                if (!page.success) {
+                    throw new Error(page.error || 'Unknown error');
+                }
+                
+                const isFirstPage = state.nextOffset === 0;
+                state.nextOffset = page.next_offset;
+                state.eof = page.eof;
+                state.loading = false;
+                
+                if (isFirstPage && page.eof) {
+                    // The whole file fits in one page, so it can be highlighted
+                    viewerText.textContent = page.text;
+                    if (typeof hljs !== 'undefined') {
+                        hljs.highlightElement(viewerText);
+                    }
+                } else {
+                    viewerText.appendChild(document.createTextNode(page.text));
+                }
+                
+                // Keep loading until the viewer can scroll
+                if (viewerText.scrollHeight <= viewerText.clientHeight) {
+                    loadTextPage();
+                }
+            })
+            .catch(error => {
+                if (state !== textPreview) return;
+                state.loading = false;
+                state.eof = true;
+                viewerText.appendChild(document.createTextNode(`\nError loading file: ${error.message}`));
+            });
+    }
+    
+    // Load more text when the viewer is scrolled near the bottom
+    viewerText.addEventListener('scroll', () => {
+        if (viewerText.scrollTop + viewerText.clientHeight >= viewerText.scrollHeight - 200) {
+            loadTextPage();
+        }
+    });
+    
     // Get file extension (including the dot)
     function getFileExtension(filename) {
         const lastDotIndex = filename.lastIndexOf('.');
@@ -0,0 +1,142 @@
+/**
+ * FreeBox SHA-256
+ * Incremental SHA-256 used to hash files in the browser before uploading.
+ * crypto.subtle is only available on secure origins and cannot hash a file
+ * in pieces, while FreeBox is served over plain HTTP and files can be large.
+ */
+
+const Sha256 = (() => {
+    const K = new Uint32Array([
+        0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+        0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+        0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+        0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+        0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+        0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+        0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+        0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
+    ]);
+
+    class Sha256 {
+        constructor() {
+            this.state = new Uint32Array([
+                0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a,
+                0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19
+            ]);
+            this.buffer = new Uint8Array(64);
+            this.bufferLength = 0;
+            this.bytesHashed = 0;
+            this.w = new Uint32Array(64);
+        }
+
+        // Hash the next piece of data (a Uint8Array)
+        update(data) {
+            let position = 0;
+            this.bytesHashed += data.length;
+
+            // Top up a partially filled block first
+            if (this.bufferLength > 0) {
+                const take = Math.min(64 - this.bufferLength, data.length);
+                this.buffer.set(data.subarray(0, take), this.bufferLength);
+                this.bufferLength += take;
+                position = take;
+                if (this.bufferLength < 64) return this;
+                this.processBlock(this.buffer, 0);
+                this.bufferLength = 0;
+            }
+
+            // Then hash whole blocks straight from the input
+            while (position + 64 <= data.length) {
+                this.processBlock(data, position);
+                position += 64;
+            }
+
+            this.buffer.set(data.subarray(position), 0);
+            this.bufferLength = data.length - position;
+            return this;
+        }
+
+        // Finish hashing and return the digest as a hex string
+        hexDigest() {
+            const bitLength = this.bytesHashed * 8;
+            const padding = new Uint8Array(this.bufferLength < 56 ? 64 - this.bufferLength : 128 - this.bufferLength);
+            padding[0] = 0x80;
+
+            // Message length in bits as a 64-bit big-endian integer
+            const view = new DataView(padding.buffer);
+            view.setUint32(padding.length - 8, Math.floor(bitLength / 0x100000000));
+            view.setUint32(padding.length - 4, bitLength >>> 0);
+
+            this.update(padding);
+
+            return Array.from(this.state, word => word.toString(16).padStart(8, '0')).join('');
+        }
+
+        processBlock(data, offset) {
+            const w = this.w;
+            const state = this.state;
+
+            for (let i = 0; i < 16; i++) {
+                const j = offset + i * 4;
+                w[i] = (data[j] << 24) | (data[j + 1] << 16) | (data[j + 2] << 8) | data[j + 3];
+            }
+            for (let i = 16; i < 64; i++) {
+                const w15 = w[i - 15];
+                const w2 = w[i - 2];
+                const s0 = ((w15 >>> 7) | (w15 << 25)) ^ ((w15 >>> 18) | (w15 << 14)) ^ (w15 >>> 3);
+                const s1 = ((w2 >>> 17) | (w2 << 15)) ^ ((w2 >>> 19) | (w2 << 13)) ^ (w2 >>> 10);
+                w[i] = (w[i - 16] + s0 + w[i - 7] + s1) | 0;
+            }
+
+            let a = state[0], b = state[1], c = state[2], d = state[3];
+            let e = state[4], f = state[5], g = state[6], h = state[7];
+
+            for (let i = 0; i < 64; i++) {
+                const S1 = ((e >>> 6) | (e << 26)) ^ ((e >>> 11) | (e << 21)) ^ ((e >>> 25) | (e << 7));
+                const ch = (e & f) ^ (~e & g);
+                const t1 = (h + S1 + ch + K[i] + w[i]) | 0;
+                const S0 = ((a >>> 2) | (a << 30)) ^ ((a >>> 13) | (a << 19)) ^ ((a >>> 22) | (a << 10));
+                const maj = (a & b) ^ (a & c) ^ (b & c);
+                const t2 = (S0 + maj) | 0;
+
+                h = g;
+                g = f;
+                f = e;
+                e = (d + t1) | 0;
+                d = c;
+                c = b;
+                b = a;
+                a = (t1 + t2) | 0;
+            }
+
+            state[0] += a;
+            state[1] += b;
+            state[2] += c;
+            state[3] += d;
+            state[4] += e;
+            state[5] += f;
+            state[6] += g;
+            state[7] += h;
+        }
+    }
+
+    // Hash a File or Blob a slice at a time, without loading it into memory
+    Sha256.hashBlob = function(blob, sliceSize = 4 * 1024 * 1024) {
+        const hasher = new Sha256();
+
+        function hashFrom(start) {
+            if (start >= blob.size) {
+                return Promise.resolve(hasher.hexDigest());
+            }
+            const end = Math.min(start + sliceSize, blob.size);
+            return blob.slice(start, end).arrayBuffer().then(buffer => {
+                hasher.update(new Uint8Array(buffer));
+                return hashFrom(end);
+            });
+        }
+
+        return hashFrom(0);
+    };
+
+    return Sha256;
+})();
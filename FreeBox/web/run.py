@@ -10,6 +10,7 @@ import eventlet
 eventlet.monkey_patch()
 
 from backend.app import create_app, socketio
+from backend.sendfile import SendfileHttpProtocol
 
 if __name__ == "__main__":
     # Create the application instance
@@ -23,7 +24,8 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=80,  # Standard HTTP port
         debug=False,  # Disable debug mode in production
-        use_reloader=False  # Disable reloader for production
+        use_reloader=False,  # Disable reloader for production
+        protocol=SendfileHttpProtocol  # Lets downloads use zero-copy sendfile
     ) 
     print("Starting FreeBox web interface...")
     print("The FreeBox web interface will be available at http://192.168.1.1")